@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from asyncio_throttle import Throttler
+
+
+class AimdLimit:
+    """AIMD подстройка лимита одновременных запросов: +1 при стабильной работе, x0.5 при 429/503 или скачке задержки.
+
+    Задержка - время до первого байта (заголовков или первого токена потока), а не всего ответа:
+    длина генерации зависит от запроса, а не от загрузки провайдера.
+    """
+
+    # Статусы перегрузки провайдера
+    OVERLOAD_STATUSES = frozenset({429, 503})
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 16, decrease_factor: float = 0.5,
+                 latency_spike: float = 3.0, ewma_alpha: float = 0.2, cooldown: float = 2.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_spike = latency_spike
+        self.ewma_alpha = ewma_alpha
+        self.cooldown = cooldown
+
+        self.latency_ewma = None
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    def adjust(self, limit: int, status: Optional[int], latency: float, timed_out: bool = False) -> int:
+        """Новый лимит по исходу одного запроса"""
+        spike = (status == 200 and self.latency_ewma is not None
+                 and latency > self.latency_spike * self.latency_ewma)
+
+        if timed_out or status in self.OVERLOAD_STATUSES or spike:
+            # Один всплеск ошибок от пачки одновременных запросов - одно снижение
+            now = time.monotonic()
+            if now - self.last_decrease < self.cooldown:
+                return limit
+            self.last_decrease = now
+            self.successes = 0
+            self.decreases += 1
+            return max(self.min_limit, int(limit * self.decrease_factor))
+
+        if status != 200:
+            return limit
+
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency_ewma
+
+        # Прибавляем 1, когда успешно прошло "окно" запросов размером с текущий лимит
+        self.successes += 1
+        if self.successes >= limit and limit < self.max_limit:
+            self.successes = 0
+            self.increases += 1
+            return limit + 1
+        return limit
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика подстройки"""
+        return {
+            'latency_ewma': self.latency_ewma,
+            'increases': self.increases,
+            'decreases': self.decreases
+        }
+
+
+class AdmissionTicket:
+    """Допущенный запрос: вызывающий код сообщает сюда HTTP статус (respond) и первый токен потока"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.timed_out = False
+        # Запрос отменили мы сами (проигравший хедж) - о провайдере он ничего не говорит
+        self.cancelled = False
+        # Время первого байта ответа - по нему подстраивается лимит
+        self.first_byte_at: Optional[float] = None
+
+    def respond(self, status: int) -> None:
+        """Получены заголовки ответа"""
+        self.status = status
+        if self.first_byte_at is None:
+            self.first_byte_at = time.monotonic()
+
+    def first_token(self) -> None:
+        """Получен первый токен потока - для потоковых ответов он точнее заголовков"""
+        self.first_byte_at = time.monotonic()
+
+
+class AdmissionGate:
+    """Допуск запросов к одному провайдеру/модели: лимит одновременных запросов и запросов в секунду"""
+
+    def __init__(self, name: str, max_in_flight: int, rate_limit: Optional[float] = None,
+                 aimd: AimdLimit = None):
+        self.name = name
+        self.limit = max_in_flight
+        self.aimd = aimd
+        self.in_flight = 0
+        self.waiting = 0
+        self.condition = asyncio.Condition()
+
+        # Не больше rate_limit отправок за любую секунду (скользящее окно asyncio-throttle)
+        self.throttler = Throttler(rate_limit=rate_limit, period=1.0) if rate_limit else None
+
+        self.admitted = 0
+        self.cancelled = 0
+        self.queued = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Место для одного запроса; ждем, пока освободится слот и позволит скорость"""
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.in_flight < self.limit)
+                self.in_flight += 1
+        finally:
+            self.waiting -= 1
+
+        ticket = AdmissionTicket()
+        try:
+            if self.throttler:
+                await self.throttler.acquire()
+            admitted_at = time.monotonic()
+            self._record_queue_time(admitted_at - started)
+            try:
+                yield ticket
+            except asyncio.TimeoutError:
+                ticket.timed_out = True
+                raise
+            except asyncio.CancelledError:
+                ticket.cancelled = True
+                self.cancelled += 1
+                raise
+        finally:
+            async with self.condition:
+                self.in_flight -= 1
+                if self.aimd and not ticket.cancelled and (ticket.status is not None or ticket.timed_out):
+                    first_byte_at = ticket.first_byte_at or time.monotonic()
+                    self.limit = self.aimd.adjust(self.limit, ticket.status,
+                                                  first_byte_at - admitted_at, ticket.timed_out)
+                self.condition.notify_all()
+
+    def _record_queue_time(self, queue_time: float) -> None:
+        """Учет времени ожидания в очереди"""
+        self.admitted += 1
+        if queue_time > 0.001:
+            self.queued += 1
+        self.queue_time_total += queue_time
+        self.queue_time_max = max(self.queue_time_max, queue_time)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика допуска"""
+        stats = {
+            'limit': self.limit,
+            'rate_limit': self.throttler.rate_limit if self.throttler else None,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'cancelled': self.cancelled,
+            'queued': self.queued,
+            'avg_queue_time': self.queue_time_total / self.admitted if self.admitted else 0.0,
+            'max_queue_time': self.queue_time_max
+        }
+        if self.aimd:
+            stats['aimd'] = self.aimd.get_stats()
+        return stats
+
+
+class AdmissionControl:
+    """Формирование трафика к провайдеру: общий лимит провайдера плюс лимит каждой модели.
+
+    Настройки из окружения по имени провайдера, например для openrouter:
+    OPENROUTER_MAX_IN_FLIGHT, OPENROUTER_RPS, OPENROUTER_MODEL_MAX_IN_FLIGHT, OPENROUTER_MODEL_RPS.
+    Лимит модели подстраивается (AIMD) в пределах 1..OPENROUTER_MODEL_LIMIT_MAX,
+    OPENROUTER_ADAPTIVE=false отключает подстройку.
+    """
+
+    def __init__(self, provider: str, max_in_flight: int = None, rate_limit: float = None,
+                 model_max_in_flight: int = None, model_rate_limit: float = None,
+                 adaptive: bool = None, model_limit_max: int = None):
+        prefix = provider.upper()
+        self.provider = provider
+        self.model_max_in_flight = model_max_in_flight or int(os.getenv(f'{prefix}_MODEL_MAX_IN_FLIGHT', 4))
+        self.model_rate_limit = model_rate_limit or float(os.getenv(f'{prefix}_MODEL_RPS', 2))
+        if adaptive is None:
+            adaptive = os.getenv(f'{prefix}_ADAPTIVE', 'true').lower() == 'true'
+        self.adaptive = adaptive
+        self.model_limit_max = model_limit_max or int(os.getenv(f'{prefix}_MODEL_LIMIT_MAX', 16))
+
+        self.provider_gate = AdmissionGate(
+            provider,
+            max_in_flight or int(os.getenv(f'{prefix}_MAX_IN_FLIGHT', 8)),
+            rate_limit or float(os.getenv(f'{prefix}_RPS', 5))
+        )
+        self.model_gates: Dict[str, AdmissionGate] = {}
+
+    def model_gate(self, model: str) -> AdmissionGate:
+        """Получение (или создание) ограничителя модели"""
+        if model not in self.model_gates:
+            aimd = AimdLimit(max_limit=self.model_limit_max) if self.adaptive else None
+            self.model_gates[model] = AdmissionGate(model, self.model_max_in_flight, self.model_rate_limit, aimd)
+        return self.model_gates[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        """Допуск запроса к модели: сначала лимит модели, затем общий лимит провайдера.
+
+        Отдает AdmissionTicket - в него нужно записать статус ответа для подстройки лимита.
+        """
+        async with self.model_gate(model).slot() as ticket:
+            async with self.provider_gate.slot():
+                yield ticket
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика по провайдеру и моделям"""
+        return {
+            'provider': self.provider_gate.get_stats(),
+            'models': {model: gate.get_stats() for model, gate in self.model_gates.items()}
+        }
+
+
+def format_admission(admission_stats: Dict[str, Any]) -> str:
+    """Текущие лимиты одновременных запросов по моделям для /stats (подстраиваются по 429/503 и задержке)"""
+    models = admission_stats['models']
+    if not models:
+        return "• запросов еще не было"
+    return "\n".join(
+        f"• {model}: лимит {gate['limit']}, в работе {gate['in_flight']}, в очереди {gate['waiting']}, "
+        f"ожидание {gate['avg_queue_time']:.1f}с"
+        for model, gate in models.items()
+    )
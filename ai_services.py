@@ -1,48 +1,100 @@
 import openai
 import requests
 from PIL import Image
-import io
 import base64
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-from diffusers import StableDiffusionPipeline
-import torch
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from config import OPENAI_API_KEY, HUGGINGFACE_TOKEN, GPT_MODEL, DALLE_MODEL, IMAGE_MODEL
+from free_ai_services import FreeAIServices
+from local_inference import LocalTextPool
+from local_images import LocalImageGenerator
+from context_builder import as_message
 
 class AIServices:
-    def __init__(self):
+    def __init__(self, remote: FreeAIServices = None):
         # Инициализация OpenAI
         if OPENAI_API_KEY:
             openai.api_key = OPENAI_API_KEY
         
-        # Инициализация Hugging Face моделей
-        self.text_generator = None
-        self.image_generator = None
-        self._init_huggingface_models()
+        # Локальные модели Hugging Face грузятся лениво: torch/transformers/diffusers
+        # импортируются только при загрузке, а до готовности запросы идут в удаленные сервисы
+        self.text_pool = LocalTextPool("microsoft/DialoGPT-medium", HUGGINGFACE_TOKEN)
+        self.image_generator = LocalImageGenerator(IMAGE_MODEL, HUGGINGFACE_TOKEN)
+        self.text_ready = False
+        self.image_ready = False
+        self.remote = remote or FreeAIServices()
     
-    def _init_huggingface_models(self):
-        """Инициализация моделей Hugging Face"""
+        # Загрузка в отдельном потоке - цикл событий бота не блокируется
+        self.preload = os.getenv('LOCAL_MODELS_PRELOAD', 'true').lower() == 'true'
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
+        self._load_tasks = {}
+
+        # Замеры старта: когда создан сервис и через сколько секунд готова каждая модель
+        self.created_at = time.monotonic()
+        self.timings = {}
+
+    async def start(self):
+        """Запуск при старте бота: удаленные сервисы сразу, локальные модели - в фоне"""
+        await self.remote.start()
+        if self.preload:
+            self._schedule_load('text')
+            self._schedule_load('image')
+
+    async def close(self):
+        """Остановка при выключении бота"""
+        for task in self._load_tasks.values():
+            task.cancel()
+        self._loader.shutdown(wait=False, cancel_futures=True)
+        self.text_pool.close()
+        self.image_generator.close()
+        await self.remote.close()
+
+    def _schedule_load(self, kind: str):
+        """Фоновая загрузка модели (повторный вызов ничего не делает)"""
+        if kind in self._load_tasks:
+            return
+        loader = self._load_text_model if kind == 'text' else self._load_image_model
+        self._load_tasks[kind] = asyncio.create_task(self._load_in_background(kind, loader))
+
+    async def _load_in_background(self, kind: str, loader):
+        """Загрузка модели в потоке-загрузчике с замером времени"""
+        started = time.monotonic()
         try:
-            # Текстовая модель для генерации кода и решения задач
-            self.text_generator = pipeline(
-                "text-generation",
-                model="microsoft/DialoGPT-medium",
-                token=HUGGINGFACE_TOKEN
-            )
-            
-            # Модель для генерации изображений
-            if torch.cuda.is_available():
-                self.image_generator = StableDiffusionPipeline.from_pretrained(
-                    IMAGE_MODEL,
-                    torch_dtype=torch.float16,
-                    use_auth_token=HUGGINGFACE_TOKEN
-                ).to("cuda")
-            else:
-                self.image_generator = StableDiffusionPipeline.from_pretrained(
-                    IMAGE_MODEL,
-                    use_auth_token=HUGGINGFACE_TOKEN
-                )
+            await asyncio.get_running_loop().run_in_executor(self._loader, loader)
         except Exception as e:
-            print(f"Ошибка инициализации Hugging Face моделей: {e}")
+            print(f"Ошибка загрузки локальной модели ({kind}): {e}")
+            return
+        self.timings[f'{kind}_load_seconds'] = time.monotonic() - started
+        self.timings[f'{kind}_ready_after_start'] = time.monotonic() - self.created_at
+        print(f"✅ Локальная модель ({kind}) готова за {self.timings[f'{kind}_load_seconds']:.1f} с")
+            
+    def load_models(self):
+        """Синхронная загрузка всех моделей сразу (старое поведение, для замеров и скриптов)"""
+        self._load_text_model()
+        self._load_image_model()
+
+    def _load_text_model(self):
+        """Текстовая модель для генерации кода и решения задач: грузится в каждом воркере пула"""
+        self.text_pool.start()
+        self.text_ready = True
+
+    def _load_image_model(self):
+        """Модель для генерации изображений (пресеты под CPU - в LocalImageGenerator)"""
+        self.image_generator.load()
+        self.image_ready = True
+
+    def get_status(self):
+        """Готовность локальных моделей и замеры старта"""
+        return {
+            'text_ready': self.text_ready,
+            'image_ready': self.image_ready,
+            'loading': [kind for kind, task in self._load_tasks.items() if not task.done()],
+            'text_pool': self.text_pool.get_stats(),
+            'image_generator': self.image_generator.get_stats(),
+            **self.timings
+        }
     
     async def generate_text_response(self, prompt, max_length=500):
         """Генерация текстового ответа"""
@@ -59,17 +111,20 @@ class AIServices:
                     temperature=0.7
                 )
                 return response.choices[0].message.content
-            elif self.text_generator:
-                # Используем Hugging Face модель
-                response = self.text_generator(
-                    prompt,
-                    max_length=max_length,
-                    num_return_sequences=1,
-                    temperature=0.7
-                )
-                return response[0]['generated_text']
+
+            if self.text_ready:
+                # Используем Hugging Face модель в пуле процессов
+                result = await self.text_pool.generate(prompt, max_length=max_length)
+                if result.ok:
+                    return result.content
+                # Пул перегружен или упал - отвечаем через удаленные сервисы
+                print(f"Локальная генерация недоступна: {result.error_message}")
             else:
-                return "Извините, сервис генерации текста временно недоступен."
+                # Локальная модель еще не готова - начинаем загрузку и отвечаем через удаленные сервисы
+                self._schedule_load('text')
+
+            result = await self.remote.generate_text_response(prompt, max_length=max_length)
+            return result.text
         except Exception as e:
             return f"Ошибка генерации ответа: {str(e)}"
     
@@ -88,8 +143,12 @@ class AIServices:
         prompt = f"Найди информацию по запросу: {query}. Предоставь краткий, но информативный ответ."
         return await self.generate_text_response(prompt, max_length=600)
     
-    async def generate_image(self, prompt):
-        """Генерация изображения по текстовому описанию"""
+    async def generate_image(self, prompt, on_preview=None):
+        """Генерация изображения по текстовому описанию.
+
+        on_preview(bytes) - корутина, которой локальная модель сразу отдает быстрое превью
+        (например, отправка в Telegram), пока дорабатывается полное изображение.
+        """
         try:
             if OPENAI_API_KEY:
                 # Используем OpenAI DALL-E
@@ -105,17 +164,13 @@ class AIServices:
                 img_response.raise_for_status()
                 return img_response.content
                 
-            elif self.image_generator:
-                # Используем Hugging Face Stable Diffusion
-                image = self.image_generator(prompt).images[0]
-                
-                # Конвертируем в байты
-                img_byte_arr = io.BytesIO()
-                image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-                return img_byte_arr
+            elif self.image_ready:
+                # Используем Hugging Face Stable Diffusion в отдельном потоке
+                return await self.image_generator.generate(prompt, on_preview=on_preview)
             else:
-                return None
+                # Локальная модель еще не готова - удаленные сервисы
+                self._schedule_load('image')
+                return await self.remote.generate_image(prompt)
         except Exception as e:
             print(f"Ошибка генерации изображения: {e}")
             return None
@@ -124,7 +179,10 @@ class AIServices:
         """Обработка общего чата"""
         if conversation_history:
             # Добавляем контекст предыдущих сообщений
-            context = "\n".join([f"Пользователь: {msg}" for msg in conversation_history[-3:]])
+            context = "\n".join([
+                f"{'Ассистент' if msg['role'] == 'assistant' else 'Пользователь'}: {msg['content']}"
+                for msg in map(as_message, conversation_history[-3:])
+            ])
             prompt = f"{context}\nПользователь: {message}\nАссистент:"
         else:
             prompt = f"Пользователь: {message}\nАссистент:"
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Сравнение размера контекста чата: старые 5 шаблонных запросов подряд против сборки в бюджет токенов
+
+  python bench_context.py           # оценка токенов без запросов
+  python bench_context.py --api     # плюс реальные prompt_tokens из usage OpenRouter (нужен OPENROUTER_API_KEY)
+"""
+import asyncio
+import sys
+
+from context_builder import ContextBuilder, CHAT_SYSTEM_PROMPT, estimate_tokens
+from openrouter_services import OpenRouterServices
+
+DIALOG = [
+    ("Привет! Посоветуй, с чего начать изучение Python?", "Начни с официального туториала и решай задачи на каждый раздел."),
+    ("А какие книги лучше?", "Для старта - «Изучаем Python» Марка Лутца и «Python. К вершинам мастерства»."),
+    ("Сколько времени уйдет на основы?", "При часе в день - около двух месяцев на синтаксис и стандартную библиотеку."),
+    ("Что потом: Django или FastAPI?", "Для API - FastAPI, для сайта с админкой - Django."),
+    ("А асинхронность сложно понять?", "Сначала разберись с async/await и циклом событий на простых примерах."),
+]
+MESSAGE = "Дай план на первую неделю."
+
+
+def legacy_prompt(message: str) -> str:
+    """Так выглядела запись истории раньше: полный запрос с шаблоном подсказки"""
+    return f"""Ответь на следующее сообщение: {message}
+
+Требования к ответу:
+1. Полезный и информативный ответ
+2. Если это вопрос - дай развернутый ответ
+3. Если это просьба - выполни её
+4. Если это шутка - поддержи юмор
+5. Будь дружелюбным и полезным
+
+Дай качественный, полезный ответ."""
+
+
+def count(messages: list) -> int:
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+async def main(use_api: bool):
+    # Раньше: последние 5 записей - шаблонные запросы пользователя, ответов ассистента нет
+    before = [{"role": "user", "content": legacy_prompt(question)} for question, _ in DIALOG][-5:]
+    before.append({"role": "user", "content": MESSAGE})
+
+    # Теперь: шаблон один раз, реплики обеих сторон без шаблона
+    history = []
+    for question, answer in DIALOG:
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    after = ContextBuilder().build(MESSAGE, history, system_prompt=CHAT_SYSTEM_PROMPT)
+
+    print(f"📏 Оценка: было {count(before)} токенов ({len(before)} сообщений), "
+          f"стало {count(after)} ({len(after)} сообщений, с ответами ассистента)")
+
+    if not use_api:
+        return
+
+    services = OpenRouterServices()
+    await services.start()
+    try:
+        payload = {
+            "model": services.available_models['deepseek'],
+            "messages": before,
+            "max_tokens": 1,
+            "temperature": 0.7
+        }
+        old = await services._post_completion(payload)
+        new = await services.chat_response(MESSAGE, history)
+        print(f"🧾 usage.prompt_tokens: было {old.usage.get('prompt_tokens', old.error_message)}, "
+              f"стало {new.usage.get('prompt_tokens', new.error_message)}")
+    finally:
+        await services.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(use_api='--api' in sys.argv))
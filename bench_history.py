@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Бенчмарк истории диалогов с холодным уровнем SQLite: задержка чтения из памяти и с диска, усиление записи
+
+  python bench_history.py [пользователей] [раундов]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from history_sqlite import SqliteColdTier
+from history_store import HistoryStore
+
+
+def percentiles(timings: list) -> str:
+    timings = sorted(timings)
+    return (f"p50 {timings[len(timings) // 2] * 1e6:.0f} мкс, "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} мкс")
+
+
+async def timed_gets(store: HistoryStore, user_ids: list) -> list:
+    timings = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        await store.get(user_id)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def main(users: int, rounds: int):
+    rng = random.Random(42)
+    path = os.path.join(tempfile.mkdtemp(), 'history.db')
+    store = HistoryStore(max_turns=10, cold_tier=SqliteColdTier(path))
+    await store.start()
+
+    # Раунды: каждый пользователь пишет 2 сообщения и замолкает - его выгружают на диск
+    print(f"🔧 {users} пользователей, {rounds} раундов по 2 сообщения")
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for user_id in range(users):
+            for _ in range(2):
+                await store.append(user_id, "x" * rng.randint(100, 600))
+        store.spill_after = 1e-9
+        store.spill_idle()
+        await store.cold.flush()
+    print(f"✅ Раунды (запись + подгрузка с диска): {time.perf_counter() - started:.1f} с")
+
+    sample = rng.sample(range(users), min(users, 2000))
+
+    # С диска: пользователи выгружены, get подгружает их из SQLite
+    cold_timings = await timed_gets(store, sample)
+    # Из памяти: те же пользователи уже подгружены
+    hot_timings = await timed_gets(store, sample)
+
+    stats = store.get_stats()
+    db_bytes = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+    print(f"🔥 Из памяти: {percentiles(hot_timings)}")
+    print(f"🧊 С диска:   {percentiles(cold_timings)}")
+    print(f"✍️ Усиление записи: {stats['write_amplification']:.2f}x записано в базу к добавленному в историю "
+          f"({stats['cold']['batches']} транзакций, {stats['cold']['rows_written']} строк), "
+          f"файлы базы - {db_bytes / max(store.appended_bytes, 1):.2f}x")
+
+    await store.close()
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(users, rounds))
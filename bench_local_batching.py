@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Бенчмарк склейки запросов к локальной DialoGPT на CPU: пропускная способность от размера пачки
+
+  python bench_local_batching.py [запросов] [размеры пачек через запятую]
+  python bench_local_batching.py 64 1,2,4,8,16
+"""
+import asyncio
+import sys
+import time
+
+from config import HUGGINGFACE_TOKEN
+from local_inference import LocalTextPool
+
+PROMPTS = [
+    "Пользователь: Привет! Как дела?\nАссистент:",
+    "Пользователь: Что такое рекурсия?\nАссистент:",
+    "Пользователь: Посоветуй книгу по Python\nАссистент:",
+    "Пользователь: Как отсортировать список?\nАссистент:",
+]
+
+
+async def run(pool: LocalTextPool, requests: int, max_length: int) -> float:
+    """Все запросы разом; возвращает запросов в секунду"""
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        pool.generate(PROMPTS[i % len(PROMPTS)], max_length=max_length) for i in range(requests)
+    ])
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results if not result.ok)
+    if failed:
+        print(f"⚠️ Ошибок: {failed}")
+    return requests / elapsed
+
+
+async def main(requests: int, batch_sizes: list, max_length: int = 60):
+    print(f"🔧 {requests} запросов, max_length={max_length}, 1 воркер")
+    for batch_size in batch_sizes:
+        # Очередь вмещает все запросы - меряем модель, а не отказы
+        pool = LocalTextPool("microsoft/DialoGPT-medium", HUGGINGFACE_TOKEN, workers=1,
+                             queue_size=requests, max_batch=batch_size)
+        await asyncio.get_running_loop().run_in_executor(None, pool.start)
+
+        await run(pool, batch_size, max_length)  # Прогрев
+        throughput = await run(pool, requests, max_length)
+        stats = pool.get_stats()
+        print(f"📦 пачка {batch_size:>2}: {throughput:6.2f} запросов/с "
+              f"(средняя пачка {stats['avg_batch_size']:.1f})")
+        pool.close()
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    batch_sizes = [int(size) for size in sys.argv[2].split(',')] if len(sys.argv) > 2 else [1, 2, 4, 8, 16]
+    asyncio.run(main(requests, batch_sizes))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Бенчмарк локального Stable Diffusion на CPU: секунды на изображение и пиковая память по пресетам
+
+  python bench_local_images.py               # все пресеты + превью с доработкой, каждый в отдельном процессе
+  python bench_local_images.py --preset fast # один пресет в текущем процессе
+"""
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from config import HUGGINGFACE_TOKEN, IMAGE_MODEL
+from local_images import IMAGE_PRESETS, LocalImageGenerator
+
+PROMPT = "a cat in a hat, digital art"
+RUNS = 3
+
+
+async def measure(preset: str) -> dict:
+    """Замер одного пресета: 'preview+fast' - превью и доработка до fast"""
+    generator = LocalImageGenerator(IMAGE_MODEL, HUGGINGFACE_TOKEN)
+
+    started = time.perf_counter()
+    generator.load()
+    load_time = time.perf_counter() - started
+
+    async def on_preview(image: bytes):
+        preview_times.append(time.perf_counter() - run_started)
+
+    preview_times = []
+    timings = []
+    for _ in range(RUNS):
+        run_started = time.perf_counter()
+        if preset.startswith('preview+'):
+            await generator.generate(PROMPT, preset=preset.split('+')[1], on_preview=on_preview)
+        else:
+            await generator.generate(PROMPT, preset=preset)
+        timings.append(time.perf_counter() - run_started)
+    generator.close()
+
+    # ru_maxrss в Linux - килобайты
+    return {
+        'preset': preset,
+        'load_seconds': load_time,
+        'seconds_per_image': sum(timings) / len(timings),
+        'seconds_to_preview': sum(preview_times) / len(preview_times) if preview_times else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    presets = list(IMAGE_PRESETS) + ['preview+fast']
+    print(f"🔧 {IMAGE_MODEL}, {RUNS} изображения на пресет")
+    for preset in presets:
+        # Отдельный процесс: пиковая память одного пресета не смешивается с другими
+        output = subprocess.run(
+            [sys.executable, __file__, '--preset', preset], capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        line = (f"🖼 {preset:<13} {result['seconds_per_image']:6.1f} с/изобр., "
+                f"пик RSS {result['peak_rss_mb']:.0f} МБ")
+        if result['seconds_to_preview'] is not None:
+            line += f", превью через {result['seconds_to_preview']:.1f} с"
+        print(line)
+
+
+if __name__ == "__main__":
+    if '--preset' in sys.argv:
+        print(json.dumps(asyncio.run(measure(sys.argv[sys.argv.index('--preset') + 1]))))
+    else:
+        main()
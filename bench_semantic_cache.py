@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Бенчмарк кэша похожих вопросов: построение индекса и поиск на 100k записей"""
+import asyncio
+import random
+import time
+
+from provider_result import ProviderResult
+from semantic_cache import SemanticCache
+
+WORDS = [
+    "напиши", "функцию", "python", "сортировка", "массив", "как", "работает", "рекурсия",
+    "реши", "уравнение", "найди", "производную", "что", "такое", "список", "словарь",
+    "объясни", "алгоритм", "дейкстры", "бинарный", "поиск", "класс", "наследование", "sql",
+    "запрос", "join", "индекс", "асинхронный", "код", "ошибка", "исправь", "пример"
+]
+
+
+def random_prompt(rng: random.Random) -> str:
+    """Случайный запрос из 4-12 слов"""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+
+
+async def main(entries: int = 100_000, lookups: int = 1_000):
+    rng = random.Random(42)
+    prompts = [random_prompt(rng) for _ in range(entries)]
+    result = ProviderResult.success("ответ")
+
+    cache = SemanticCache(max_entries=entries)
+    groups = [('deepseek', intent) for intent in ('code', 'solve', 'search', 'chat')]
+
+    print(f"🔧 Построение индекса: {entries} записей...")
+    started = time.perf_counter()
+    for i, prompt in enumerate(prompts):
+        await cache.add(groups[i % len(groups)], prompt, result)
+    build_time = time.perf_counter() - started
+    print(f"✅ {build_time:.1f} с ({build_time / entries * 1e6:.0f} мкс на запись)")
+    print(f"💾 Память матрицы: {cache.get_stats()['memory_bytes'] / 1024 / 1024:.0f} МБ")
+
+    # Половина запросов - слегка измененные сохраненные, половина - новые
+    queries = []
+    for i in range(lookups):
+        if i % 2:
+            queries.append((groups[i % len(groups)], random_prompt(rng)))
+        else:
+            index = rng.randrange(entries)
+            queries.append((groups[index % len(groups)], prompts[index] + "?"))
+
+    print(f"🔍 Поиск: {lookups} запросов...")
+    timings = []
+    for group, text in queries:
+        started = time.perf_counter()
+        await cache.lookup(group, text)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    stats = cache.get_stats()
+    print(f"✅ p50 {timings[len(timings) // 2] * 1000:.1f} мс, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1000:.1f} мс")
+    print(f"🎯 Попаданий: {stats['hits']}/{lookups}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Бенчмарк старта AIServices: время от запуска до первого ответа
+
+  python bench_startup.py          # ленивая загрузка: модели грузятся в фоне, первый ответ - удаленный сервис
+  python bench_startup.py --eager  # как раньше: сначала все локальные модели, потом ответ
+"""
+import asyncio
+import sys
+import time
+
+
+async def main(eager: bool):
+    started = time.perf_counter()
+
+    from ai_services import AIServices
+    services = AIServices()
+    if eager:
+        services.load_models()
+    await services.start()
+    ready_time = time.perf_counter() - started
+    print(f"🚀 Сервис готов к /start: {ready_time:.2f} с")
+
+    reply = await services.chat_response("Привет! Ответь одним словом.")
+    first_reply_time = time.perf_counter() - started
+    print(f"💬 Первый ответ: {first_reply_time:.2f} с")
+    print(f"   {reply[:80]!r}")
+
+    # Ждем фоновую загрузку, чтобы увидеть, когда подключились локальные модели
+    if not eager:
+        await asyncio.gather(*services._load_tasks.values(), return_exceptions=True)
+    print(f"📊 {services.get_status()}")
+
+    await services.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(eager='--eager' in sys.argv))
@@ -3,6 +3,8 @@ import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from free_ai_services import FreeAIServices
+from fair_scheduler import FairScheduler, queue_position_reporter
+from history_store import HistoryStore
 from config import TELEGRAM_TOKEN, COMMANDS, MAX_MESSAGE_LENGTH
 import io
 
@@ -12,7 +14,8 @@ logger = logging.getLogger(__name__)
 class TelegramBot:
     def __init__(self):
         self.ai_services = FreeAIServices()
-        self.conversation_history = {}
+        self.scheduler = FairScheduler()  # Честная очередь к ИИ сервисам между пользователями
+        self.conversation_history = HistoryStore()  # Ограниченная история диалогов
         self.user_models = {}  # Сохраняем выбранные модели для каждого пользователя
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -122,7 +125,8 @@ class TelegramBot:
         await update.message.reply_text(f"💻 Генерирую код для: {description}\n🤖 Модель: {model_type.title()}\nБлять, подожди немного!")
         
         try:
-            response = await self.ai_services.generate_code(description, model_type)
+            result = await self.ai_services.generate_code(description, model_type)
+            response = result.text
             if len(response) > MAX_MESSAGE_LENGTH:
                 chunks = [response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(response), MAX_MESSAGE_LENGTH)]
                 for i, chunk in enumerate(chunks):
@@ -151,11 +155,12 @@ class TelegramBot:
         await update.message.reply_text(f"🧮 Решаю задачу: {problem}\n🤖 Модель: {model_type.title()}\nЕпта, подожди!")
         
         try:
-            response = await self.ai_services.generate_text_response(
+            result = await self.ai_services.generate_text_response(
                 f"Реши следующую задачу: {problem}. Объясни решение пошагово.", 
                 max_length=800,
                 model_type=model_type
             )
+            response = result.text
             if len(response) > MAX_MESSAGE_LENGTH:
                 chunks = [response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(response), MAX_MESSAGE_LENGTH)]
                 for i, chunk in enumerate(chunks):
@@ -184,11 +189,12 @@ class TelegramBot:
         await update.message.reply_text(f"🔍 Ищу информацию: {query}\n🤖 Модель: {model_type.title()}\nБлять, подожди!")
         
         try:
-            response = await self.ai_services.generate_text_response(
+            result = await self.ai_services.generate_text_response(
                 f"Найди информацию по запросу: {query}. Предоставь краткий, но информативный ответ.", 
                 max_length=600,
                 model_type=model_type
             )
+            response = result.text
             if len(response) > MAX_MESSAGE_LENGTH:
                 chunks = [response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(response), MAX_MESSAGE_LENGTH)]
                 for i, chunk in enumerate(chunks):
@@ -240,16 +246,12 @@ class TelegramBot:
         user_id = update.effective_user.id
         model_type = self.user_models.get(user_id, 'deepseek')
         
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-        
         await update.message.reply_text(f"💬 Обрабатываю сообщение...\n🤖 Модель: {model_type.title()}\nЕпта, подожди!")
         
         try:
-            response = await self.ai_services.chat_response(message, self.conversation_history[user_id], model_type)
-            self.conversation_history[user_id].append(message)
-            if len(self.conversation_history[user_id]) > 10:
-                self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+            result = await self.ai_services.chat_response(message, await self.conversation_history.get(user_id), model_type)
+            response = result.text
+            await self._remember_turn(user_id, message, result)
             
             if len(response) > MAX_MESSAGE_LENGTH:
                 chunks = [response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(response), MAX_MESSAGE_LENGTH)]
@@ -317,6 +319,7 @@ class TelegramBot:
         """Обработчик команды /stats - статистика использования"""
         try:
             stats = self.ai_services.get_usage_stats()
+            history_stats = self.conversation_history.get_stats()
             user_id = update.effective_user.id
             current_model = self.user_models.get(user_id, 'deepseek')
             
@@ -331,6 +334,8 @@ class TelegramBot:
 🎨 **Replicate:** {stats['replicate_used']}/{stats['replicate_limit']}
 💬 **Cohere:** {stats['cohere_used']}/{stats['cohere_limit']}
 
+🧠 **История диалогов:** {history_stats['users']} пользователей, {history_stats['turns']} сообщений, {history_stats['bytes'] / 1024:.0f} КБ из {history_stats['max_bytes'] / 1024 / 1024:.0f} МБ
+
 💡 **Рекомендации:**
 • Hugging Face: основной сервис (30K запросов)
 • Replicate: только важные изображения (500)
@@ -449,42 +454,57 @@ class TelegramBot:
         user_id = update.effective_user.id
         
         if not message.startswith('/'):
-            await update.message.reply_text("💬 Обрабатываю ваше сообщение...\nБлять, подожди!")
+            processing_msg = await update.message.reply_text("💬 Обрабатываю ваше сообщение...\nБлять, подожди!")
             
             try:
-                # Получаем выбранную модель пользователя
-                model_type = self.user_models.get(user_id, 'deepseek')
+                # Тип запроса определяет полосу приоритета в очереди
+                message_lower = message.lower()
+                if any(word in message_lower for word in ['код', 'программа', 'функция', 'алгоритм']):
+                    intent = 'code'
+                elif any(word in message_lower for word in ['реши', 'задача', 'уравнение', 'вычисли']):
+                    intent = 'solve'
+                elif any(word in message_lower for word in ['найди', 'информация', 'что такое', 'расскажи']):
+                    intent = 'search'
+                elif any(word in message_lower for word in ['картинка', 'изображение', 'рисунок', 'фото']):
+                    intent = 'image'
+                else:
+                    intent = 'chat'
+                
+                # Запросы к ИИ - в порядке честной очереди между пользователями
+                async with self.scheduler.slot(user_id, lane=intent, on_queued=queue_position_reporter(processing_msg)):
+                    # Получаем выбранную модель пользователя
+                    model_type = self.user_models.get(user_id, 'deepseek')
                 
-                if any(word in message.lower() for word in ['код', 'программа', 'функция', 'алгоритм']):
-                    response = await self.ai_services.generate_code(message, model_type)
-                elif any(word in message.lower() for word in ['реши', 'задача', 'уравнение', 'вычисли']):
-                    response = await self.ai_services.generate_text_response(
-                        f"Реши следующую задачу: {message}. Объясни решение пошагово.", 
-                        max_length=800,
-                        model_type=model_type
-                    )
-                elif any(word in message.lower() for word in ['найди', 'информация', 'что такое', 'расскажи']):
-                    response = await self.ai_services.generate_text_response(
-                        f"Найди информацию по запросу: {message}. Предоставь краткий, но информативный ответ.", 
-                        max_length=600,
-                        model_type=model_type
-                    )
-                elif any(word in message.lower() for word in ['картинка', 'изображение', 'рисунок', 'фото']):
-                    response = await self.ai_services.generate_image(message)
-                    if response:
-                        image_stream = io.BytesIO(response)
-                        image_stream.name = 'generated_image.png'
-                        await update.message.reply_photo(image_stream, caption=f"🎨 Изображение по запросу: {message}")
-                        return
+                    if intent == 'code':
+                        result = await self.ai_services.generate_code(message, model_type)
+                        response = result.text
+                    elif intent == 'solve':
+                        result = await self.ai_services.generate_text_response(
+                            f"Реши следующую задачу: {message}. Объясни решение пошагово.", 
+                            max_length=800,
+                            model_type=model_type
+                        )
+                        response = result.text
+                    elif intent == 'search':
+                        result = await self.ai_services.generate_text_response(
+                            f"Найди информацию по запросу: {message}. Предоставь краткий, но информативный ответ.", 
+                            max_length=600,
+                            model_type=model_type
+                        )
+                        response = result.text
+                    elif intent == 'image':
+                        response = await self.ai_services.generate_image(message)
+                        if response:
+                            image_stream = io.BytesIO(response)
+                            image_stream.name = 'generated_image.png'
+                            await update.message.reply_photo(image_stream, caption=f"🎨 Изображение по запросу: {message}")
+                            return
+                        else:
+                            response = "❌ Не удалось сгенерировать изображение"
                     else:
-                        response = "❌ Не удалось сгенерировать изображение"
-                else:
-                    if user_id not in self.conversation_history:
-                        self.conversation_history[user_id] = []
-                    response = await self.ai_services.chat_response(message, self.conversation_history[user_id], model_type)
-                    self.conversation_history[user_id].append(message)
-                    if len(self.conversation_history[user_id]) > 10:
-                        self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+                        result = await self.ai_services.chat_response(message, await self.conversation_history.get(user_id), model_type)
+                        response = result.text
+                        await self._remember_turn(user_id, message, result)
                 
                 if len(response) > MAX_MESSAGE_LENGTH:
                     chunks = [response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(response), MAX_MESSAGE_LENGTH)]
@@ -496,9 +516,32 @@ class TelegramBot:
             except Exception as e:
                 await update.message.reply_text(f"❌ Ошибка при обработке сообщения: {str(e)}")
 
+    async def _remember_turn(self, user_id: int, message: str, result):
+        """Добавляет в историю чата сообщение пользователя и ответ"""
+        await self.conversation_history.append(user_id, {"role": "user", "content": message})
+        if result.ok:
+            await self.conversation_history.append(user_id, {"role": "assistant", "content": result.content})
+
+    async def _post_init(self, application: Application):
+        """Открытие пула HTTP соединений и базы истории при старте бота"""
+        await self.ai_services.start()
+        await self.conversation_history.start()
+
+    async def _post_shutdown(self, application: Application):
+        """Закрытие пула HTTP соединений и выгрузка истории на диск при остановке бота"""
+        await self.ai_services.close()
+        await self.conversation_history.close()
+
     def run(self):
         """Запуск бота"""
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .concurrent_updates(True)  # Сообщения разных пользователей обрабатываются параллельно, очередь - в FairScheduler
+            .build()
+        )
         
         # Регистрируем обработчики команд
         application.add_handler(CommandHandler("start", self.start))
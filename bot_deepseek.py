@@ -11,10 +11,16 @@ import sys
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from openrouter_services import OpenRouterServices
+from fair_scheduler import FairScheduler, queue_position_reporter
+from history_store import HistoryStore
+from summarizer import ConversationSummarizer
 from config_openrouter import TELEGRAM_TOKEN, MAX_MESSAGE_LENGTH
 import io
 import re
 
+# Характер бота для обычного чата: системный промпт вместо шаблона в каждом сообщении
+CHAT_PERSONA = """Будь полезным, информативным, циничным и грубым. Используй красивые маты, подъебы и черный юмор. Можешь иногда цитировать философов (Сократ, Платон, Аристотель, Ницше, Шопенгауэр, Конфуций, Марк Аврелий, Эпиктет, Сенека, Декарт, Кант, Гегель, Кьеркегор, Хайдеггер, Сартр, Камю, Фуко, Деррида, Бодрийяр), но с иронией. Больше подъебов, меньше философии. Заканчивай ответ словом "ЙОУ!"."""
+
 # Проверка переменных окружения для Railway
 def check_environment():
     """Проверка необходимых переменных окружения"""
@@ -36,7 +42,11 @@ class DeepSeekBot:
     def __init__(self):
         # Инициализируем сервисы
         self.openrouter_services = OpenRouterServices()
-        self.conversation_history = {}
+        self.scheduler = FairScheduler()  # Честная очередь к OpenRouter между пользователями
+        self.conversation_history = HistoryStore()  # Ограниченная история диалогов
+        # Длинные диалоги в фоне сжимаются дешевой моделью в сводку
+        self.summary_model = os.getenv('SUMMARY_MODEL', 'llama')
+        self.summarizer = ConversationSummarizer(self._summarize, self.conversation_history)
         self.user_models = {}  # Сохраняем выбранные модели для каждого пользователя
         
         # Настройка логирования
@@ -147,6 +157,10 @@ class DeepSeekBot:
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        # /start - разговор с чистого листа: без истории и сводки
+        self.conversation_history.clear(user.id)
+        self.summarizer.invalidate(user.id)
+        
         await update.message.reply_text(welcome_message, reply_markup=reply_markup, parse_mode='Markdown')
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -252,13 +266,15 @@ class DeepSeekBot:
         
         try:
             # Определяем тип задачи и добавляем подсказку
+            intent = self._classify_message(message)
             enhanced_prompt = self._enhance_prompt(message)
             
             # Получаем модель пользователя
             model_type = self.user_models.get(user_id, 'deepseek-coder')
             
-            # Обрабатываем сообщение через OpenRouter
-            response = await self._process_enhanced_message_openrouter(enhanced_prompt, model_type, user_id)
+            # Обрабатываем сообщение через OpenRouter (в порядке честной очереди)
+            async with self.scheduler.slot(user_id, lane=intent, on_queued=queue_position_reporter(processing_msg)):
+                response = await self._process_enhanced_message_openrouter(enhanced_prompt, model_type, user_id, intent, message)
             
             # Удаляем сообщение о обработке
             await processing_msg.delete()
@@ -288,12 +304,24 @@ class DeepSeekBot:
             ]
             await update.message.reply_text(random.choice(error_messages))
 
-    def _enhance_prompt(self, message: str) -> str:
-        """Улучшает промпт в зависимости от типа задачи"""
+    def _classify_message(self, message: str) -> str:
+        """Определяет тип задачи: code, solve, search или chat"""
         message_lower = message.lower()
         
-        # Определяем тип задачи
         if any(word in message_lower for word in ['код', 'функция', 'программа', 'алгоритм', 'сортировка', 'парсер', 'api']):
+            return 'code'
+        elif any(word in message_lower for word in ['реши', 'вычисли', 'посчитай', 'уравнение', 'математика', 'алгоритм']):
+            return 'solve'
+        elif any(word in message_lower for word in ['что такое', 'объясни', 'расскажи', 'информация', 'история']):
+            return 'search'
+        return 'chat'
+
+    def _enhance_prompt(self, message: str) -> str:
+        """Улучшает промпт в зависимости от типа задачи"""
+        # Определяем тип задачи
+        intent = self._classify_message(message)
+        
+        if intent == 'code':
             return f"""Напиши полноценный, рабочий код для следующей задачи: {message}
 
 Требования:
@@ -313,7 +341,7 @@ class DeepSeekBot:
 
 ЙОУ!"""
         
-        elif any(word in message_lower for word in ['реши', 'вычисли', 'посчитай', 'уравнение', 'математика', 'алгоритм']):
+        elif intent == 'solve':
             return f"""Реши следующую задачу: {message}
 
 Требования к ответу:
@@ -325,7 +353,7 @@ class DeepSeekBot:
 
 Дай подробный, понятный ответ с примерами. ЙОУ!"""
         
-        elif any(word in message_lower for word in ['что такое', 'объясни', 'расскажи', 'информация', 'история']):
+        elif intent == 'search':
             return f"""Найди и проанализируй информацию по запросу: {message}
 
 Требования к ответу:
@@ -341,22 +369,37 @@ class DeepSeekBot:
             # Обычный чат
             return f"""Ответь на следующее сообщение: {message}
 
-Будь полезным, информативным, циничным и грубым. Используй красивые маты, подъебы и черный юмор. Можешь иногда цитировать философов (Сократ, Платон, Аристотель, Ницше, Шопенгауэр, Конфуций, Марк Аврелий, Эпиктет, Сенека, Декарт, Кант, Гегель, Кьеркегор, Хайдеггер, Сартр, Камю, Фуко, Деррида, Бодрийяр), но с иронией. Больше подъебов, меньше философии. Заканчивай ответ словом "ЙОУ!"."""
+{CHAT_PERSONA}"""
 
-    async def _process_enhanced_message_openrouter(self, enhanced_prompt: str, model_type: str, user_id: int) -> str:
+    async def _process_enhanced_message_openrouter(self, enhanced_prompt: str, model_type: str, user_id: int,
+                                                   intent: str = None, message: str = None) -> str:
         """Обрабатывает сообщение с подсказкой через OpenRouter"""
         try:
-            # Обрабатываем сообщение через OpenRouter
-            response = await self.openrouter_services.generate_text_response(
-                enhanced_prompt, 
-                max_tokens=2000, 
-                model=model_type
-            )
-            
-            # Добавляем в историю
-            if user_id not in self.conversation_history:
-                self.conversation_history[user_id] = []
-            self.conversation_history[user_id].append(enhanced_prompt)
+            if intent == 'chat' and message:
+                # Обычный чат - с историей и сводкой ранней части разговора
+                result = await self.openrouter_services.chat_response(
+                    message,
+                    await self.conversation_history.get(user_id),
+                    model=model_type,
+                    summary=await self.summarizer.get(user_id),
+                    system_prompt=CHAT_PERSONA
+                )
+            else:
+                # Обрабатываем сообщение через OpenRouter (одинаковые запросы отдаются из кэша)
+                result = await self.openrouter_services.generate_text_response(
+                    enhanced_prompt, 
+                    max_tokens=2000, 
+                    model=model_type,
+                    intent=intent,
+                    user_text=message
+                )
+            response = result.text
+            
+            # Добавляем в историю исходное сообщение и ответ (без шаблона подсказки)
+            await self.conversation_history.append(user_id, {"role": "user", "content": message or enhanced_prompt})
+            if result.ok:
+                await self.conversation_history.append(user_id, {"role": "assistant", "content": result.content})
+            self.summarizer.schedule(user_id, await self.conversation_history.get(user_id))
             
             return response
             
@@ -435,10 +478,32 @@ class DeepSeekBot:
         
         return text
 
+    async def _summarize(self, prompt: str):
+        """Сжатие истории дешевой моделью (фоновая задача, не путь запроса; свой дневной лимит)"""
+        return await self.openrouter_services.summarize_text(prompt, max_tokens=300, model=self.summary_model)
+
+    async def _post_init(self, application: Application):
+        """Открытие пула HTTP соединений и базы истории при старте бота"""
+        await self.openrouter_services.start()
+        await self.conversation_history.start()
+
+    async def _post_shutdown(self, application: Application):
+        """Закрытие пула HTTP соединений и выгрузка истории на диск при остановке бота"""
+        await self.summarizer.close()
+        await self.openrouter_services.close()
+        await self.conversation_history.close()
+
     def run(self):
         """Запускает бота"""
         # Создаем приложение
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .concurrent_updates(True)  # Сообщения разных пользователей обрабатываются параллельно, очередь - в FairScheduler
+            .build()
+        )
         
         # Добавляем обработчики
         application.add_handler(CommandHandler("start", self.start))
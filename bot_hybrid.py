@@ -1,23 +1,50 @@
 import logging
 import asyncio
 import re
+import time
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from openrouter_services import OpenRouterServices
-# from friendli_services import FriendliServices  # Закомментировано на будущее
-from config_openrouter import TELEGRAM_TOKEN, MAX_MESSAGE_LENGTH
+from friendli_services import FriendliServices
+from provider_health import ProviderHealthRegistry
+from admission import format_admission
+from provider_result import ProviderResult, ErrorKind
+from semantic_cache import SemanticCache
+from fair_scheduler import FairScheduler, queue_position_reporter
+from history_store import HistoryStore
+from config_openrouter import TELEGRAM_TOKEN, MAX_MESSAGE_LENGTH, STREAM_RESPONSES, STREAM_EDIT_INTERVAL
 import io
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Тип задачи (как показываем пользователю) -> ключ типа запроса для кэша и маршрутизации
+TASK_INTENTS = {
+    "💻 Генерация кода": 'code',
+    "🧮 Решение задач": 'solve',
+    "🔍 Поиск информации": 'search',
+    "💭 Общий чат": 'chat'
+}
+
 class HybridTelegramBot:
     def __init__(self):
         self.openrouter_services = OpenRouterServices()
-        # self.friendli_services = FriendliServices()  # Закомментировано на будущее
-        self.conversation_history = {}
+        self.friendli_services = FriendliServices()
+        self.conversation_history = HistoryStore()  # Ограниченная история диалогов
         self.user_models = {}  # Сохраняем выбранные модели для каждого пользователя
         self.user_providers = {}  # Сохраняем выбранных провайдеров для каждого пользователя
+        
+        # Здоровье провайдеров и порядок переключения при сбоях
+        self.provider_health = ProviderHealthRegistry()
+        self.failover_order = ['friendli', 'openrouter', 'free']
+        self.free_fallback_model = 'llama'  # Бесплатная модель OpenRouter на крайний случай
+        
+        # Кэш похожих вопросов (перефразировки) - дополняет точный кэш OpenRouter
+        self.semantic_cache = SemanticCache()
+        
+        # Честная очередь к провайдерам: один пользователь не занимает все места
+        self.scheduler = FairScheduler()
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start с циничным приветствием"""
@@ -112,7 +139,7 @@ class HybridTelegramBot:
 /help - эта справка
 
 🚀 **Провайдеры:**
-# • Friendli.ai - Qwen3 Highlights (лучший для кода!)  # Закомментировано на будущее
+• Friendli.ai - Qwen3 Highlights (лучший для кода!)
 • OpenRouter - DeepSeek, Claude, GPT, Gemini
 
 💰 **Высокие лимиты запросов!**
@@ -234,6 +261,9 @@ class HybridTelegramBot:
             # else:
             
             stats = self.openrouter_services.get_usage_stats()
+            semantic_stats = self.semantic_cache.get_stats()
+            scheduler_stats = self.scheduler.get_stats()
+            history_stats = self.conversation_history.get_stats()
             stats_text = f"""
 📊 **Статистика использования OpenRouter**
 
@@ -247,11 +277,23 @@ class HybridTelegramBot:
 
 🔄 **Сброс счетчиков:** каждый день в {stats['reset_time']}
 
+🗄 **Кэш ответов:** {stats['cache']['hits']} попаданий / {stats['cache']['misses']} промахов ({stats['cache']['hit_rate']:.0%}), записей {stats['cache']['size']}/{stats['cache']['max_size']}
+🧭 **Похожие вопросы:** {semantic_stats['hits']} попаданий / {semantic_stats['misses']} промахов ({semantic_stats['hit_rate']:.0%}), записей {semantic_stats['size']}/{semantic_stats['max_size']}
+🧠 **История диалогов:** {history_stats['users']} пользователей, {history_stats['turns']} сообщений, {history_stats['bytes'] / 1024:.0f} КБ из {history_stats['max_bytes'] / 1024 / 1024:.0f} МБ
+
 💡 **Рекомендации:**
 • Бесплатные модели: {stats['free_models_limit']} запросов/день
 • Платные модели: {stats['paid_models_limit']} запросов/день
 • Используйте эффективно!
 
+👥 **Очередь:** в работе {scheduler_stats['in_flight']}, ждут {scheduler_stats['waiting']} (пользователей {scheduler_stats['waiting_users']}), среднее ожидание {scheduler_stats['avg_wait_time']:.1f}с
+{self._format_lanes(scheduler_stats)}
+⚙️ **Лимиты запросов:**
+{format_admission(stats['admission'])}
+
+🩺 **Провайдеры:**
+{self._format_provider_health()}
+
 💰 **100 бесплатных запросов в день!**
             """
             
@@ -362,6 +404,7 @@ class HybridTelegramBot:
             
             # Определяем тип задачи и добавляем подсказку
             task_type, enhanced_prompt = self._analyze_and_enhance_message(message)
+            intent = TASK_INTENTS[task_type]
             
             # Отправляем сообщение о начале обработки
             provider_emoji = "🚀" if provider == 'friendli' else "🌟"
@@ -375,11 +418,30 @@ class HybridTelegramBot:
             )
             
             try:
-                # Обрабатываем сообщение с подсказкой через выбранного провайдера
-                if provider == 'friendli':
-                    response = await self._process_enhanced_message_friendli(enhanced_prompt, model_type, user_id)
-                else:
-                    response = await self._process_enhanced_message_openrouter(enhanced_prompt, model_type, user_id)
+                # Похожий вопрос уже задавали - показываем сохраненный ответ без запроса к провайдеру
+                similar = await self._lookup_similar_answer(model_type, intent, message)
+                if similar:
+                    async def similar_stream():
+                        yield similar.content
+                    
+                    await self._stream_to_telegram(update, processing_msg, similar_stream())
+                    await self._remember_turn(user_id, message, similar.content)
+                    return
+                
+                async with self.scheduler.slot(user_id, lane=intent, on_queued=queue_position_reporter(processing_msg)):
+                    # Потоковый режим: ответ появляется прямо в сообщении "Обрабатываю..."
+                    streamed = provider != 'friendli' and STREAM_RESPONSES
+                    if streamed:
+                        response = await self._stream_enhanced_message_openrouter(enhanced_prompt, model_type, user_id, update, processing_msg, intent, message)
+                        if response is not None:
+                            return
+                    
+                    # Обрабатываем сообщение через выбранного провайдера с переключением при сбоях;
+                    # OpenRouter только что не ответил в потоке (и кэш уже проверен) - он идет последним
+                    response = await self._process_with_failover(
+                        enhanced_prompt, provider, model_type, user_id, intent, message,
+                        demoted=('openrouter',) if streamed else ()
+                    )
                 
                 # Удаляем сообщение о обработке
                 try:
@@ -514,45 +576,258 @@ class HybridTelegramBot:
         
         return task_type, enhanced_prompt
 
-    async def _process_enhanced_message_friendli(self, enhanced_prompt: str, model_type: str, user_id: int) -> str:
+    async def _process_with_failover(self, enhanced_prompt: str, provider: str, model_type: str, user_id: int,
+                                     intent: str = None, message: str = None, demoted: tuple = ()) -> str:
+        """Обход провайдеров по здоровью: выбранный пользователем, затем запасные (Friendli ↔ OpenRouter ↔ бесплатная модель).
+        
+        demoted - провайдеры, которые уже не ответили на этот запрос в потоковом режиме: они идут последними,
+        а кэш ответов для них повторно не проверяется.
+        """
+        route = self.provider_health.route(provider, self.failover_order, demoted)
+        last_error = None
+        
+        for name in route:
+            health = self.provider_health.get(name)
+            if not health.allow_request():
+                continue  # Автомат разомкнут - не долбим лежащий провайдер
+            
+            started = time.monotonic()
+            result = None
+            try:
+                if name == 'friendli':
+                    result = await self._process_enhanced_message_friendli(enhanced_prompt, model_type, user_id)
+                elif name == 'free':
+                    result = await self._process_enhanced_message_openrouter(enhanced_prompt, self.free_fallback_model, user_id, intent, message)
+                else:
+                    result = await self._process_enhanced_message_openrouter(enhanced_prompt, model_type, user_id, intent, message,
+                                                                             check_cache=name not in demoted)
+            except Exception as e:
+                result = ProviderResult.failure(ErrorKind.NETWORK, f"Ошибка провайдера {name}: {str(e)}", provider=name)
+            finally:
+                if result is None:
+                    # Отмена (пользователь, остановка бота) - освобождаем пробный запрос без оценки провайдера
+                    health.record_skipped()
+            latency = time.monotonic() - started
+            
+            if not result.ok:
+                # Наш собственный лимит или отсутствие ключа - не вина провайдера, автомат не трогаем
+                if result.error_kind in (ErrorKind.CONFIG, ErrorKind.QUOTA):
+                    health.record_skipped()
+                else:
+                    health.record_failure(latency)
+                last_error = result
+                logger.warning(f"Провайдер {name} вернул ошибку ({result.error_kind}, {result.status}): {result.error_message[:200]}")
+                continue
+            
+            health.record_success(latency)
+            if name != route[0]:
+                self.provider_health.record_failover(route[0], name)
+            
+            await self._remember_turn(user_id, message, result.content)
+            await self._store_similar_answer(model_type, intent, message, result)
+            return result.text
+        
+        if last_error:
+            return last_error.text
+        return "❌ Все провайдеры сейчас недоступны. Попробуйте через минуту."
+
+    async def _process_enhanced_message_friendli(self, enhanced_prompt: str, model_type: str, user_id: int) -> ProviderResult:
         """Обрабатывает сообщение с подсказкой через Friendli.ai"""
-        # Инициализируем историю чата если нужно
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
+        if model_type not in self.friendli_services.available_models:
+            model_type = 'qwen3_highlights'
         
-        # Обрабатываем сообщение через Friendli.ai
-        response = await self.friendli_services.generate_text_response(
+        return await self.friendli_services.generate_text_response(
             enhanced_prompt, 
             max_tokens=3000, 
             model=model_type
         )
-        
-        # Добавляем в историю
-        self.conversation_history[user_id].append(enhanced_prompt)
-        if len(self.conversation_history[user_id]) > 10:
-            self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
-        
-        return response
 
-    async def _process_enhanced_message_openrouter(self, enhanced_prompt: str, model_type: str, user_id: int) -> str:
+    async def _process_enhanced_message_openrouter(self, enhanced_prompt: str, model_type: str, user_id: int,
+                                                   intent: str = None, message: str = None,
+                                                   check_cache: bool = True) -> ProviderResult:
         """Обрабатывает сообщение с подсказкой через OpenRouter"""
-        # Инициализируем историю чата если нужно
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-        
-        # Обрабатываем сообщение через OpenRouter
-        response = await self.openrouter_services.generate_text_response(
+        return await self.openrouter_services.generate_text_response(
             enhanced_prompt, 
             max_tokens=2000, 
-            model=model_type
+            model=model_type,
+            intent=intent,
+            user_text=message,
+            check_cache=check_cache
+        )
+
+    async def _lookup_similar_answer(self, model_type: str, intent: str, message: str) -> Optional[ProviderResult]:
+        """Ответ на похожий ранее заданный вопрос (None - похожих нет или кэш для этого типа выключен)"""
+        if not message or not self._similar_answers_enabled(intent):
+            return None
+        return await self.semantic_cache.lookup((model_type, intent), message)
+
+    async def _store_similar_answer(self, model_type: str, intent: str, message: str, result: ProviderResult):
+        """Сохраняет ответ в кэш похожих вопросов"""
+        if not message or result.cache_hit or not self._similar_answers_enabled(intent):
+            return
+        await self.semantic_cache.add((model_type, intent), message, result)
+
+    def _similar_answers_enabled(self, intent: str) -> bool:
+        """Похожие ответы - только для типов, где близкий ответ годится (не код и не задачи), и если кэш не выключен"""
+        return self.semantic_cache.is_enabled(intent) and self.openrouter_services.completion_cache.is_enabled(intent)
+
+    async def _remember_turn(self, user_id: int, message: str, answer: Optional[str]):
+        """Добавляет в историю чата исходное сообщение и ответ (без шаблона подсказки)"""
+        await self.conversation_history.append(user_id, {"role": "user", "content": message})
+        if answer:
+            await self.conversation_history.append(user_id, {"role": "assistant", "content": answer})
+
+    async def _stream_enhanced_message_openrouter(self, enhanced_prompt: str, model_type: str, user_id: int, update: Update, processing_msg,
+                                                  intent: str = None, message: str = None) -> Optional[str]:
+        """Потоковая обработка через OpenRouter; None - провайдер недоступен, нужен обычный путь с переключением"""
+        # Готовый ответ из кэша показываем сразу, без запроса и без расхода лимита
+        cached = self.openrouter_services.lookup_cache(model_type, intent, message)
+        if cached:
+            async def cached_stream():
+                yield cached.content
+            
+            response = await self._stream_to_telegram(update, processing_msg, cached_stream())
+            await self._remember_turn(user_id, message, cached.content)
+            return response
+        
+        health = self.provider_health.get('openrouter')
+        if not health.allow_request():
+            return None
+        
+        started = time.monotonic()
+        result = ProviderResult()
+        stream = self.openrouter_services.stream_text_response(
+            enhanced_prompt,
+            max_tokens=2000,
+            model=model_type,
+            result=result
         )
         
-        # Добавляем в историю
-        self.conversation_history[user_id].append(enhanced_prompt)
-        if len(self.conversation_history[user_id]) > 10:
-            self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+        # Исход записывается ровно один раз; отмена или ошибка показа в Telegram освобождают
+        # пробный запрос автомата, иначе провайдер навсегда остался бы в half-open
+        recorded = False
+        try:
+            # Ждем первый кусок до показа: ошибку пользователю не отправляем, а переключаемся
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+            if first_chunk is None:
+                if result.error_kind in (ErrorKind.CONFIG, ErrorKind.QUOTA):
+                    health.record_skipped()
+                else:
+                    health.record_failure(time.monotonic() - started)
+                recorded = True
+                return None
+            
+            async def replay():
+                yield first_chunk
+                async for delta in stream:
+                    yield delta
+            
+            response = await self._stream_to_telegram(update, processing_msg, replay())
+            recorded = True
+            if result.ok:
+                health.record_success(time.monotonic() - started)
+                self.openrouter_services.store_cache(model_type, intent, message, result)
+                await self._store_similar_answer(model_type, intent, message, result)
+            else:
+                # Поток оборвался на середине - показываем, что ответ неполный
+                health.record_failure(time.monotonic() - started)
+                await update.message.reply_text(result.text)
+            
+            await self._remember_turn(user_id, message, result.content if result.ok else None)
+            return response
+        finally:
+            if not recorded:
+                health.record_skipped()
+            await stream.aclose()
+
+    def _format_lanes(self, scheduler_stats: dict) -> str:
+        """Очереди по полосам приоритета для /stats"""
+        return "\n".join(
+            f"• {name}: в работе {lane['in_flight']}, ждут {lane['waiting']}, "
+            f"ожидание {lane['avg_wait_time']:.1f}с (макс {lane['max_wait_time']:.1f}с)"
+            + (f", закреплено мест {lane['reserved']}" if lane['reserved'] else "")
+            for name, lane in scheduler_stats['lanes'].items()
+        )
+
+    def _format_provider_health(self) -> str:
+        """Состояние автоматов и переключений для /stats"""
+        stats = self.provider_health.get_stats()
+        state_names = {'closed': '🟢 работает', 'open': '🔴 отключен', 'half_open': '🟡 проверка'}
+        
+        lines = []
+        for name in self.failover_order:
+            provider_stats = stats['providers'].get(name)
+            if not provider_stats:
+                lines.append(f"• {name}: 🟢 нет запросов")
+                continue
+            latency = provider_stats['latency_ewma']
+            latency_text = f"{latency:.1f}с" if latency is not None else "—"
+            lines.append(
+                f"• {name}: {state_names[provider_stats['state']]}, "
+                f"ошибки {provider_stats['error_rate']:.0%}, задержка {latency_text}"
+            )
+        lines.append(f"🔀 Переключений: {stats['total_failovers']}")
+        return "\n".join(lines)
+
+    async def _stream_to_telegram(self, update: Update, processing_msg, stream) -> str:
+        """Показывает поток текста в Telegram: правки не чаще STREAM_EDIT_INTERVAL, перенос в новое сообщение при MAX_MESSAGE_LENGTH"""
+        full_text = ""
+        current_msg = processing_msg
+        current_text = ""
+        shown_text = None
+        last_edit = 0.0
+        
+        async def show(text: str):
+            nonlocal current_msg, shown_text, last_edit
+            if not text.strip() or text == shown_text:
+                return
+            try:
+                if current_msg is None:
+                    current_msg = await update.message.reply_text(text)
+                else:
+                    await current_msg.edit_text(text)
+                shown_text = text
+            except Exception as e:
+                logger.debug(f"Не удалось обновить сообщение: {e}")
+            last_edit = time.monotonic()
+        
+        async for delta in stream:
+            full_text += delta
+            current_text += delta
+            
+            # Сообщение упирается в лимит Telegram - дописываем его и начинаем новое
+            while len(current_text) > MAX_MESSAGE_LENGTH:
+                cut = current_text.rfind('\n', 0, MAX_MESSAGE_LENGTH)
+                if cut <= 0:
+                    cut = MAX_MESSAGE_LENGTH
+                await show(current_text[:cut])
+                current_text = current_text[cut:].lstrip('\n')
+                current_msg = None
+                shown_text = None
+                last_edit = 0.0
+            
+            # Первый кусок показываем сразу, дальше - с ограничением частоты правок
+            if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                await show(current_text)
+        
+        if not full_text.strip():
+            await show("❌ Модель вернула пустой ответ. Попробуйте еще раз.")
+            return full_text
         
-        return response
+        # Финальная правка с форматированием
+        if current_text.strip():
+            try:
+                if current_msg is None:
+                    current_msg = await update.message.reply_text(self._convert_to_html(current_text), parse_mode='HTML')
+                else:
+                    await current_msg.edit_text(self._convert_to_html(current_text), parse_mode='HTML')
+            except Exception:
+                await show(current_text)
+        
+        return full_text
 
     def _convert_to_html(self, text: str) -> str:
         """Конвертирует текст с Markdown в HTML для отправки в Telegram."""
@@ -588,9 +863,29 @@ class HybridTelegramBot:
         
         return text
 
+    async def _post_init(self, application: Application):
+        """Открытие пула HTTP соединений и базы истории при старте бота"""
+        await self.openrouter_services.start()
+        await self.conversation_history.start()
+        await self.friendli_services.start()
+
+    async def _post_shutdown(self, application: Application):
+        """Закрытие пула HTTP соединений и выгрузка истории на диск при остановке бота"""
+        await self.openrouter_services.close()
+        await self.conversation_history.close()
+        await self.friendli_services.close()
+        self.semantic_cache.close()
+
     def run(self):
         """Запуск бота"""
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .concurrent_updates(True)  # Сообщения разных пользователей обрабатываются параллельно, очередь - в FairScheduler
+            .build()
+        )
         
         # Регистрируем обработчики команд
         application.add_handler(CommandHandler("start", self.start))
@@ -1,18 +1,35 @@
 import logging
 import asyncio
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from openrouter_services import OpenRouterServices
+from fair_scheduler import FairScheduler, queue_position_reporter
+from admission import format_admission
+from history_store import HistoryStore
+from summarizer import ConversationSummarizer
 from config_openrouter import TELEGRAM_TOKEN, MAX_MESSAGE_LENGTH
 import io
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Тип задачи (как показываем пользователю) -> ключ типа запроса для кэша
+TASK_INTENTS = {
+    "💻 Генерация кода": 'code',
+    "🧮 Решение задач": 'solve',
+    "🔍 Поиск информации": 'search',
+    "💭 Общий чат": 'chat'
+}
+
 class TelegramBot:
     def __init__(self):
         self.ai_services = OpenRouterServices()
-        self.conversation_history = {}
+        self.scheduler = FairScheduler()  # Честная очередь к OpenRouter между пользователями
+        self.conversation_history = HistoryStore()  # Ограниченная история диалогов
+        # Длинные диалоги в фоне сжимаются дешевой моделью в сводку
+        self.summary_model = os.getenv('SUMMARY_MODEL', 'llama')
+        self.summarizer = ConversationSummarizer(self._summarize, self.conversation_history)
         self.user_models = {}  # Сохраняем выбранные модели для каждого пользователя
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -48,6 +65,10 @@ class TelegramBot:
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        # /start - разговор с чистого листа: без истории и сводки
+        self.conversation_history.clear(user.id)
+        self.summarizer.invalidate(user.id)
+        
         await update.message.reply_text(welcome_text, reply_markup=reply_markup)
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -148,6 +169,8 @@ class TelegramBot:
         """Обработчик команды /stats - статистика использования"""
         try:
             stats = self.ai_services.get_usage_stats()
+            history_stats = self.conversation_history.get_stats()
+            summary_stats = self.summarizer.get_stats()
             user_id = update.effective_user.id
             current_model = self.user_models.get(user_id, 'deepseek')
             
@@ -160,9 +183,16 @@ class TelegramBot:
 
 🆓 **Бесплатные модели:** {stats['free_models_used']}/{stats['free_models_limit']}
 💳 **Платные модели:** {stats['paid_models_used']}/{stats['paid_models_limit']}
+📝 **Фоновые сводки:** {stats['summaries_used']}/{stats['summaries_limit']}
 
 🔄 **Сброс счетчиков:** каждый день в {stats['reset_time']}
 
+⚙️ **Лимиты запросов:**
+{format_admission(stats['admission'])}
+
+🧠 **История диалогов:** {history_stats['users']} пользователей, {history_stats['turns']} сообщений, {history_stats['bytes'] / 1024:.0f} КБ из {history_stats['max_bytes'] / 1024 / 1024:.0f} МБ
+📝 **Сводки диалогов:** {history_stats['summaries']}, сжатий {summary_stats['runs']} (ошибок {summary_stats['failures']})
+
 💡 **Рекомендации:**
 • Бесплатные модели: 100 запросов/день
 • Платные модели: 1000 запросов/день
@@ -260,8 +290,10 @@ class TelegramBot:
             )
             
             try:
-                # Обрабатываем сообщение с подсказкой
-                response = await self._process_enhanced_message(enhanced_prompt, model_type, user_id)
+                # Обрабатываем сообщение с подсказкой (в порядке честной очереди)
+                intent = TASK_INTENTS.get(task_type, 'chat')
+                async with self.scheduler.slot(user_id, lane=intent, on_queued=queue_position_reporter(processing_msg)):
+                    response = await self._process_enhanced_message(enhanced_prompt, model_type, user_id, intent, message)
                 
                 # Удаляем сообщение о обработке
                 try:
@@ -396,23 +428,33 @@ class TelegramBot:
         
         return task_type, enhanced_prompt
 
-    async def _process_enhanced_message(self, enhanced_prompt: str, model_type: str, user_id: int) -> str:
+    async def _process_enhanced_message(self, enhanced_prompt: str, model_type: str, user_id: int,
+                                        intent: str = None, message: str = None) -> str:
         """Обрабатывает сообщение с подсказкой"""
-        # Инициализируем историю чата если нужно
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-        
-        # Обрабатываем сообщение через OpenRouter
-        response = await self.ai_services.generate_text_response(
-            enhanced_prompt, 
-            max_tokens=2000, 
-            model=model_type
-        )
+        if intent == 'chat' and message:
+            # Обычный чат - с историей и сводкой ранней части разговора
+            result = await self.ai_services.chat_response(
+                message,
+                await self.conversation_history.get(user_id),
+                model=model_type,
+                summary=await self.summarizer.get(user_id)
+            )
+        else:
+            # Обрабатываем сообщение через OpenRouter
+            result = await self.ai_services.generate_text_response(
+                enhanced_prompt, 
+                max_tokens=2000, 
+                model=model_type,
+                intent=intent,
+                user_text=message
+            )
+        response = result.text
         
-        # Добавляем в историю
-        self.conversation_history[user_id].append(enhanced_prompt)
-        if len(self.conversation_history[user_id]) > 10:
-            self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+        # Добавляем в историю исходное сообщение и ответ (без шаблона подсказки)
+        await self.conversation_history.append(user_id, {"role": "user", "content": message or enhanced_prompt})
+        if result.ok:
+            await self.conversation_history.append(user_id, {"role": "assistant", "content": result.content})
+        self.summarizer.schedule(user_id, await self.conversation_history.get(user_id))
         
         return response
 
@@ -426,9 +468,31 @@ class TelegramBot:
         text = text.replace('</code>', '</code>\n\n')
         return text
 
+    async def _summarize(self, prompt: str):
+        """Сжатие истории дешевой моделью (фоновая задача, не путь запроса; свой дневной лимит)"""
+        return await self.ai_services.summarize_text(prompt, max_tokens=300, model=self.summary_model)
+
+    async def _post_init(self, application: Application):
+        """Открытие пула HTTP соединений и базы истории при старте бота"""
+        await self.ai_services.start()
+        await self.conversation_history.start()
+
+    async def _post_shutdown(self, application: Application):
+        """Закрытие пула HTTP соединений и выгрузка истории на диск при остановке бота"""
+        await self.summarizer.close()
+        await self.ai_services.close()
+        await self.conversation_history.close()
+
     def run(self):
         """Запуск бота"""
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .concurrent_updates(True)  # Сообщения разных пользователей обрабатываются параллельно, очередь - в FairScheduler
+            .build()
+        )
         
         # Регистрируем обработчики команд
         application.add_handler(CommandHandler("start", self.start))
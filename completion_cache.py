@@ -0,0 +1,83 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Optional, Dict, Any, Tuple
+
+from provider_result import ProviderResult
+from utils import MessageUtils
+
+
+class CompletionCache:
+    """LRU кэш ответов LLM с TTL: ключ - (модель, тип запроса, нормализованный текст пользователя)"""
+
+    def __init__(self, max_size: int = None, ttl: float = None, disabled_intents: set = None):
+        self.max_size = max_size or int(os.getenv('COMPLETION_CACHE_SIZE', 1000))
+        self.ttl = ttl or float(os.getenv('COMPLETION_CACHE_TTL', 3600))
+
+        # Типы запросов, для которых кэш выключен (через запятую: "chat,search")
+        if disabled_intents is None:
+            disabled_intents = {
+                intent.strip() for intent in os.getenv('COMPLETION_CACHE_DISABLED_INTENTS', '').split(',')
+                if intent.strip()
+            }
+        self.disabled_intents = disabled_intents
+
+        self.entries: 'OrderedDict[Tuple[str, str, str], Tuple[float, ProviderResult]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_enabled(self, intent: Optional[str]) -> bool:
+        """Кэшируется ли этот тип запроса"""
+        return bool(intent) and intent not in self.disabled_intents
+
+    @staticmethod
+    def make_key(model_id: str, intent: str, user_text: str) -> Tuple[str, str, str]:
+        """Ключ кэша: регистр и лишние пробелы не влияют"""
+        return model_id, intent, MessageUtils.clean_text(user_text).lower()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[ProviderResult]:
+        """Получение ответа из кэша (None - промах)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return replace(result, cache_hit=True, latency=0.0)
+
+    def set(self, key: Tuple[str, str, str], result: ProviderResult) -> None:
+        """Сохранение успешного ответа"""
+        if not result.ok:
+            return
+
+        self.entries[key] = (time.monotonic(), result)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Очистка кэша"""
+        self.entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -13,6 +13,11 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 # Настройки сообщений
 MAX_MESSAGE_LENGTH = 4096
 
+# Потоковые ответы: текст появляется в сообщении по мере генерации
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+# Минимальный интервал между правками сообщения (лимиты Telegram ~1 правка/сек на чат)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', 1.0))
+
 # Команды бота
 COMMANDS = {
     'start': 'Запуск бота',
@@ -0,0 +1,130 @@
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# Слова и отдельные знаки - примерно так режут текст BPE токенизаторы
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Служебные токены на каждое сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD = 4
+
+# Шаблон чата: раньше повторялся в каждом сохраненном запросе, теперь - один системный промпт на контекст
+CHAT_SYSTEM_PROMPT = """Ты полезный ИИ ассистент в Telegram. Требования к ответу:
+1. Полезный и информативный ответ
+2. Если это вопрос - дай развернутый ответ
+3. Если это просьба - выполни её
+4. Если это шутка - поддержи юмор
+5. Будь дружелюбным и полезным"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Быстрая оценка числа токенов без токенизатора модели.
+
+    Английское слово - в среднем ~4 символа на токен, кириллица и прочий не-ASCII
+    текст режется мельче - ~3 символа на токен; знак препинания - отдельный токен.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        chars_per_token = 4 if piece.isascii() else 3
+        tokens += max(1, math.ceil(len(piece) / chars_per_token))
+    return tokens
+
+
+def as_message(turn: Any) -> Dict[str, str]:
+    """Запись истории в сообщение чата (старые записи - просто строки пользователя)"""
+    if isinstance(turn, dict):
+        return {"role": turn.get("role", "user"), "content": str(turn.get("content", ""))}
+    return {"role": "user", "content": str(turn)}
+
+
+def summary_messages(summary: Optional[str]) -> List[Dict[str, str]]:
+    """Сводка ранней части разговора как служебное сообщение перед историей"""
+    if not summary:
+        return []
+    return [{"role": "system", "content": f"Краткое содержание предыдущей части разговора:\n{summary}"}]
+
+
+# Имя модели: ключ из available_models или id OpenRouter вида "vendor/model:free"
+_MODEL_NAME_PATTERN = re.compile(r"[\w.\-/:]+")
+
+
+def parse_budgets(value: str) -> Dict[str, int]:
+    """Бюджеты моделей из строки вида "deepseek=3000,qwen3_highlights=6000".
+
+    Некорректные пары (например, комментарий, который python-dotenv отдал как значение) пропускаются.
+    """
+    budgets = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        model, budget = (part.strip() for part in item.split('=', 1))
+        if not _MODEL_NAME_PATTERN.fullmatch(model) or not budget.isdigit():
+            print(f"⚠️ CONTEXT_TOKEN_BUDGETS: пропускаю некорректную пару {item.strip()!r}")
+            continue
+        budgets[model] = int(budget)
+    return budgets
+
+
+class ContextBuilder:
+    """Сборка контекста чата в бюджет токенов: системный шаблон один раз,
+    затем самые свежие реплики пользователя и ассистента, которые помещаются, и новое сообщение.
+    """
+
+    def __init__(self, default_budget: int = None, budgets: Dict[str, int] = None):
+        self.default_budget = default_budget or int(os.getenv('CONTEXT_TOKEN_BUDGET', 2000))
+        self.budgets = budgets if budgets is not None else parse_budgets(os.getenv('CONTEXT_TOKEN_BUDGETS', ''))
+
+        self.stats = {'builds': 0, 'estimated_tokens': 0, 'turns_packed': 0, 'turns_dropped': 0,
+                      'prompt_tokens': 0, 'usage_reports': 0}
+
+    def budget_for(self, model: str) -> int:
+        """Бюджет токенов на контекст для модели"""
+        return self.budgets.get(model, self.default_budget)
+
+    def build(self, message: str, history: Optional[List[Any]] = None, model: str = None,
+              system_prompt: str = None, prefix: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """Сообщения для API; prefix - служебные сообщения сразу после системного (например, сводка)"""
+        head = []
+        if system_prompt:
+            head.append({"role": "system", "content": system_prompt})
+        head.extend(prefix or [])
+        tail = {"role": "user", "content": message}
+
+        used = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in head + [tail])
+        budget = self.budget_for(model)
+
+        # Идем от новых к старым, пока помещается; первая не поместившаяся обрывает историю
+        packed: List[Dict[str, str]] = []
+        turns = [as_message(turn) for turn in history or []]
+        for turn in reversed(turns):
+            cost = estimate_tokens(turn["content"]) + MESSAGE_OVERHEAD
+            if used + cost > budget:
+                break
+            packed.append(turn)
+            used += cost
+        packed.reverse()
+
+        self.stats['builds'] += 1
+        self.stats['estimated_tokens'] += used
+        self.stats['turns_packed'] += len(packed)
+        self.stats['turns_dropped'] += len(turns) - len(packed)
+        return head + packed + [tail]
+
+    def record_usage(self, usage: Dict[str, Any]) -> None:
+        """Учет реальных prompt_tokens из usage ответа API - для сравнения с оценкой"""
+        prompt_tokens = (usage or {}).get('prompt_tokens')
+        if prompt_tokens is not None:
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['usage_reports'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика сборки контекста"""
+        builds = self.stats['builds']
+        reports = self.stats['usage_reports']
+        return {
+            **self.stats,
+            'avg_estimated_tokens': self.stats['estimated_tokens'] / builds if builds else 0.0,
+            'avg_prompt_tokens': self.stats['prompt_tokens'] / reports if reports else 0.0,
+            'default_budget': self.default_budget
+        }
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Hashable, Any, Optional
+
+
+class _Ticket:
+    """Запрос пользователя в очереди планировщика"""
+
+    def __init__(self, user_id: Hashable, lane: str):
+        self.user_id = user_id
+        self.lane = lane
+        self.granted = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class _Lane:
+    """Полоса приоритета: свои очереди пользователей и своя статистика"""
+
+    def __init__(self, name: str, reserved: int = 0, weight: int = 1):
+        self.name = name
+        self.reserved = reserved
+        self.weight = weight
+        # Накопленный кредит взвешенного обхода полос
+        self.credit = 0
+
+        # Очереди пользователей в порядке обхода по кругу
+        self.queues: 'OrderedDict[Hashable, deque]' = OrderedDict()
+        self.in_flight = 0
+
+        self.dispatched = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def waiting(self) -> int:
+        """Сколько запросов ждет в полосе"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика полосы"""
+        return {
+            'reserved': self.reserved,
+            'weight': self.weight,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'dispatched': self.dispatched,
+            'avg_wait_time': self.wait_time_total / self.dispatched if self.dispatched else 0.0,
+            'max_wait_time': self.wait_time_max
+        }
+
+
+def queue_position_reporter(message) -> Callable[[int], Awaitable[None]]:
+    """on_queued для FairScheduler.slot: дописывает место в очереди в сообщение "Обрабатываю..."
+    (Telegram Message или любой объект с text и edit_text); ошибки редактирования не мешают запросу"""
+    async def report(position: int):
+        try:
+            await message.edit_text(f"{message.text}\n⏳ Место в очереди: {position}")
+        except Exception:
+            pass
+    return report
+
+
+class FairScheduler:
+    """Честное распределение мест к ИИ провайдерам между пользователями и типами запросов.
+
+    У каждого пользователя не больше per_user запросов в работе, лишние ждут в его личной очереди.
+    Освободившееся место получает следующий по кругу пользователь (round-robin),
+    поэтому десять задач одного пользователя не задерживают короткий вопрос другого.
+
+    Запросы делятся на полосы по типу (chat, search, solve, code). Свободные места делятся между
+    ожидающими полосами взвешенным круговым обходом (по умолчанию chat=4, search=2, solve=2, code=1,
+    LLM_LANE_WEIGHTS="chat=4,code=1"): чат получает больше мест, но и поток чата не останавливает
+    генерацию кода навсегда. Часть мест закреплена за чатом - длинная генерация кода не может занять их все.
+    """
+
+    # Порядок полос (при равных кредитах раньше идет первая); неизвестные полосы идут последними
+    LANE_PRIORITY = ('chat', 'search', 'solve', 'code')
+    LANE_WEIGHTS = {'chat': 4, 'search': 2, 'solve': 2, 'code': 1}
+
+    def __init__(self, max_concurrent: int = None, per_user: int = None, chat_reserved_share: float = None,
+                 lane_weights: Dict[str, int] = None):
+        self.max_concurrent = max_concurrent or int(os.getenv('LLM_MAX_CONCURRENT', 8))
+        self.per_user = per_user or int(os.getenv('LLM_PER_USER_IN_FLIGHT', 2))
+        if chat_reserved_share is None:
+            chat_reserved_share = float(os.getenv('LLM_CHAT_RESERVED_SHARE', 0.25))
+
+        # Места, которые остальные полосы не занимают (хотя бы одно, если доля задана)
+        chat_reserved = 0
+        if chat_reserved_share > 0:
+            chat_reserved = min(self.max_concurrent - 1, max(1, round(self.max_concurrent * chat_reserved_share)))
+        if lane_weights is None:
+            lane_weights = {}
+            for item in os.getenv('LLM_LANE_WEIGHTS', '').split(','):
+                if '=' in item:
+                    name, weight = item.split('=', 1)
+                    lane_weights[name.strip()] = int(weight)
+        self.lane_weights = {**self.LANE_WEIGHTS, **lane_weights}
+
+        self.lanes: Dict[str, _Lane] = {}
+        for name in self.LANE_PRIORITY:
+            self._lane(name)
+        self.lanes['chat'].reserved = chat_reserved
+
+        self.in_flight: Dict[Hashable, int] = {}
+        self.total_in_flight = 0
+        self.queued = 0
+
+    def _lane(self, name: str) -> _Lane:
+        """Получение (или создание) полосы"""
+        if name not in self.lanes:
+            self.lanes[name] = _Lane(name, weight=max(1, self.lane_weights.get(name, 1)))
+        return self.lanes[name]
+
+    def _can_run(self, user_id: Hashable) -> bool:
+        """Есть ли у пользователя свободное место"""
+        return self.in_flight.get(user_id, 0) < self.per_user
+
+    def _lane_has_room(self, lane: _Lane) -> bool:
+        """Есть ли место для полосы с учетом мест, закрепленных за другими полосами"""
+        held_for_others = sum(
+            max(0, other.reserved - other.in_flight)
+            for other in self.lanes.values() if other is not lane
+        )
+        return self.total_in_flight + held_for_others < self.max_concurrent
+
+    def _grant(self, lane: _Lane, ticket: _Ticket) -> None:
+        """Выдача места запросу"""
+        self.in_flight[ticket.user_id] = self.in_flight.get(ticket.user_id, 0) + 1
+        self.total_in_flight += 1
+        lane.in_flight += 1
+        lane.dispatched += 1
+
+        wait_time = time.monotonic() - ticket.enqueued_at
+        lane.wait_time_total += wait_time
+        lane.wait_time_max = max(lane.wait_time_max, wait_time)
+        ticket.granted.set_result(True)
+
+    def _dispatch_one(self) -> bool:
+        """Выдача одного места полосе с местом и готовым пользователем.
+
+        Взвешенный круговой обход (smooth weighted round-robin): каждая готовая полоса получает
+        кредит, равный весу, место достается полосе с наибольшим кредитом, и с нее списывается
+        сумма весов готовых полос. Из N мест полоса с весом w получает примерно N * w / сумма весов.
+        """
+        ready = []
+        for lane in self.lanes.values():
+            if not lane.queues or not self._lane_has_room(lane):
+                continue
+            user_id = next((user for user in lane.queues if self._can_run(user)), None)
+            if user_id is not None:
+                ready.append((lane, user_id))
+        if not ready:
+            return False
+
+        for lane, _ in ready:
+            lane.credit += lane.weight
+        lane, user_id = max(ready, key=lambda item: item[0].credit)
+        lane.credit -= sum(other.weight for other, _ in ready)
+
+        queue = lane.queues.pop(user_id)
+        self._grant(lane, queue.popleft())
+        # Пользователь уходит в конец круга
+        if queue:
+            lane.queues[user_id] = queue
+        return True
+
+    def _dispatch(self) -> None:
+        """Раздача свободных мест"""
+        while self.total_in_flight < self.max_concurrent and self._dispatch_one():
+            pass
+
+    def _release(self, ticket: _Ticket) -> None:
+        """Освобождение места"""
+        self.in_flight[ticket.user_id] -= 1
+        if not self.in_flight[ticket.user_id]:
+            del self.in_flight[ticket.user_id]
+        self.total_in_flight -= 1
+        self.lanes[ticket.lane].in_flight -= 1
+        self._dispatch()
+
+    def _remove(self, ticket: _Ticket) -> None:
+        """Удаление отмененного запроса из очереди"""
+        queues = self.lanes[ticket.lane].queues
+        queue = queues.get(ticket.user_id)
+        if queue is None:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del queues[ticket.user_id]
+
+    def position(self, ticket: _Ticket) -> int:
+        """Примерное место в очереди своей полосы (1 - следующий)"""
+        queues = self.lanes[ticket.lane].queues
+        users = list(queues)
+        index = users.index(ticket.user_id)
+        rank = queues[ticket.user_id].index(ticket)
+
+        # По кругу каждый пользователь отдает по одному запросу за проход:
+        # до нас успеют те, кто стоит раньше в круге, на rank + 1 проход, остальные - на rank
+        position = rank + 1
+        for i, user_id in enumerate(users):
+            if i != index:
+                position += min(len(queues[user_id]), rank + 1 if i < index else rank)
+        return position
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, lane: str = 'chat',
+                   on_queued: Optional[Callable[[int], Awaitable[Any]]] = None):
+        """Место для запроса пользователя в полосе lane; on_queued(позиция) вызывается, если пришлось встать в очередь"""
+        ticket = _Ticket(user_id, lane)
+        self._lane(lane).queues.setdefault(user_id, deque()).append(ticket)
+        self._dispatch()
+
+        if not ticket.granted.done():
+            self.queued += 1
+            try:
+                if on_queued:
+                    await on_queued(self.position(ticket))
+                await ticket.granted
+            except BaseException:
+                # Отмена могла совпасть с выдачей места - тогда возвращаем место
+                if ticket.granted.done() and not ticket.granted.cancelled():
+                    self._release(ticket)
+                else:
+                    self._remove(ticket)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика планировщика"""
+        lanes = {name: lane.get_stats() for name, lane in self.lanes.items()}
+        dispatched = sum(lane.dispatched for lane in self.lanes.values())
+        wait_time_total = sum(lane.wait_time_total for lane in self.lanes.values())
+        return {
+            'in_flight': self.total_in_flight,
+            'waiting': sum(lane['waiting'] for lane in lanes.values()),
+            'waiting_users': len({user for lane in self.lanes.values() for user in lane.queues}),
+            'dispatched': dispatched,
+            'queued': self.queued,
+            'avg_wait_time': wait_time_total / dispatched if dispatched else 0.0,
+            'max_wait_time': max(lane['max_wait_time'] for lane in lanes.values()),
+            'lanes': lanes
+        }
@@ -1,17 +1,37 @@
-import requests
+import aiohttp
+import asyncio
 import json
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Awaitable, Callable, List, Tuple
 import time
+from http_pool import HttpPool, shared_pool
+from replicate_client import ReplicateClient, ReplicateWebhookServer
+from huggingface_client import HuggingFaceClient
+from provider_result import ProviderResult, ErrorKind, parse_retry_after
+from context_builder import as_message
 
 class FreeAIServices:
     """Бесплатные ИИ сервисы для Telegram бота"""
     
-    def __init__(self):
+    def __init__(self, http_pool: HttpPool = None):
         self.huggingface_token = os.getenv('HUGGINGFACE_TOKEN')
         self.replicate_token = os.getenv('REPLICATE_TOKEN')
         self.cohere_token = os.getenv('COHERE_TOKEN')
         
+        # Общий пул соединений (keep-alive, DNS кэш)
+        self.http_pool = http_pool or shared_pool
+        
+        # Через сколько секунд без ответа запускать следующий сервис параллельно
+        self.hedge_delay = float(os.getenv('FREE_AI_HEDGE_DELAY', 3.0))
+        self.race_wins = {}
+        
+        # Hugging Face с учетом холодного старта моделей (503 + estimated_time)
+        self.huggingface = HuggingFaceClient(self.huggingface_token, http_pool=self.http_pool)
+        
+        # Replicate без блокировки: опрос с паузами или webhook на REPLICATE_WEBHOOK_URL
+        self.replicate = ReplicateClient(self.replicate_token, http_pool=self.http_pool)
+        self.replicate_webhook = ReplicateWebhookServer(self.replicate) if self.replicate.webhook_mode else None
+        
         # Счетчики для бесплатных лимитов
         self.request_counts = {
             'huggingface': 0,
@@ -31,6 +51,20 @@ class FreeAIServices:
             'image': 'stabilityai/stable-diffusion-2-1'
         }
     
+    async def start(self):
+        """Открытие пула соединений (и сервера webhook Replicate) при старте бота"""
+        await self.http_pool.start()
+        await self.huggingface.start()
+        if self.replicate_webhook:
+            await self.replicate_webhook.start()
+    
+    async def close(self):
+        """Закрытие пула соединений при остановке бота"""
+        if self.replicate_webhook:
+            await self.replicate_webhook.stop()
+        await self.huggingface.close()
+        await self.http_pool.close()
+    
     def _check_monthly_limit(self, service: str) -> bool:
         """Проверка месячного лимита запросов"""
         current_time = time.time()
@@ -53,33 +87,55 @@ class FreeAIServices:
         if service in self.request_counts:
             self.request_counts[service] += 1
     
-    async def generate_text_response(self, prompt: str, max_length: int = 500, model_type: str = 'auto') -> str:
-        """Генерация текстового ответа через бесплатные сервисы"""
+    async def generate_text_response(self, prompt: str, max_length: int = 500, model_type: str = 'auto') -> ProviderResult:
+        """Генерация текстового ответа через бесплатные сервисы.
         
-        # Попробуем Hugging Face (самый щедрый)
+        Hugging Face (самый щедрый) стартует первым, Cohere - через hedge_delay секунд
+        или сразу после ошибки Hugging Face. Берем первый хороший ответ, проигравшего отменяем.
+        """
+        calls = []
         if self.huggingface_token and self._check_monthly_limit('huggingface'):
-            try:
-                # Выбираем модель в зависимости от типа запроса
-                model = self._select_model_for_task(prompt, model_type)
-                response = self._huggingface_text_generation(prompt, max_length, model)
-                if response:
-                    self._increment_counter('huggingface')
-                    return response
-            except Exception as e:
-                print(f"Hugging Face ошибка: {e}")
-        
-        # Попробуем Cohere
+            # Выбираем модель в зависимости от типа запроса
+            model = self._select_model_for_task(prompt, model_type)
+            calls.append(('huggingface', lambda: self._huggingface_text_generation(prompt, max_length, model)))
         if self.cohere_token and self._check_monthly_limit('cohere'):
-            try:
-                response = self._cohere_text_generation(prompt, max_length)
-                if response:
-                    self._increment_counter('cohere')
-                    return response
-            except Exception as e:
-                print(f"Cohere ошибка: {e}")
+            calls.append(('cohere', lambda: self._cohere_text_generation(prompt, max_length)))
+        
+        result = await self._race(calls)
+        if result:
+            # Лимит расходуем только за победителя
+            self._increment_counter(result.provider)
+            self.race_wins[result.provider] = self.race_wins.get(result.provider, 0) + 1
+            return result
         
         # Fallback - простые правила
-        return self._simple_ai_response(prompt)
+        return ProviderResult.success(self._simple_ai_response(prompt), provider='rules')
+    
+    async def _race(self, calls: List[Tuple[str, Callable[[], Awaitable[ProviderResult]]]]) -> Optional[ProviderResult]:
+        """Гонка сервисов с задержкой запуска: первый успешный ответ или None, если все упали"""
+        waiting = list(calls)
+        running = {}
+        try:
+            while waiting or running:
+                if waiting:
+                    name, call = waiting.pop(0)
+                    running[asyncio.ensure_future(call())] = name
+                
+                # Пока есть запасные сервисы - ждем не дольше hedge_delay
+                done, _ = await asyncio.wait(
+                    running, timeout=self.hedge_delay if waiting else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    result = task.result()
+                    if result.ok:
+                        return result
+                    print(f"{name} ошибка: {result.error_message}")
+        finally:
+            for task in running:
+                task.cancel()
+        return None
     
     def _select_model_for_task(self, prompt: str, model_type: str = 'auto') -> str:
         """Выбор оптимальной модели для задачи"""
@@ -98,79 +154,48 @@ class FreeAIServices:
         else:
             return self.available_models['deepseek']  # По умолчанию DeepSeek
     
-    def _huggingface_text_generation(self, prompt: str, max_length: int, model: str = None) -> Optional[str]:
+    async def _huggingface_text_generation(self, prompt: str, max_length: int, model: str = None) -> ProviderResult:
         """Генерация текста через Hugging Face API"""
-        try:
-            if not model:
-                model = self.available_models['deepseek']
-            
-            url = f"https://api-inference.huggingface.co/models/{model}"
-            headers = {"Authorization": f"Bearer {self.huggingface_token}"}
-            
-            # Специальные параметры для разных моделей
-            if 'deepseek' in model:
-                # DeepSeek требует специальный формат
-                formatted_prompt = f"<|begin_of_sentence|>User: {prompt}<|end_of_sentence|>\n<|begin_of_sentence|>Assistant: "
-                payload = {
-                    "inputs": formatted_prompt,
-                    "parameters": {
-                        "max_new_tokens": max_length,
-                        "temperature": 0.7,
-                        "top_p": 0.95,
-                        "do_sample": True,
-                        "repetition_penalty": 1.1
-                    }
-                }
-            elif 'codellama' in model:
-                # CodeLlama формат
-                formatted_prompt = f"[INST] {prompt} [/INST]"
-                payload = {
-                    "inputs": formatted_prompt,
-                    "parameters": {
-                        "max_new_tokens": max_length,
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                        "do_sample": True
-                    }
-                }
-            else:
-                # Стандартный формат
-                payload = {
-                    "inputs": prompt,
-                    "parameters": {
-                        "max_length": max_length,
-                        "temperature": 0.7,
-                        "num_return_sequences": 1
-                    }
-                }
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    generated_text = result[0].get('generated_text', '')
-                    
-                    # Очистка ответа для DeepSeek
-                    if 'deepseek' in model:
-                        # Убираем промпт из ответа
-                        if formatted_prompt in generated_text:
-                            generated_text = generated_text.split(formatted_prompt)[-1]
-                        # Убираем теги
-                        generated_text = generated_text.replace('<|end_of_sentence|>', '').strip()
-                    
-                    return generated_text
-                return str(result)
-            else:
-                print(f"Hugging Face API ошибка: {response.status_code} для модели {model}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка Hugging Face: {e}")
-            return None
+        if not model:
+            model = self.available_models['deepseek']
+        
+        # Специальные параметры для разных моделей
+        if 'deepseek' in model:
+            # DeepSeek требует специальный формат
+            inputs = f"<|begin_of_sentence|>User: {prompt}<|end_of_sentence|>\n<|begin_of_sentence|>Assistant: "
+            parameters = {
+                "max_new_tokens": max_length,
+                "temperature": 0.7,
+                "top_p": 0.95,
+                "do_sample": True,
+                "repetition_penalty": 1.1
+            }
+        elif 'codellama' in model:
+            # CodeLlama формат
+            inputs = f"[INST] {prompt} [/INST]"
+            parameters = {
+                "max_new_tokens": max_length,
+                "temperature": 0.3,
+                "top_p": 0.9,
+                "do_sample": True
+            }
+        else:
+            # Стандартный формат
+            inputs = prompt
+            parameters = {
+                "max_new_tokens": max_length,
+                "temperature": 0.7,
+                "num_return_sequences": 1
+            }
+        
+        result = await self.huggingface.generate(model, inputs, parameters)
+        if result.ok:
+            result.content = result.content.replace('<|end_of_sentence|>', '').strip()
+        return result
     
-    def _cohere_text_generation(self, prompt: str, max_length: int) -> Optional[str]:
+    async def _cohere_text_generation(self, prompt: str, max_length: int) -> ProviderResult:
         """Генерация текста через Cohere API"""
+        started = time.monotonic()
         try:
             url = "https://api.cohere.ai/v1/generate"
             headers = {
@@ -185,18 +210,44 @@ class FreeAIServices:
                 "temperature": 0.7
             }
             
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            session = await self.http_pool.session()
+            async with session.post(url, headers=headers, json=payload, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                status = response.status
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                result = await response.json(content_type=None) if status == 200 else None
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('generations', [{}])[0].get('text', '')
+            if status == 200:
+                text = result.get('generations', [{}])[0].get('text', '')
+                if not text:
+                    return ProviderResult.failure(
+                        ErrorKind.EMPTY, "Cohere вернул пустой ответ.",
+                        status=200, latency=time.monotonic() - started,
+                        provider='cohere', model='command-light'
+                    )
+                return ProviderResult.success(
+                    text, status=200, latency=time.monotonic() - started,
+                    provider='cohere', model='command-light'
+                )
             else:
-                print(f"Cohere API ошибка: {response.status_code}")
-                return None
+                return ProviderResult.failure(
+                    ErrorKind.from_status(status),
+                    f"Cohere API ошибка: {status}",
+                    status=status,
+                    retry_after=retry_after,
+                    latency=time.monotonic() - started,
+                    provider='cohere', model='command-light'
+                )
                 
+        except asyncio.TimeoutError:
+            return ProviderResult.failure(
+                ErrorKind.TIMEOUT, "Превышено время ожидания Cohere",
+                latency=time.monotonic() - started, provider='cohere', model='command-light'
+            )
         except Exception as e:
-            print(f"Ошибка Cohere: {e}")
-            return None
+            return ProviderResult.failure(
+                ErrorKind.NETWORK, f"Ошибка Cohere: {e}",
+                latency=time.monotonic() - started, provider='cohere', model='command-light'
+            )
     
     def _simple_ai_response(self, prompt: str) -> str:
         """Простые ИИ ответы без API - с характером!"""
@@ -255,97 +306,68 @@ class FreeAIServices:
             import random
             return random.choice(responses)
     
-    async def generate_code(self, description: str, model_type: str = 'deepseek') -> str:
+    async def generate_code(self, description: str, model_type: str = 'deepseek') -> ProviderResult:
         """Генерация кода через бесплатные сервисы"""
         prompt = f"Напиши код на Python для следующей задачи: {description}. Код должен быть рабочим и содержать комментарии."
         
         # Попробуем Hugging Face с выбранной моделью
         if self.huggingface_token and self._check_monthly_limit('huggingface'):
             try:
-                response = self._huggingface_code_generation(prompt, model_type)
+                response = await self._huggingface_code_generation(prompt, model_type)
                 if response:
                     self._increment_counter('huggingface')
-                    return response
+                    return ProviderResult.success(response, provider='huggingface')
             except Exception as e:
                 print(f"Ошибка генерации кода: {e}")
         
         # Fallback - простые примеры кода
-        return self._simple_code_examples(description)
+        return ProviderResult.success(self._simple_code_examples(description), provider='rules')
     
-    def _huggingface_code_generation(self, prompt: str, model_type: str = 'deepseek') -> Optional[str]:
+    async def _huggingface_code_generation(self, prompt: str, model_type: str = 'deepseek') -> Optional[str]:
         """Генерация кода через Hugging Face"""
-        try:
-            # Выбираем модель для генерации кода
-            if model_type == 'deepseek':
-                model = self.available_models['deepseek']
-            elif model_type == 'codellama':
-                model = self.available_models['codellama']
-            elif model_type == 'wizardcoder':
-                model = self.available_models['wizardcoder']
-            elif model_type == 'phind':
-                model = self.available_models['phind']
-            else:
-                model = self.available_models['deepseek']
-            
-            url = f"https://api-inference.huggingface.co/models/{model}"
-            headers = {"Authorization": f"Bearer {self.huggingface_token}"}
-            
-            # Специальный формат для генерации кода
-            if 'deepseek' in model:
-                formatted_prompt = f"<|begin_of_sentence|>User: {prompt}<|end_of_sentence|>\n<|begin_of_sentence|>Assistant: "
-                payload = {
-                    "inputs": formatted_prompt,
-                    "parameters": {
-                        "max_new_tokens": 1000,
-                        "temperature": 0.2,  # Низкая температура для точного кода
-                        "top_p": 0.95,
-                        "do_sample": True,
-                        "repetition_penalty": 1.1
-                    }
-                }
-            elif 'codellama' in model:
-                formatted_prompt = f"[INST] {prompt} [/INST]"
-                payload = {
-                    "inputs": formatted_prompt,
-                    "parameters": {
-                        "max_new_tokens": 1000,
-                        "temperature": 0.2,
-                        "top_p": 0.9,
-                        "do_sample": True
-                    }
-                }
-            else:
-                payload = {
-                    "inputs": prompt,
-                    "parameters": {
-                        "max_length": 1000,
-                        "temperature": 0.3,
-                        "num_return_sequences": 1
-                    }
-                }
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    generated_text = result[0].get('generated_text', '')
-                    
-                    # Очистка ответа
-                    if 'deepseek' in model:
-                        if formatted_prompt in generated_text:
-                            generated_text = generated_text.split(formatted_prompt)[-1]
-                        generated_text = generated_text.replace('<|end_of_sentence|>', '').strip()
-                    
-                    return generated_text
-                return str(result)
-            else:
-                print(f"Ошибка генерации кода: {response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка генерации кода: {e}")
+        # Выбираем модель для генерации кода
+        if model_type == 'deepseek':
+            model = self.available_models['deepseek']
+        elif model_type == 'codellama':
+            model = self.available_models['codellama']
+        elif model_type == 'wizardcoder':
+            model = self.available_models['wizardcoder']
+        elif model_type == 'phind':
+            model = self.available_models['phind']
+        else:
+            model = self.available_models['deepseek']
+        
+        # Специальный формат для генерации кода
+        if 'deepseek' in model:
+            inputs = f"<|begin_of_sentence|>User: {prompt}<|end_of_sentence|>\n<|begin_of_sentence|>Assistant: "
+            parameters = {
+                "max_new_tokens": 1000,
+                "temperature": 0.2,  # Низкая температура для точного кода
+                "top_p": 0.95,
+                "do_sample": True,
+                "repetition_penalty": 1.1
+            }
+        elif 'codellama' in model:
+            inputs = f"[INST] {prompt} [/INST]"
+            parameters = {
+                "max_new_tokens": 1000,
+                "temperature": 0.2,
+                "top_p": 0.9,
+                "do_sample": True
+            }
+        else:
+            inputs = prompt
+            parameters = {
+                "max_new_tokens": 1000,
+                "temperature": 0.3,
+                "num_return_sequences": 1
+            }
+        
+        result = await self.huggingface.generate(model, inputs, parameters)
+        if not result.ok:
+            print(f"Ошибка генерации кода: {result.error_message}")
             return None
+        return result.content.replace('<|end_of_sentence|>', '').strip()
     
     def _simple_code_examples(self, description: str) -> str:
         """Простые примеры кода без API - с характером!"""
@@ -439,7 +461,7 @@ print("Вот тебе пример, братан!")
         # Попробуем Hugging Face Stable Diffusion
         if self.huggingface_token and self._check_monthly_limit('huggingface'):
             try:
-                response = self._huggingface_image_generation(prompt)
+                response = await self._huggingface_image_generation(prompt)
                 if response:
                     self._increment_counter('huggingface')
                     return response
@@ -449,7 +471,7 @@ print("Вот тебе пример, братан!")
         # Попробуем Replicate
         if self.replicate_token and self._check_monthly_limit('replicate'):
             try:
-                response = self._replicate_image_generation(prompt)
+                response = await self._replicate_image_generation(prompt)
                 if response:
                     self._increment_counter('replicate')
                     return response
@@ -458,110 +480,53 @@ print("Вот тебе пример, братан!")
         
         return None
     
-    async def chat_response(self, message: str, conversation_history: list = None, model_type: str = 'deepseek') -> str:
+    async def chat_response(self, message: str, conversation_history: list = None, model_type: str = 'deepseek') -> ProviderResult:
         """Генерация ответа для чата с учетом истории"""
         try:
             # Формируем контекст с историей
             if conversation_history and len(conversation_history) > 0:
                 # Берем последние 5 сообщений для контекста
-                recent_history = conversation_history[-5:]
-                context = "\n".join([f"User: {msg}" for msg in recent_history])
+                recent_history = [as_message(turn) for turn in conversation_history[-5:]]
+                context = "\n".join([
+                    f"{'Assistant' if msg['role'] == 'assistant' else 'User'}: {msg['content']}" for msg in recent_history
+                ])
                 full_prompt = f"{context}\nUser: {message}\nAssistant:"
             else:
                 full_prompt = f"User: {message}\nAssistant:"
             
             # Генерируем ответ через выбранную модель
-            response = await self.generate_text_response(full_prompt, max_length=500, model_type=model_type)
+            result = await self.generate_text_response(full_prompt, max_length=500, model_type=model_type)
             
-            if response:
-                return response
+            if result.ok and result.content:
+                return result
             else:
-                return "Извините, не удалось сгенерировать ответ. Попробуйте переформулировать вопрос."
+                return ProviderResult.failure(
+                    ErrorKind.EMPTY,
+                    "Извините, не удалось сгенерировать ответ. Попробуйте переформулировать вопрос."
+                )
                 
         except Exception as e:
             print(f"Ошибка в чате: {e}")
-            return "Произошла ошибка при обработке сообщения. Попробуйте позже."
+            return ProviderResult.failure(
+                ErrorKind.BAD_RESPONSE,
+                "Произошла ошибка при обработке сообщения. Попробуйте позже."
+            )
     
-    def _huggingface_image_generation(self, prompt: str) -> Optional[bytes]:
+    async def _huggingface_image_generation(self, prompt: str) -> Optional[bytes]:
         """Генерация изображения через Hugging Face"""
-        try:
-            url = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-2-1"
-            headers = {"Authorization": f"Bearer {self.huggingface_token}"}
-            
-            payload = {"inputs": prompt}
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                return response.content
-            else:
-                print(f"Hugging Face изображение ошибка: {response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка Hugging Face изображения: {e}")
-            return None
+        return await self.huggingface.image_generation(prompt, self.available_models['image'])
     
-    def _replicate_image_generation(self, prompt: str) -> Optional[bytes]:
-        """Генерация изображения через Replicate"""
+    async def _replicate_image_generation(self, prompt: str) -> Optional[bytes]:
+        """Генерация изображения через Replicate (ожидание не блокирует бота)"""
         try:
-            url = "https://api.replicate.com/v1/predictions"
-            headers = {
-                "Authorization": f"Token {self.replicate_token}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "version": "db21e45d3f7023abc2a46ee38a23973f6dce16bb082a930b0c49861f96d1e5bf",
-                "input": {"prompt": prompt}
-            }
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code == 201:
-                # Replicate работает асинхронно, нужно ждать
-                prediction_id = response.json()['id']
-                return self._wait_for_replicate_result(prediction_id)
-            else:
-                print(f"Replicate ошибка: {response.status_code}")
-                return None
-                
-        except Exception as e:
+            return await self.replicate.run(
+                "db21e45d3f7023abc2a46ee38a23973f6dce16bb082a930b0c49861f96d1e5bf",
+                {"prompt": prompt}
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f"Ошибка Replicate: {e}")
             return None
     
-    def _wait_for_replicate_result(self, prediction_id: str) -> Optional[bytes]:
-        """Ожидание результата от Replicate"""
-        try:
-            url = f"https://api.replicate.com/v1/predictions/{prediction_id}"
-            headers = {"Authorization": f"Token {self.replicate_token}"}
-            
-            for _ in range(30):  # Ждем максимум 30 секунд
-                response = requests.get(url, headers=headers)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    status = result.get('status')
-                    
-                    if status == 'succeeded':
-                        image_url = result.get('output', [None])[0]
-                        if image_url:
-                            img_response = requests.get(image_url, timeout=30)
-                            if img_response.status_code == 200:
-                                return img_response.content
-                        break
-                    elif status == 'failed':
-                        print("Replicate генерация изображения не удалась")
-                        break
-                
-                time.sleep(1)  # Ждем 1 секунду перед следующей проверкой
-            
-            return None
-            
-        except Exception as e:
-            print(f"Ошибка ожидания Replicate: {e}")
-            return None
-    
     def get_available_models(self) -> Dict[str, str]:
         """Получение списка доступных моделей"""
         return self.available_models.copy()
@@ -575,5 +540,8 @@ print("Вот тебе пример, братан!")
             'huggingface_limit': 30000,
             'replicate_limit': 500,
             'cohere_limit': 1000,
+            'race_wins': dict(self.race_wins),
+            'replicate': self.replicate.get_stats(),
+            'huggingface': self.huggingface.get_stats(),
             'available_models': list(self.available_models.keys())
         }
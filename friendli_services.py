@@ -1,19 +1,36 @@
+import aiohttp
+import asyncio
 import requests
 import json
 import os
 from typing import Optional, Dict, Any
 import time
+from http_pool import HttpPool, shared_pool
+from provider_result import ProviderResult, ErrorKind, parse_retry_after
+from retry_policy import RetryPolicy
+from admission import AdmissionControl
+from context_builder import ContextBuilder, CHAT_SYSTEM_PROMPT, summary_messages
 
 class FriendliServices:
     """Friendli.ai API сервисы для Telegram бота с Qwen3 Highlights"""
     
-    def __init__(self):
+    def __init__(self, http_pool: HttpPool = None):
         self.api_key = os.getenv('FRIENDLI_API_KEY')
         self.base_url = "https://api.friendli.ai/dedicated"
         self.endpoint_id = "depvrmat8854w9c"  # Ваш реальный Endpoint ID
         # Формируем полный URL с endpoint ID
         self.full_url = f"{self.base_url}/{self.endpoint_id}"
         
+        # Общий пул соединений (тот же, что у OpenRouter)
+        self.http_pool = http_pool or shared_pool
+        
+        # Повторы 429/502/503/504 с общим бюджетом повторов на процесс
+        self.retry_policy = RetryPolicy()
+        
+        # Сами ограничиваем поток запросов, не дожидаясь 429 от провайдера
+        self.admission = AdmissionControl('friendli')
+        self.context_builder = ContextBuilder()  # Контекст чата в бюджет токенов
+        
         # Доступные модели Friendli.ai
         self.available_models = {
             'qwen3_highlights': 'Qwen3 Highlights',  # Основная модель
@@ -34,6 +51,14 @@ class FriendliServices:
             'total_requests': 5000      # Общий лимит
         }
     
+    async def start(self):
+        """Открытие пула соединений при старте бота"""
+        await self.http_pool.start()
+    
+    async def close(self):
+        """Закрытие пула соединений при остановке бота"""
+        await self.http_pool.close()
+    
     def _check_daily_limit(self, model_type: str = 'qwen3_highlights') -> bool:
         """Проверка дневного лимита запросов"""
         current_time = time.time()
@@ -54,63 +79,123 @@ class FriendliServices:
             self.request_counts['qwen3_highlights'] += 1
         self.request_counts['total_requests'] += 1
     
-    async def generate_text_response(self, prompt: str, max_tokens: int = 2000, model: str = 'qwen3_highlights') -> str:
-        """Генерация текстового ответа через Friendli.ai API"""
-        
+    def _headers(self) -> Dict[str, str]:
+        """Заголовки запросов к Friendli.ai"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+    
+    def _check_request(self, model: str) -> Optional[ProviderResult]:
+        """Проверка ключа и дневного лимита перед запросом (None - можно отправлять)"""
         if not self.api_key:
-            return "❌ Friendli.ai API ключ не настроен. Добавьте FRIENDLI_API_KEY в .env файл."
+            return ProviderResult.failure(
+                ErrorKind.CONFIG,
+                "Friendli.ai API ключ не настроен. Добавьте FRIENDLI_API_KEY в .env файл.",
+                provider='friendli', model=model
+            )
         
-        # Проверяем лимиты
         if not self._check_daily_limit(model):
-            return f"❌ Достигнут дневной лимит для модели {model}. Попробуйте завтра."
+            return ProviderResult.failure(
+                ErrorKind.QUOTA,
+                f"Достигнут дневной лимит для модели {model}. Попробуйте завтра.",
+                provider='friendli', model=model
+            )
+        
+        return None
+    
+    async def _post_completion(self, payload: Dict[str, Any], model: str) -> ProviderResult:
+        """Один запрос к /v1/chat/completions выделенного endpoint"""
+        started = time.monotonic()
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "qwen3-highlights",  # Используем Qwen3 Highlights
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "stream": False
-            }
-            
-            response = requests.post(
+            session = await self.http_pool.session()
+            async with self.admission.slot(model) as admitted, session.post(
                 f"{self.full_url}/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
+                headers=self._headers(),
+                json=payload
+            ) as response:
+                admitted.respond(response.status)
+                if response.status != 200:
+                    error_msg = f"Friendli.ai API ошибка: {response.status}"
+                    response_text = await response.text()
+                    if response_text:
+                        try:
+                            error_data = json.loads(response_text)
+                            error_msg += f" - {error_data.get('error', {}).get('message', '')}"
+                        except:
+                            error_msg += f" - {response_text[:100]}"
+                    
+                    return ProviderResult.failure(
+                        ErrorKind.from_status(response.status),
+                        error_msg,
+                        status=response.status,
+                        retry_after=parse_retry_after(response.headers.get('Retry-After')),
+                        latency=time.monotonic() - started,
+                        provider='friendli',
+                        model=model
+                    )
+                
+                result = await response.json()
                 content = result['choices'][0]['message']['content']
                 
                 # Увеличиваем счетчик
                 self._increment_counter(model)
                 
-                return content
-            else:
-                error_msg = f"Friendli.ai API ошибка: {response.status_code}"
-                if response.text:
-                    try:
-                        error_data = response.json()
-                        error_msg += f" - {error_data.get('error', {}).get('message', '')}"
-                    except:
-                        error_msg += f" - {response.text[:100]}"
+                if not content:
+                    return ProviderResult.failure(
+                        ErrorKind.EMPTY, "Модель вернула пустой ответ.",
+                        status=response.status, latency=time.monotonic() - started,
+                        provider='friendli', model=model
+                    )
                 
-                return f"❌ {error_msg}"
+                return ProviderResult.success(
+                    content,
+                    status=response.status,
+                    latency=time.monotonic() - started,
+                    usage=result.get('usage') or {},
+                    model=model,
+                    provider='friendli'
+                )
                 
-        except Exception as e:
-            return f"❌ Ошибка при обращении к Friendli.ai: {str(e)}"
+        except asyncio.TimeoutError:
+            return ProviderResult.failure(
+                ErrorKind.TIMEOUT, "Превышено время ожидания ответа Friendli.ai",
+                latency=time.monotonic() - started, provider='friendli', model=model
+            )
+        except aiohttp.ClientError as e:
+            return ProviderResult.failure(
+                ErrorKind.NETWORK, f"Ошибка при обращении к Friendli.ai: {str(e)}",
+                latency=time.monotonic() - started, provider='friendli', model=model
+            )
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return ProviderResult.failure(
+                ErrorKind.BAD_RESPONSE, f"Некорректный ответ Friendli.ai: {str(e)}",
+                latency=time.monotonic() - started, provider='friendli', model=model
+            )
     
-    async def generate_code(self, description: str, model: str = 'qwen3_highlights') -> str:
+    async def generate_text_response(self, prompt: str, max_tokens: int = 2000, model: str = 'qwen3_highlights') -> ProviderResult:
+        """Генерация текстового ответа через Friendli.ai API"""
+        
+        # Проверяем ключ и лимиты
+        rejected = self._check_request(model)
+        if rejected:
+            return rejected
+        
+        payload = {
+            "model": "qwen3-highlights",  # Используем Qwen3 Highlights
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "stream": False
+        }
+        
+        return await self.retry_policy.run(lambda: self._post_completion(payload, model))
+    
+    async def generate_code(self, description: str, model: str = 'qwen3_highlights') -> ProviderResult:
         """Генерация кода через Friendli.ai API"""
         prompt = f"""Напиши полноценный, рабочий код на Python для следующей задачи: {description}
 
@@ -131,7 +216,7 @@ class FriendliServices:
 
         return await self.generate_text_response(prompt, max_tokens=3000, model=model)
     
-    async def solve_problem(self, problem: str, model: str = 'qwen3_highlights') -> str:
+    async def solve_problem(self, problem: str, model: str = 'qwen3_highlights') -> ProviderResult:
         """Решение задач через Friendli.ai API"""
         prompt = f"""Реши следующую задачу: {problem}
 
@@ -146,7 +231,7 @@ class FriendliServices:
 
         return await self.generate_text_response(prompt, max_tokens=2500, model=model)
     
-    async def search_information(self, query: str, model: str = 'qwen3_highlights') -> str:
+    async def search_information(self, query: str, model: str = 'qwen3_highlights') -> ProviderResult:
         """Поиск информации через Friendli.ai API"""
         prompt = f"""Найди и проанализируй информацию по запросу: {query}
 
@@ -161,60 +246,32 @@ class FriendliServices:
 
         return await self.generate_text_response(prompt, max_tokens=2000, model=model)
     
-    async def chat_response(self, message: str, conversation_history: list = None, model: str = 'qwen3_highlights') -> str:
-        """Генерация ответа для чата с учетом истории"""
-        try:
-            # Формируем контекст с историей
-            messages = []
-            
-            if conversation_history and len(conversation_history) > 0:
-                # Берем последние 5 сообщений для контекста
-                recent_history = conversation_history[-5:]
-                for msg in recent_history:
-                    messages.append({"role": "user", "content": msg})
-            
-            messages.append({"role": "user", "content": message})
-            
-            if not self.api_key:
-                return "❌ Friendli.ai API ключ не настроен."
-            
-            # Проверяем лимиты
-            if not self._check_daily_limit(model):
-                return f"❌ Достигнут дневной лимит для модели {model}."
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "qwen3-highlights",
-                "messages": messages,
-                "max_tokens": 2000,
-                "temperature": 0.7,
-                "stream": False
-            }
-            
-            response = requests.post(
-                f"{self.full_url}/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                
-                # Увеличиваем счетчик
-                self._increment_counter(model)
-                
-                return content
-            else:
-                return f"❌ Ошибка API: {response.status_code}"
-                
-        except Exception as e:
-            return f"❌ Ошибка в чате: {str(e)}"
+    async def chat_response(self, message: str, conversation_history: list = None, model: str = 'qwen3_highlights',
+                            summary: str = None, system_prompt: str = None) -> ProviderResult:
+        """Генерация ответа для чата с учетом истории и сводки более ранней части разговора"""
+        # Шаблон один раз в системном промпте, дальше - свежие реплики в бюджет токенов модели
+        messages = self.context_builder.build(
+            message, conversation_history, model=model,
+            system_prompt=system_prompt or CHAT_SYSTEM_PROMPT,
+            prefix=summary_messages(summary)
+        )
+        
+        # Проверяем ключ и лимиты
+        rejected = self._check_request(model)
+        if rejected:
+            return rejected
+        
+        payload = {
+            "model": "qwen3-highlights",
+            "messages": messages,
+            "max_tokens": 2000,
+            "temperature": 0.7,
+            "stream": False
+        }
+        
+        result = await self.retry_policy.run(lambda: self._post_completion(payload, model))
+        self.context_builder.record_usage(result.usage)
+        return result
     
     def get_available_models(self) -> Dict[str, str]:
         """Получение списка доступных моделей"""
@@ -228,6 +285,8 @@ class FriendliServices:
             'qwen3_highlights_limit': self.daily_limits['qwen3_highlights'],
             'total_requests_limit': self.daily_limits['total_requests'],
             'available_models': list(self.available_models.keys()),
+            'admission': self.admission.get_stats(),
+            'context': self.context_builder.get_stats(),
             'reset_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_reset))
         }
     
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+
+class FirstTokenTracker:
+    """Время до первого токена по моделям: скользящее окно и перцентиль для дедлайна хеджирования"""
+
+    def __init__(self, window: int = 100, min_samples: int = 20, percentile: float = 0.9,
+                 default_deadline: float = 8.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.default_deadline = default_deadline
+        self.samples: Dict[str, deque] = {}
+
+    def record(self, model_id: str, latency: float) -> None:
+        """Учет времени до первого токена"""
+        if model_id not in self.samples:
+            self.samples[model_id] = deque(maxlen=self.window)
+        self.samples[model_id].append(latency)
+
+    def deadline(self, model_id: str) -> float:
+        """Сколько ждать первый токен до хеджа (p90; пока мало данных - значение по умолчанию)"""
+        samples = self.samples.get(model_id)
+        if not samples or len(samples) < self.min_samples:
+            return self.default_deadline
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Дедлайны и число замеров по моделям"""
+        return {
+            model_id: {'deadline': self.deadline(model_id), 'samples': len(samples)}
+            for model_id, samples in self.samples.items()
+        }
+
+
+async def wait_first_token(racers: Dict[asyncio.Task, asyncio.Event], timeout: float = None) -> Optional[asyncio.Task]:
+    """Ждет первый токен от любого участника гонки.
+
+    Возвращает задачу, первой получившую токен, или None - если истек timeout
+    или все участники завершились без единого токена.
+    """
+    waiters = {asyncio.ensure_future(event.wait()) for event in racers.values()}
+    pending = waiters | set(racers)
+    deadline_at = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while True:
+            for task, event in racers.items():
+                if event.is_set():
+                    return task
+            if all(task.done() for task in racers):
+                return None
+
+            remaining = None if deadline_at is None else deadline_at - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                return None
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+def cancel_all(tasks: Iterable[asyncio.Task]) -> None:
+    """Отмена проигравших участников гонки"""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
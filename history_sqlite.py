@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class SqliteColdTier:
+    """Холодный уровень истории диалогов в SQLite (WAL).
+
+    Все обращения к базе идут через один выделенный поток - цикл событий не блокируется.
+    Записи копятся в pending и уходят пачкой в одной транзакции (раз в flush_interval
+    или при накоплении batch_size); повторная выгрузка одного пользователя до записи
+    заменяет предыдущую, а не добавляет еще одну. Сводка старой части диалога хранится
+    в той же строке, что и реплики, и пишется вместе с ними.
+    """
+
+    def __init__(self, path: str, batch_size: int = None, flush_interval: float = None, ttl: float = None):
+        self.path = path
+        self.batch_size = batch_size or int(os.getenv('HISTORY_DB_BATCH', 100))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('HISTORY_DB_FLUSH_INTERVAL', 1.0))
+        self.ttl = ttl or float(os.getenv('HISTORY_TTL', 24 * 3600))
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-db')
+        self.conn: Optional[sqlite3.Connection] = None
+
+        # user_id -> (JSON истории, время последней активности, сводка) или None - удалить
+        self.pending: Dict[str, Optional[Tuple[str, float, Optional[str]]]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+        self.stats = {'batches': 0, 'rows_written': 0, 'bytes_written': 0, 'reads': 0, 'read_hits': 0}
+
+    async def _run(self, func, *args):
+        """Выполнение в потоке базы"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def start(self) -> None:
+        """Открытие базы"""
+        if self.conn is None:
+            await self._run(self._open)
+
+    def _open(self) -> None:
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # В WAL режиме NORMAL не теряет целостность, только последние транзакции при сбое питания
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "user_id TEXT PRIMARY KEY, turns TEXT NOT NULL, last_seen REAL NOT NULL, summary TEXT)"
+        )
+        # Базы, созданные до появления сводок
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(history)")}
+        if 'summary' not in columns:
+            self.conn.execute("ALTER TABLE history ADD COLUMN summary TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS history_last_seen ON history (last_seen)")
+        self.conn.commit()
+
+    async def close(self) -> None:
+        """Запись всего накопленного и закрытие базы"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_task:
+            await self._flush_task
+        await self.flush()
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+        self.executor.shutdown(wait=True)
+
+    def spill(self, user_id: Hashable, turns: List[Any], last_seen: float, summary: Optional[str] = None) -> None:
+        """Выгрузка истории пользователя (last_seen - время по time.time())"""
+        self.pending[str(user_id)] = (json.dumps(turns, ensure_ascii=False), last_seen, summary)
+        self._schedule_flush()
+
+    def delete(self, user_id: Hashable) -> None:
+        """Удаление истории пользователя"""
+        self.pending[str(user_id)] = None
+        self._schedule_flush()
+
+    async def load(self, user_id: Hashable) -> Optional[Tuple[List[Any], float, Optional[str]]]:
+        """История пользователя, время его последней активности и сводка (None - нет или устарела)"""
+        key = str(user_id)
+        self.stats['reads'] += 1
+        if key in self.pending:
+            entry = self.pending[key]
+        else:
+            entry = await self._run(self._read, key)
+        if entry is None:
+            return None
+
+        turns, last_seen, summary = entry
+        if time.time() - last_seen > self.ttl:
+            return None
+        self.stats['read_hits'] += 1
+        return json.loads(turns), last_seen, summary
+
+    def _read(self, key: str) -> Optional[Tuple[str, float, Optional[str]]]:
+        return self.conn.execute(
+            "SELECT turns, last_seen, summary FROM history WHERE user_id = ?", (key,)
+        ).fetchone()
+
+    def _schedule_flush(self) -> None:
+        """Запись пачкой: сразу при batch_size записей, иначе через flush_interval"""
+        if len(self.pending) >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        # Идущая запись заберет новые записи сама
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Запись накопленного, пока есть что писать"""
+        while self.pending and self.conn is not None:
+            batch, self.pending = self.pending, {}
+            await self._run(self._write, batch)
+
+    def _write(self, batch: Dict[str, Optional[Tuple[str, float, Optional[str]]]]) -> None:
+        """Одна транзакция на пачку"""
+        upserts = [(key, *entry) for key, entry in batch.items() if entry is not None]
+        deletes = [(key,) for key, entry in batch.items() if entry is None]
+
+        with self.conn:
+            if upserts:
+                self.conn.executemany(
+                    "INSERT INTO history (user_id, turns, last_seen, summary) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET turns = excluded.turns, last_seen = excluded.last_seen, "
+                    "summary = excluded.summary",
+                    upserts
+                )
+            if deletes:
+                self.conn.executemany("DELETE FROM history WHERE user_id = ?", deletes)
+
+            # Устаревшие истории чистим не чаще раза в минуту
+            now = time.time()
+            if now - self._last_purge > 60:
+                self._last_purge = now
+                self.conn.execute("DELETE FROM history WHERE last_seen < ?", (now - self.ttl,))
+
+        self.stats['batches'] += 1
+        self.stats['rows_written'] += len(batch)
+        self.stats['bytes_written'] += sum(
+            len(turns.encode('utf-8')) + len((summary or '').encode('utf-8')) for _, turns, _, summary in upserts
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика холодного уровня"""
+        return {**self.stats, 'pending': len(self.pending)}
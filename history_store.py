@@ -0,0 +1,287 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, List, Optional
+
+from history_sqlite import SqliteColdTier
+
+# Примерные накладные расходы Python на одну запись истории (объект строки/словаря, ссылка в deque)
+TURN_OVERHEAD = 64
+
+
+def turn_size(turn: Any) -> int:
+    """Примерный размер записи в байтах: текст в UTF-8 + накладные расходы"""
+    if isinstance(turn, dict):
+        return TURN_OVERHEAD + sum(len(str(value).encode('utf-8')) for value in turn.values())
+    return TURN_OVERHEAD + len(str(turn).encode('utf-8'))
+
+
+class _UserHistory:
+    """История одного пользователя и сводка ее сжатой части"""
+
+    __slots__ = ('turns', 'size', 'last_seen', 'summary')
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Any] = deque(maxlen=max_turns)
+        self.size = 0
+        self.last_seen = time.monotonic()
+        self.summary: Optional[str] = None
+
+
+class HistoryStore:
+    """Ограниченная история диалогов: не больше max_turns записей на пользователя,
+    не больше max_bytes на всех, давно неактивные пользователи забываются (TTL),
+    при нехватке бюджета вытесняются те, кто писал давнее всех (LRU).
+
+    С холодным уровнем (SQLite) пользователи, молчащие дольше spill_after, и вытесненные
+    по бюджету не забываются, а выгружаются на диск и подгружаются при следующем сообщении.
+    Сводка сжатой части диалога хранится вместе с репликами: сжатые реплики и их сводка
+    всегда сохраняются и теряются только вместе.
+    """
+
+    def __init__(self, max_turns: int = None, max_bytes: int = None, ttl: float = None,
+                 spill_after: float = None, cold_tier: SqliteColdTier = None):
+        self.max_turns = max_turns or int(os.getenv('HISTORY_MAX_TURNS', 10))
+        self.max_bytes = max_bytes or int(os.getenv('HISTORY_MAX_BYTES', 50 * 1024 * 1024))
+        self.ttl = ttl or float(os.getenv('HISTORY_TTL', 24 * 3600))
+        self.spill_after = spill_after or float(os.getenv('HISTORY_SPILL_AFTER', 600))
+
+        # HISTORY_DB_PATH= (пусто) - только память
+        if cold_tier is None:
+            path = os.getenv('HISTORY_DB_PATH', 'history.db')
+            cold_tier = SqliteColdTier(path, ttl=self.ttl) if path else None
+        self.cold = cold_tier
+
+        # Порядок - от давно неактивных к недавним: и TTL, и LRU снимают записи с начала
+        self.users: 'OrderedDict[Hashable, _UserHistory]' = OrderedDict()
+        self.total_bytes = 0
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+        self.cold_loads = 0
+        self.appended_bytes = 0
+
+    async def start(self) -> None:
+        """Открытие холодного уровня и запуск фоновой выгрузки молчащих пользователей"""
+        if self.cold is None:
+            return
+        await self.cold.start()
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        """Выгрузка всех пользователей на диск - история переживает перезапуск"""
+        if self.cold is None:
+            return
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        while self.users:
+            self._spill(next(iter(self.users)))
+        await self.cold.close()
+
+    async def get(self, user_id: Hashable) -> List[Any]:
+        """История пользователя (копия, от старых к новым)"""
+        await self._ensure_hot(user_id)
+        self._expire()
+        history = self.users.get(user_id)
+        if history is None:
+            return []
+        self._touch(user_id, history)
+        return list(history.turns)
+
+    async def append(self, user_id: Hashable, turn: Any) -> None:
+        """Добавление записи; самая старая запись сверх max_turns выпадает"""
+        await self._ensure_hot(user_id)
+        self._expire()
+        history = self.users.get(user_id)
+        if history is None:
+            history = self.users[user_id] = _UserHistory(self.max_turns)
+        self._touch(user_id, history)
+
+        if len(history.turns) == history.turns.maxlen:
+            self._drop_oldest(history)
+        size = turn_size(turn)
+        history.turns.append(turn)
+        history.size += size
+        self.total_bytes += size
+        self.appended_bytes += size
+
+        self._enforce_budget(user_id, history)
+
+    async def get_summary(self, user_id: Hashable) -> Optional[str]:
+        """Сводка сжатой части диалога пользователя"""
+        await self._ensure_hot(user_id)
+        history = self.users.get(user_id)
+        return history.summary if history is not None else None
+
+    async def trim_prefix(self, user_id: Hashable, turns: List[Any], summary: str) -> int:
+        """Замена записей в начале истории, совпадающих с turns, на их сводку.
+
+        Пока шло сжатие, часть этих записей могла выпасть сама (лимит max_turns) -
+        удаляется только то, что еще осталось. Возвращает число удаленных записей.
+        """
+        await self._ensure_hot(user_id)
+        history = self.users.get(user_id)
+        if history is None:
+            return 0
+
+        current = list(history.turns)
+        removed = 0
+        for start in range(len(turns)):
+            remaining = turns[start:]
+            if current[:len(remaining)] == remaining:
+                for _ in remaining:
+                    self._drop_oldest(history)
+                removed = len(remaining)
+                break
+        self._set_summary(history, summary)
+        return removed
+
+    def clear(self, user_id: Hashable) -> None:
+        """Забыть историю пользователя (в том числе на диске)"""
+        self._forget(user_id)
+        if self.cold is not None:
+            self.cold.delete(user_id)
+
+    def __contains__(self, user_id: Hashable) -> bool:
+        return user_id in self.users
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    async def _ensure_hot(self, user_id: Hashable) -> None:
+        """Подгрузка выгруженного пользователя; одновременные сообщения ждут одну загрузку"""
+        if self.cold is None or user_id in self.users:
+            return
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = self._loading[user_id] = asyncio.ensure_future(self._load_cold(user_id))
+            loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        await asyncio.shield(loading)
+
+    async def _load_cold(self, user_id: Hashable) -> None:
+        """Перенос истории из SQLite в память"""
+        entry = await self.cold.load(user_id)
+        if entry is None:
+            return
+        turns, _, summary = entry
+        self.cold_loads += 1
+
+        # Пока шла загрузка, пользователь мог появиться в памяти - его новые записи идут после старых
+        history = self.users.pop(user_id, None)
+        if history is not None:
+            self.total_bytes -= history.size
+            turns = turns + list(history.turns)
+            summary = history.summary or summary
+
+        history = self.users[user_id] = _UserHistory(self.max_turns)
+        for turn in turns[-self.max_turns:]:
+            history.turns.append(turn)
+            history.size += turn_size(turn)
+        self.total_bytes += history.size
+        self._set_summary(history, summary)
+        self._enforce_budget(user_id, history)
+
+    def _touch(self, user_id: Hashable, history: _UserHistory) -> None:
+        """Пользователь активен - в конец очереди на вытеснение"""
+        history.last_seen = time.monotonic()
+        self.users.move_to_end(user_id)
+
+    def _drop_oldest(self, history: _UserHistory) -> None:
+        """Удаление самой старой записи пользователя"""
+        size = turn_size(history.turns.popleft())
+        history.size -= size
+        self.total_bytes -= size
+
+    def _set_summary(self, history: _UserHistory, summary: Optional[str]) -> None:
+        """Замена сводки с учетом ее размера в бюджете"""
+        size = len(summary.encode('utf-8')) if summary else 0
+        old_size = len(history.summary.encode('utf-8')) if history.summary else 0
+        history.summary = summary
+        history.size += size - old_size
+        self.total_bytes += size - old_size
+
+    def _forget(self, user_id: Hashable) -> Optional[_UserHistory]:
+        """Удаление пользователя из памяти"""
+        history = self.users.pop(user_id, None)
+        if history is not None:
+            self.total_bytes -= history.size
+        return history
+
+    def _spill(self, user_id: Hashable) -> None:
+        """Выгрузка пользователя на диск (без холодного уровня - просто забываем)"""
+        history = self._forget(user_id)
+        if history is None or self.cold is None:
+            return
+        # На диске время нужно по часам, а не monotonic - оно переживает перезапуск
+        last_seen = time.time() - (time.monotonic() - history.last_seen)
+        self.cold.spill(user_id, list(history.turns), last_seen, history.summary)
+        self.spills += 1
+
+    def _expire(self) -> None:
+        """Удаление пользователей, не писавших дольше ttl"""
+        deadline = time.monotonic() - self.ttl
+        while self.users:
+            user_id, history = next(iter(self.users.items()))
+            if history.last_seen > deadline:
+                break
+            self.clear(user_id)
+            self.expirations += 1
+
+    def _enforce_budget(self, user_id: Hashable, history: _UserHistory) -> None:
+        """Укладываемся в max_bytes: сначала вытесняем других, потом режем собственную историю"""
+        while self.total_bytes > self.max_bytes and len(self.users) > 1:
+            self._spill(next(iter(self.users)))
+            self.evictions += 1
+
+        # Один пользователь с огромными сообщениями: оставляем хотя бы последнюю запись
+        while self.total_bytes > self.max_bytes and len(history.turns) > 1:
+            self._drop_oldest(history)
+
+    def spill_idle(self) -> int:
+        """Выгрузка на диск пользователей, молчащих дольше spill_after; возвращает их число"""
+        self._expire()
+        deadline = time.monotonic() - self.spill_after
+        spilled = 0
+        while self.users:
+            user_id, history = next(iter(self.users.items()))
+            if history.last_seen > deadline:
+                break
+            self._spill(user_id)
+            spilled += 1
+        return spilled
+
+    async def _sweep_loop(self) -> None:
+        """Фоновая выгрузка молчащих пользователей"""
+        while True:
+            await asyncio.sleep(min(60.0, self.spill_after / 2))
+            self.spill_idle()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика и текущий объем"""
+        self._expire()
+        stats = {
+            'users': len(self.users),
+            'turns': sum(len(history.turns) for history in self.users.values()),
+            'summaries': sum(1 for history in self.users.values() if history.summary),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'max_turns': self.max_turns,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+        if self.cold is not None:
+            cold_stats = self.cold.get_stats()
+            stats.update({
+                'spills': self.spills,
+                'cold_loads': self.cold_loads,
+                'cold': cold_stats,
+                # Сколько байт ушло на диск на каждый байт, добавленный в историю
+                'write_amplification': cold_stats['bytes_written'] / self.appended_bytes if self.appended_bytes else 0.0
+            })
+        return stats
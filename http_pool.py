@@ -0,0 +1,63 @@
+import asyncio
+import os
+from typing import Optional
+
+import aiohttp
+
+
+class HttpPool:
+    """Общий пул keep-alive соединений aiohttp для всех ИИ провайдеров"""
+
+    def __init__(self, limit: int = None, limit_per_host: int = None,
+                 dns_cache_ttl: int = None, timeout: float = 60, connect_timeout: float = None):
+        # Настройки пула берем из переменных окружения (можно переопределить в Railway)
+        self.limit = limit or int(os.getenv('HTTP_POOL_SIZE', 100))
+        self.limit_per_host = limit_per_host or int(os.getenv('HTTP_POOL_PER_HOST', 30))
+        self.dns_cache_ttl = dns_cache_ttl or int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+        # Как timeout у requests: ограничено ожидание каждого чтения, а не весь ответ -
+        # длинная генерация и SSE поток не обрываются, пока данные идут
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Открытие пула (вызывается один раз при старте бота)"""
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    use_dns_cache=True,
+                    keepalive_timeout=30
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                                  sock_read=self.timeout)
+                )
+        return self._session
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Получение сессии (открывает пул лениво, если его забыли открыть)"""
+        if self._session is None or self._session.closed:
+            return await self.start()
+        return self._session
+
+    async def close(self) -> None:
+        """Закрытие пула (вызывается при остановке бота)"""
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
+
+    @property
+    def is_open(self) -> bool:
+        """Открыт ли пул"""
+        return self._session is not None and not self._session.closed
+
+
+# Один пул на процесс - его используют все сервисы
+shared_pool = HttpPool()
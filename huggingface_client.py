@@ -1,165 +1,277 @@
-import requests
+import asyncio
 import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
 from config import HUGGINGFACE_TOKEN
+from http_pool import HttpPool, shared_pool
+from provider_result import ProviderResult, ErrorKind, parse_retry_after
 
 class HuggingFaceClient:
-    """Клиент для работы с Hugging Face API"""
-    
-    def __init__(self):
+    """Асинхронный клиент Hugging Face Inference API с учетом холодного старта моделей.
+
+    Пока модель загружается, API отвечает 503 с estimated_time. Такой ответ - не ошибка:
+    ждем оценку и повторяем с wait_for_model, а модели, которые реально спрашивают,
+    периодически пингуем, чтобы они не выгружались.
+    """
+
+    def __init__(self, token: str = None, http_pool: HttpPool = None):
         self.api_url = "https://api-inference.huggingface.co"
-        self.headers = {"Authorization": f"Bearer {HUGGINGFACE_TOKEN}"} if HUGGINGFACE_TOKEN else {}
-    
-    def text_generation(self, prompt, model="microsoft/DialoGPT-medium", max_length=100):
-        """Генерация текста с помощью Hugging Face API"""
+        token = token or HUGGINGFACE_TOKEN
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.http_pool = http_pool or shared_pool
+
+        # Холодный старт: дольше этого не ждем, отдаем ошибку с retry_after
+        self.request_timeout = float(os.getenv('HF_TIMEOUT', 60))
+        self.max_cold_start_wait = float(os.getenv('HF_COLD_START_MAX_WAIT', 60))
+        self.loading_until: Dict[str, float] = {}
+
+        # Поддержание моделей "теплыми": пингуем модели, которые спрашивали за последние keep_warm_window секунд
+        self.keep_warm_interval = float(os.getenv('HF_KEEP_WARM_INTERVAL', 240))
+        self.keep_warm_window = float(os.getenv('HF_KEEP_WARM_WINDOW', 1800))
+        self.last_used: Dict[str, float] = {}
+        self._keep_warm_task: Optional[asyncio.Task] = None
+
+        self.stats = {'requests': 0, 'cold_starts': 0, 'cold_start_wait': 0.0, 'keep_warm_pings': 0}
+
+    async def start(self):
+        """Открытие пула и запуск фонового поддержания моделей"""
+        await self.http_pool.start()
+        if self._keep_warm_task is None and self.keep_warm_interval > 0:
+            self._keep_warm_task = asyncio.create_task(self._keep_warm_loop())
+
+    async def close(self):
+        """Остановка фонового поддержания моделей"""
+        if self._keep_warm_task:
+            self._keep_warm_task.cancel()
+            try:
+                await self._keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_warm_task = None
+
+    async def query(self, model: str, payload: Dict[str, Any], binary: bool = False,
+                    keep_warm: bool = False) -> Tuple[ProviderResult, Any]:
+        """Запрос к модели: (результат со статусом и ошибкой, разобранный ответ или None)"""
+        started = time.monotonic()
+        if keep_warm:
+            self.last_used[model] = time.monotonic()
+
+        # Модель уже загружается по чужому запросу - сразу ждем ее вместе со всеми
+        wait_for_model = self.loading_until.get(model, 0) > time.monotonic()
+
+        while True:
+            self.stats['requests'] += 1
+            request = {**payload, "options": {**payload.get("options", {}), "wait_for_model": wait_for_model}}
+            timeout = self.request_timeout + (self.max_cold_start_wait if wait_for_model else 0)
+
+            try:
+                session = await self.http_pool.session()
+                async with session.post(
+                    f"{self.api_url}/models/{model}",
+                    headers=self.headers,
+                    json=request,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    body = await response.read()
+            except asyncio.TimeoutError:
+                return ProviderResult.failure(
+                    ErrorKind.TIMEOUT, "Превышено время ожидания Hugging Face",
+                    latency=time.monotonic() - started, provider='huggingface', model=model
+                ), None
+            except aiohttp.ClientError as e:
+                return ProviderResult.failure(
+                    ErrorKind.NETWORK, f"Ошибка Hugging Face: {e}",
+                    latency=time.monotonic() - started, provider='huggingface', model=model
+                ), None
+
+            if status == 200:
+                self.loading_until.pop(model, None)
+                try:
+                    data = body if binary else json.loads(body)
+                except ValueError as e:
+                    return ProviderResult.failure(
+                        ErrorKind.BAD_RESPONSE, f"Некорректный ответ Hugging Face: {e}",
+                        status=status, latency=time.monotonic() - started, provider='huggingface', model=model
+                    ), None
+                return ProviderResult.success(
+                    "", status=status, latency=time.monotonic() - started, provider='huggingface', model=model
+                ), data
+
+            estimated_time = self._estimated_time(status, body)
+            if estimated_time is not None and not wait_for_model:
+                # Модель загружается: ждем оценку и повторяем, попросив API дождаться загрузки
+                self.stats['cold_starts'] += 1
+                self.loading_until[model] = time.monotonic() + estimated_time
+                if estimated_time <= self.max_cold_start_wait:
+                    print(f"Hugging Face: модель {model} загружается, ждем ~{estimated_time:.0f} с")
+                    self.stats['cold_start_wait'] += estimated_time
+                    await asyncio.sleep(estimated_time)
+                    wait_for_model = True
+                    continue
+                retry_after = estimated_time
+
+            message = f"Hugging Face API ошибка: {status} для модели {model}"
+            if estimated_time is not None:
+                message = f"Модель {model} еще загружается (~{estimated_time:.0f} с), попробуйте позже"
+            return ProviderResult.failure(
+                ErrorKind.from_status(status), message,
+                status=status, retry_after=retry_after,
+                latency=time.monotonic() - started, provider='huggingface', model=model
+            ), None
+
+    @staticmethod
+    def _estimated_time(status: int, body: bytes) -> Optional[float]:
+        """Оценка времени загрузки модели из ответа 503 (None - это не загрузка)"""
+        if status != 503:
+            return None
         try:
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_length": max_length,
-                    "temperature": 0.7,
-                    "num_return_sequences": 1
-                }
-            }
-            
-            response = requests.post(
-                f"{self.api_url}/models/{model}",
-                headers=self.headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    return result[0].get('generated_text', '')
-                return str(result)
-            else:
-                print(f"Ошибка API: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка при генерации текста: {e}")
+            estimated_time = json.loads(body).get('estimated_time')
+        except (ValueError, AttributeError):
             return None
-    
-    def image_generation(self, prompt, model="stabilityai/stable-diffusion-2-1"):
-        """Генерация изображения с помощью Hugging Face API"""
+        return float(estimated_time) if estimated_time is not None else None
+
+    async def generate(self, model: str, inputs: str, parameters: Dict[str, Any] = None) -> ProviderResult:
+        """Генерация текста: в ответе только продолжение, без повтора промпта"""
+        payload = {
+            "inputs": inputs,
+            "parameters": {**(parameters or {}), "return_full_text": False}
+        }
+        result, data = await self.query(model, payload, keep_warm=True)
+        if not result.ok:
+            return result
+
+        if isinstance(data, list) and len(data) > 0:
+            text = (data[0].get('generated_text') or '').strip()
+        else:
+            text = str(data)
+
+        if not text:
+            return ProviderResult.failure(
+                ErrorKind.EMPTY, "Модель вернула пустой ответ.",
+                status=result.status, latency=result.latency, provider='huggingface', model=model
+            )
+        result.content = text
+        return result
+
+    async def _keep_warm_loop(self):
+        """Фоновые пинги моделей, которые недавно спрашивали пользователи"""
+        while True:
+            await asyncio.sleep(self.keep_warm_interval)
+            now = time.monotonic()
+            for model, last_used in list(self.last_used.items()):
+                if now - last_used > self.keep_warm_window:
+                    del self.last_used[model]
+                    continue
+                await self._ping(model)
+
+    async def _ping(self, model: str):
+        """Минимальный запрос, чтобы модель не выгрузилась"""
+        self.stats['keep_warm_pings'] += 1
         try:
-            payload = {"inputs": prompt}
-            
-            response = requests.post(
+            session = await self.http_pool.session()
+            async with session.post(
                 f"{self.api_url}/models/{model}",
                 headers=self.headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                return response.content
-            else:
-                print(f"Ошибка API: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка при генерации изображения: {e}")
+                json={
+                    "inputs": "ping",
+                    "parameters": {"max_new_tokens": 1, "return_full_text": False},
+                    "options": {"wait_for_model": False}
+                },
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Hugging Face: пинг {model} не удался: {e}")
+
+    async def text_generation(self, prompt, model="microsoft/DialoGPT-medium", max_length=100):
+        """Генерация текста с помощью Hugging Face API"""
+        result = await self.generate(model, prompt, {"max_new_tokens": max_length, "temperature": 0.7})
+        if not result.ok:
+            print(f"Ошибка при генерации текста: {result.error_message}")
+            return None
+        return result.content
+
+    async def image_generation(self, prompt, model="stabilityai/stable-diffusion-2-1"):
+        """Генерация изображения с помощью Hugging Face API"""
+        result, data = await self.query(model, {"inputs": prompt}, binary=True)
+        if not result.ok:
+            print(f"Ошибка при генерации изображения: {result.error_message}")
             return None
-    
-    def text_classification(self, text, model="distilbert-base-uncased-finetuned-sst-2-english"):
+        return data
+
+    async def text_classification(self, text, model="distilbert-base-uncased-finetuned-sst-2-english"):
         """Классификация текста"""
-        try:
-            payload = {"inputs": text}
-            
-            response = requests.post(
-                f"{self.api_url}/models/{model}",
-                headers=self.headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Ошибка API: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка при классификации текста: {e}")
+        result, data = await self.query(model, {"inputs": text})
+        if not result.ok:
+            print(f"Ошибка при классификации текста: {result.error_message}")
             return None
-    
-    def translation(self, text, target_language="en", source_language="auto"):
+        return data
+
+    async def translation(self, text, target_language="en", source_language="auto"):
         """Перевод текста"""
-        try:
-            model = f"Helsinki-NLP/opus-mt-{source_language}-{target_language}"
-            payload = {"inputs": text}
-            
-            response = requests.post(
-                f"{self.api_url}/models/{model}",
-                headers=self.headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    return result[0].get('translation_text', '')
-                return str(result)
-            else:
-                print(f"Ошибка API: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка при переводе: {e}")
+        model = f"Helsinki-NLP/opus-mt-{source_language}-{target_language}"
+        result, data = await self.query(model, {"inputs": text})
+        if not result.ok:
+            print(f"Ошибка при переводе: {result.error_message}")
             return None
-    
-    def sentiment_analysis(self, text):
+        if isinstance(data, list) and len(data) > 0:
+            return data[0].get('translation_text', '')
+        return str(data)
+
+    async def sentiment_analysis(self, text):
         """Анализ тональности текста"""
-        return self.text_classification(text, "cardiffnlp/twitter-roberta-base-sentiment-latest")
-    
-    def summarize_text(self, text, model="facebook/bart-large-cnn"):
+        return await self.text_classification(text, "cardiffnlp/twitter-roberta-base-sentiment-latest")
+
+    async def summarize_text(self, text, model="facebook/bart-large-cnn"):
         """Суммаризация текста"""
-        try:
-            payload = {"inputs": text}
-            
-            response = requests.post(
-                f"{self.api_url}/models/{model}",
-                headers=self.headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    return result[0].get('summary_text', '')
-                return str(result)
-            else:
-                print(f"Ошибка API: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Ошибка при суммаризации: {e}")
+        result, data = await self.query(model, {"inputs": text})
+        if not result.ok:
+            print(f"Ошибка при суммаризации: {result.error_message}")
             return None
-    
-    def get_available_models(self, task=None):
+        if isinstance(data, list) and len(data) > 0:
+            return data[0].get('summary_text', '')
+        return str(data)
+
+    async def get_available_models(self, task=None):
         """Получение списка доступных моделей"""
         try:
             url = f"{self.api_url}/models"
             if task:
                 url += f"?search={task}"
-            
-            response = requests.get(url, headers=self.headers)
-            
-            if response.status_code == 200:
-                models = response.json()
-                return [model['id'] for model in models[:10]]  # Первые 10 моделей
-            else:
-                print(f"Ошибка API: {response.status_code} - {response.text}")
+
+            session = await self.http_pool.session()
+            async with session.get(url, headers=self.headers) as response:
+                if response.status == 200:
+                    models = await response.json(content_type=None)
+                    return [model['id'] for model in models[:10]]  # Первые 10 моделей
+                print(f"Ошибка API: {response.status} - {await response.text()}")
                 return []
-                
+
         except Exception as e:
             print(f"Ошибка при получении моделей: {e}")
             return []
-    
-    def test_connection(self):
+
+    async def test_connection(self):
         """Тестирование подключения к API"""
         try:
-            response = requests.get(f"{self.api_url}/models", headers=self.headers)
-            return response.status_code == 200
+            session = await self.http_pool.session()
+            async with session.get(f"{self.api_url}/models", headers=self.headers) as response:
+                return response.status == 200
         except Exception as e:
             print(f"Ошибка подключения: {e}")
             return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика клиента"""
+        now = time.monotonic()
+        return {
+            **self.stats,
+            'loading_models': [model for model, until in self.loading_until.items() if until > now],
+            'warm_models': list(self.last_used)
+        }
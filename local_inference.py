@@ -0,0 +1,240 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from provider_result import ProviderResult, ErrorKind
+
+
+def available_cpus() -> int:
+    """Сколько ядер реально доступно процессу: affinity и квота cgroup (Railway/Docker)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" - без ограничения, "200000 100000" - два ядра
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def env_int(name: str, default: int) -> int:
+    """Целое из окружения; пустое или нечисловое значение (например, комментарий из примера .env) - default"""
+    try:
+        return int(os.getenv(name, ''))
+    except ValueError:
+        return default
+
+
+# Состояние процесса-воркера: модель грузится один раз в initializer и живет до конца процесса
+_generator = None
+
+
+def _init_worker(model: str, token: Optional[str], threads: int) -> None:
+    """Загрузка модели в воркере (torch и transformers импортируются только здесь)"""
+    global _generator
+    import torch
+    from transformers import pipeline
+
+    # Воркеры не должны драться за ядра друг с другом
+    torch.set_num_threads(threads)
+    _generator = pipeline("text-generation", model=model, token=token)
+
+    # Для пачек нужен паддинг; у GPT-2/DialoGPT нет pad-токена, а декодеру нужен паддинг слева
+    _generator.tokenizer.pad_token = _generator.tokenizer.eos_token
+    _generator.tokenizer.padding_side = 'left'
+
+
+def _worker_ready() -> int:
+    """Пустая задача для прогрева: к ее выполнению модель в воркере уже загружена"""
+    return os.getpid()
+
+
+def _generate_batch(prompts: List[str], max_lengths: List[int]) -> List[str]:
+    """Генерация пачки в воркере: промпты с одинаковым max_length идут одним батчем"""
+    groups: Dict[int, List[int]] = {}
+    for index, max_length in enumerate(max_lengths):
+        groups.setdefault(max_length, []).append(index)
+
+    texts: List[str] = [""] * len(prompts)
+    for max_length, indices in groups.items():
+        responses = _generator(
+            [prompts[i] for i in indices],
+            batch_size=len(indices),
+            max_length=max_length,
+            num_return_sequences=1,
+            temperature=0.7
+        )
+        for i, response in zip(indices, responses):
+            texts[i] = response[0]['generated_text']
+    return texts
+
+
+class LocalTextPool:
+    """Локальная генерация текста в пуле процессов.
+
+    Цикл событий только ждет futures: запросы кладутся в ограниченную очередь,
+    из нее их забирают диспетчеры (по одному на воркер). Если очередь полна дольше
+    queue_timeout, запрос отклоняется - вызывающий уходит к удаленным сервисам.
+
+    Диспетчер забирает из очереди до max_batch запросов (подождав max_wait, если их мало)
+    и отправляет их воркеру одним батчем - один прямой проход модели на всю пачку.
+    """
+
+    def __init__(self, model: str, token: str = None, workers: int = None, threads: int = None,
+                 queue_size: int = None, queue_timeout: float = None, max_batch: int = None,
+                 max_wait: float = None):
+        self.model = model
+        self.token = token
+
+        # По умолчанию: по 2 потока torch на воркер, воркеров - сколько помещается в доступные ядра
+        cpus = available_cpus()
+        self.threads = threads or env_int('LOCAL_TEXT_THREADS', 2)
+        self.workers = workers or env_int('LOCAL_TEXT_WORKERS', max(1, cpus // self.threads))
+        self.threads = max(1, min(self.threads, cpus // self.workers))
+
+        self.queue_size = queue_size or env_int('LOCAL_TEXT_QUEUE', self.workers * 4)
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv('LOCAL_TEXT_QUEUE_TIMEOUT', 2))
+
+        self.max_batch = max_batch or int(os.getenv('LOCAL_TEXT_BATCH_SIZE', 8))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('LOCAL_TEXT_BATCH_WAIT', 0.01))
+
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.dispatchers: List[asyncio.Task] = []
+
+        self.stats = {'completed': 0, 'failed': 0, 'rejected': 0, 'busy': 0, 'inference_time': 0.0,
+                      'batches': 0, 'batched_items': 0}
+
+    def start(self) -> None:
+        """Запуск воркеров и ожидание загрузки модели в каждом (блокирует - вызывать из потока-загрузчика)"""
+        if self.executor is not None:
+            return
+
+        # spawn: не наследуем потоки и состояние процесса бота
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model, self.token, self.threads)
+        )
+        # Одновременная отправка N задач поднимает все N процессов
+        futures = [self.executor.submit(_worker_ready) for _ in range(self.workers)]
+        done, _ = wait(futures)
+        for future in done:
+            future.result()  # Ошибка загрузки модели (BrokenProcessPool) - наружу
+        print(f"✅ Пул локальной генерации: {self.workers} воркеров x {self.threads} потоков")
+
+    def close(self) -> None:
+        """Остановка диспетчеров и воркеров"""
+        for task in self.dispatchers:
+            task.cancel()
+        self.dispatchers = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _ensure_dispatchers(self) -> None:
+        """Очередь и диспетчеры создаются в цикле событий при первом запросе"""
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        if not self.dispatchers:
+            self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def _next_batch(self) -> List[tuple]:
+        """Пачка запросов из очереди: сколько уже есть, а если мало - еще max_wait секунд ожидания"""
+        batch = [await self.queue.get()]
+        if self.queue.qsize() < self.max_batch - 1 and self.max_wait > 0:
+            await asyncio.sleep(self.max_wait)
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _dispatch(self) -> None:
+        """Диспетчер: собирает пачку из очереди и ждет ее выполнения воркером"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            taken = len(batch)
+            try:
+                # Вызывающие, которые уже ушли (отмена), воркер не занимают
+                batch = [item for item in batch if not item[2].done()]
+                if not batch:
+                    continue
+                prompts = [prompt for prompt, _, _ in batch]
+                max_lengths = [max_length for _, max_length, _ in batch]
+
+                self.stats['busy'] += 1
+                self.stats['batches'] += 1
+                self.stats['batched_items'] += len(batch)
+                started = time.monotonic()
+                try:
+                    texts = await loop.run_in_executor(self.executor, _generate_batch, prompts, max_lengths)
+                except Exception as e:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for (_, _, future), text in zip(batch, texts):
+                        if not future.done():
+                            future.set_result(text)
+                finally:
+                    self.stats['busy'] -= 1
+                    self.stats['inference_time'] += time.monotonic() - started
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+
+    async def generate(self, prompt: str, max_length: int = 500) -> ProviderResult:
+        """Генерация текста; при переполненной очереди - ошибка RATE_LIMIT"""
+        if self.executor is None:
+            return ProviderResult.failure(ErrorKind.CONFIG, "Локальная модель не загружена", provider='local', model=self.model)
+
+        self._ensure_dispatchers()
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+
+        # Обратное давление: ждем место в очереди не дольше queue_timeout
+        item = (prompt, max_length, future)
+        try:
+            if self.queue.full():
+                await asyncio.wait_for(self.queue.put(item), timeout=self.queue_timeout)
+            else:
+                self.queue.put_nowait(item)
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            return ProviderResult.failure(
+                ErrorKind.RATE_LIMIT, "Локальная модель перегружена", retry_after=self.queue_timeout,
+                provider='local', model=self.model
+            )
+
+        try:
+            text = await future
+        except Exception as e:
+            self.stats['failed'] += 1
+            return ProviderResult.failure(
+                ErrorKind.SERVER, f"Ошибка локальной генерации: {e}",
+                latency=time.monotonic() - started, provider='local', model=self.model
+            )
+
+        self.stats['completed'] += 1
+        return ProviderResult.success(text, latency=time.monotonic() - started, provider='local', model=self.model)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика пула"""
+        return {
+            **self.stats,
+            'workers': self.workers,
+            'threads_per_worker': self.threads,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'queue_size': self.queue_size,
+            'avg_batch_size': self.stats['batched_items'] / self.stats['batches'] if self.stats['batches'] else 0.0
+        }
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+
+class MicroBatcher:
+    """Склейка одиночных вызовов в пачки: вызовы с одним ключом за max_wait секунд
+    (или до max_batch штук) уходят одним запросом, результат возвращается каждому в его future.
+
+    send_batch(key, items) должен вернуть список результатов в том же порядке, что и items.
+    """
+
+    def __init__(self, send_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+                 max_batch: int = None, max_wait: float = None):
+        self.send_batch = send_batch
+        self.max_batch = max_batch or int(os.getenv('HF_BATCH_SIZE', 16))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('HF_BATCH_WAIT', 0.01))
+
+        self.pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self.timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.tasks = set()
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Добавление элемента в пачку и ожидание его результата"""
+        future = asyncio.get_running_loop().create_future()
+        batch = self.pending.setdefault(key, [])
+        batch.append((item, future))
+
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif key not in self.timers:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.max_wait, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        """Отправка накопленной пачки"""
+        timer = self.timers.pop(key, None)
+        if timer:
+            timer.cancel()
+
+        # Отмененные вызовы в пачку не берем
+        batch = [(item, future) for item, future in self.pending.pop(key, []) if not future.done()]
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._send(key, batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Один запрос на всю пачку и раздача результатов"""
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.send_batch(key, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Ожидалось {len(batch)} результатов, получено {len(results)}")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика склейки"""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0
+        }
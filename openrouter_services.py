@@ -1,16 +1,41 @@
-import requests
+import aiohttp
+import asyncio
 import json
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator
 import time
+from http_pool import HttpPool, shared_pool
+from provider_result import ProviderResult, ErrorKind, parse_retry_after
+from retry_policy import RetryPolicy
+from admission import AdmissionControl
+from completion_cache import CompletionCache
+from single_flight import SingleFlight
+from hedging import FirstTokenTracker, wait_first_token, cancel_all
+from context_builder import ContextBuilder, CHAT_SYSTEM_PROMPT, summary_messages
 
 class OpenRouterServices:
     """OpenRouter API сервисы для Telegram бота с настоящим DeepSeek"""
     
-    def __init__(self):
+    def __init__(self, http_pool: HttpPool = None):
         self.api_key = os.getenv('OPENROUTER_API_KEY')
         self.base_url = "https://openrouter.ai/api/v1"
         
+        # Общий пул соединений (keep-alive, DNS кэш)
+        self.http_pool = http_pool or shared_pool
+        
+        # Повторы 429/502/503/504 с общим бюджетом повторов на процесс
+        self.retry_policy = RetryPolicy()
+        
+        # Сами ограничиваем поток запросов, не дожидаясь 429 от провайдера
+        self.admission = AdmissionControl('openrouter')
+        self.context_builder = ContextBuilder()  # Контекст чата в бюджет токенов
+        
+        # Кэш готовых ответов: попадание не расходует дневной лимит
+        self.completion_cache = CompletionCache()
+        
+        # Одинаковые одновременные запросы (двойное нажатие, пересылка в группу) идут к API один раз
+        self.single_flight = SingleFlight()
+        
         # Доступные модели OpenRouter (правильные ID)
         self.available_models = {
             'deepseek': 'deepseek/deepseek-chat-v3.1:free',  # Бесплатная модель DeepSeek
@@ -24,17 +49,45 @@ class OpenRouterServices:
             'llama': 'meta-llama/llama-3.1-8b-instruct:free'  # Бесплатная Llama
         }
         
-        # Счетчики для бесплатных лимитов
+        # Хеджирование: если бесплатная модель не дала первый токен к p90 дедлайну,
+        # параллельно запускаем платную и берем того, кто ответит первым
+        self.hedge_models = {'deepseek': 'deepseek_large'}
+        self.hedging_enabled = os.getenv('OPENROUTER_HEDGING', 'true').lower() == 'true'
+        self.first_token = FirstTokenTracker(default_deadline=float(os.getenv('OPENROUTER_HEDGE_DEFAULT_DEADLINE', 8)))
+        self.hedge_stats = {'fired': 0, 'won': 0, 'cancelled': 0, 'skipped_budget': 0}
+        
+        # Счетчики для бесплатных лимитов (фоновые сводки диалогов считаются отдельно от запросов пользователей)
         self.request_counts = {
             'free_models': 0,
-            'paid_models': 0
+            'paid_models': 0,
+            'paid_hedges': 0,
+            'summaries': 0
         }
         self.last_reset = time.time()
         
         # Лимиты OpenRouter
         self.daily_limits = {
             'free_models': 100,  # 100 запросов в день бесплатно
-            'paid_models': 1000  # 1000 запросов в день для платных
+            'paid_models': 1000,  # 1000 запросов в день для платных
+            'paid_hedges': int(os.getenv('OPENROUTER_HEDGE_DAILY_BUDGET', 50)),  # Хеджей на платную модель в день
+            'summaries': int(os.getenv('OPENROUTER_SUMMARY_DAILY_BUDGET', 200))  # Фоновых сводок в день
+        }
+    
+    async def start(self):
+        """Открытие пула соединений при старте бота"""
+        await self.http_pool.start()
+    
+    async def close(self):
+        """Закрытие пула соединений при остановке бота"""
+        await self.http_pool.close()
+    
+    def _headers(self) -> Dict[str, str]:
+        """Заголовки запросов к OpenRouter"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/your-repo",  # Замените на ваш репозиторий
+            "X-Title": "Telegram AI Bot"
         }
     
     def _check_daily_limit(self, model_type: str = 'free') -> bool:
@@ -43,11 +96,13 @@ class OpenRouterServices:
         
         # Сброс счетчика каждый день
         if current_time - self.last_reset > 24 * 3600:
-            self.request_counts = {'free_models': 0, 'paid_models': 0}
+            self.request_counts = {'free_models': 0, 'paid_models': 0, 'paid_hedges': 0, 'summaries': 0}
             self.last_reset = current_time
         
         if model_type == 'free':
             return self.request_counts['free_models'] < self.daily_limits['free_models']
+        elif model_type == 'summary':
+            return self.request_counts['summaries'] < self.daily_limits['summaries']
         else:
             return self.request_counts['paid_models'] < self.daily_limits['paid_models']
     
@@ -55,6 +110,8 @@ class OpenRouterServices:
         """Увеличение счетчика запросов"""
         if model_type == 'free':
             self.request_counts['free_models'] += 1
+        elif model_type == 'summary':
+            self.request_counts['summaries'] += 1
         else:
             self.request_counts['paid_models'] += 1
     
@@ -87,68 +144,333 @@ class OpenRouterServices:
         ]
         return model in free_models
     
-    async def generate_text_response(self, prompt: str, max_tokens: int = 1000, model: str = 'deepseek') -> str:
-        """Генерация текстового ответа через OpenRouter API"""
+    def _check_request(self, model_id: str, counter: str = None) -> Optional[ProviderResult]:
+        """Проверка ключа и дневного лимита перед запросом (None - можно отправлять).
         
+        counter - чей лимит списывается ('summary' для фоновых сводок), по умолчанию по типу модели.
+        """
         if not self.api_key:
-            return "❌ OpenRouter API ключ не настроен. Добавьте OPENROUTER_API_KEY в .env файл."
+            return ProviderResult.failure(
+                ErrorKind.CONFIG,
+                "OpenRouter API ключ не настроен. Добавьте OPENROUTER_API_KEY в .env файл.",
+                provider='openrouter', model=model_id
+            )
         
-        # Выбираем модель
-        model_id = self.available_models.get(model, self.available_models['deepseek'])
-        is_free = self._is_free_model(model_id)
+        if counter == 'summary':
+            if not self._check_daily_limit('summary'):
+                return ProviderResult.failure(
+                    ErrorKind.QUOTA, "Достигнут дневной лимит фоновых сводок диалогов.",
+                    provider='openrouter', model=model_id
+                )
+            return None
         
-        # Проверяем лимиты
+        is_free = self._is_free_model(model_id)
         if not self._check_daily_limit('free' if is_free else 'paid'):
-            return f"❌ Достигнут дневной лимит для {'бесплатных' if is_free else 'платных'} моделей. Попробуйте завтра."
+            return ProviderResult.failure(
+                ErrorKind.QUOTA,
+                f"Достигнут дневной лимит для {'бесплатных' if is_free else 'платных'} моделей. Попробуйте завтра.",
+                provider='openrouter', model=model_id
+            )
+        
+        return None
+    
+    async def _error_result(self, response: aiohttp.ClientResponse, model_id: str, started: float) -> ProviderResult:
+        """Разбор ответа с ошибкой в ProviderResult"""
+        error_msg = f"OpenRouter API ошибка: {response.status}"
+        response_text = await response.text()
+        if response_text:
+            try:
+                error_data = json.loads(response_text)
+                error_msg += f" - {error_data.get('error', {}).get('message', '')}"
+            except:
+                error_msg += f" - {response_text[:100]}"
+        
+        return ProviderResult.failure(
+            ErrorKind.from_status(response.status),
+            error_msg,
+            status=response.status,
+            retry_after=parse_retry_after(response.headers.get('Retry-After')),
+            latency=time.monotonic() - started,
+            provider='openrouter',
+            model=model_id
+        )
+    
+    async def _post_completion(self, payload: Dict[str, Any], counter: str = None) -> ProviderResult:
+        """Один запрос к /chat/completions (counter - как в _check_request)"""
+        model_id = payload['model']
+        started = time.monotonic()
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://github.com/your-repo",  # Замените на ваш репозиторий
-                "X-Title": "Telegram AI Bot"
-            }
-            
-            payload = {
-                "model": model_id,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 0.95
-            }
-            
-            response = requests.post(
+            session = await self.http_pool.session()
+            async with self.admission.slot(model_id) as admitted, session.post(
                 f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
+                headers=self._headers(),
+                json=payload
+            ) as response:
+                admitted.respond(response.status)
+                if response.status != 200:
+                    return await self._error_result(response, model_id, started)
+                
+                result = await response.json()
                 content = result['choices'][0]['message']['content']
                 
                 # Увеличиваем счетчик
-                self._increment_counter('free' if is_free else 'paid')
+                self._increment_counter(counter or ('free' if self._is_free_model(model_id) else 'paid'))
                 
-                return content
-            else:
-                error_msg = f"OpenRouter API ошибка: {response.status_code}"
-                if response.text:
-                    try:
-                        error_data = response.json()
-                        error_msg += f" - {error_data.get('error', {}).get('message', '')}"
-                    except:
-                        error_msg += f" - {response.text[:100]}"
+                if not content:
+                    return ProviderResult.failure(
+                        ErrorKind.EMPTY, "Модель вернула пустой ответ.",
+                        status=response.status, latency=time.monotonic() - started,
+                        provider='openrouter', model=model_id
+                    )
                 
-                return f"❌ {error_msg}"
+                return ProviderResult.success(
+                    content,
+                    status=response.status,
+                    latency=time.monotonic() - started,
+                    usage=result.get('usage') or {},
+                    model=result.get('model', model_id),
+                    provider='openrouter'
+                )
                 
-        except Exception as e:
-            return f"❌ Ошибка при обращении к OpenRouter: {str(e)}"
+        except asyncio.TimeoutError:
+            return ProviderResult.failure(
+                ErrorKind.TIMEOUT, "Превышено время ожидания ответа OpenRouter",
+                latency=time.monotonic() - started, provider='openrouter', model=model_id
+            )
+        except aiohttp.ClientError as e:
+            return ProviderResult.failure(
+                ErrorKind.NETWORK, f"Ошибка при обращении к OpenRouter: {str(e)}",
+                latency=time.monotonic() - started, provider='openrouter', model=model_id
+            )
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return ProviderResult.failure(
+                ErrorKind.BAD_RESPONSE, f"Некорректный ответ OpenRouter: {str(e)}",
+                latency=time.monotonic() - started, provider='openrouter', model=model_id
+            )
+    
+    def lookup_cache(self, model: str, intent: Optional[str], user_text: Optional[str]) -> Optional[ProviderResult]:
+        """Поиск готового ответа в кэше (None - промах или кэш выключен для этого типа)"""
+        if not user_text or not self.completion_cache.is_enabled(intent):
+            return None
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        return self.completion_cache.get(CompletionCache.make_key(model_id, intent, user_text))
+    
+    def store_cache(self, model: str, intent: Optional[str], user_text: Optional[str], result: ProviderResult) -> None:
+        """Сохранение успешного ответа в кэш"""
+        if not user_text or not self.completion_cache.is_enabled(intent):
+            return
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        self.completion_cache.set(CompletionCache.make_key(model_id, intent, user_text), result)
+    
+    async def generate_text_response(self, prompt: str, max_tokens: int = 1000, model: str = 'deepseek',
+                                     intent: str = None, user_text: str = None,
+                                     check_cache: bool = True) -> ProviderResult:
+        """Генерация текстового ответа через OpenRouter API.
+        
+        Если переданы intent (тип запроса) и user_text (исходный текст пользователя),
+        ответ берется из кэша и кладется в него. check_cache=False - вызывающий уже
+        проверил кэш для этого запроса (повторный промах не считается), ответ все равно сохраняется.
+        """
+        if check_cache:
+            cached = self.lookup_cache(model, intent, user_text)
+            if cached:
+                return cached
+        
+        # Выбираем модель
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        
+        # Проверяем ключ и лимиты
+        rejected = self._check_request(model_id)
+        if rejected:
+            return rejected
+        
+        payload = {
+            "model": model_id,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "top_p": 0.95
+        }
+        
+        # С хеджем повторяется только основной запрос (внутри _hedged_completion) - повтор
+        # не запускает гонку заново и не тратит бюджет хеджей еще раз
+        hedge_model = self.hedge_models.get(model) if self.hedging_enabled else None
+        if hedge_model:
+            call = lambda: self._hedged_completion(prompt, max_tokens, model, hedge_model)
+        else:
+            call = lambda: self.retry_policy.run(lambda: self._post_completion(payload))
+        
+        result = await self.single_flight.run((model_id, prompt, max_tokens), call)
+        self.store_cache(model, intent, user_text, result)
+        return result
+    
+    async def _collect_stream(self, prompt: str, max_tokens: int, model: str, first_token: asyncio.Event) -> ProviderResult:
+        """Потоковый запрос целиком; first_token срабатывает на первом куске текста"""
+        result = ProviderResult()
+        async for _ in self.stream_text_response(prompt, max_tokens, model, result):
+            first_token.set()
+        return result
+    
+    def _try_hedge_budget(self) -> bool:
+        """Списание одного хеджа из дневного бюджета"""
+        self._check_daily_limit('paid')  # Заодно сбрасывает счетчики раз в сутки
+        if self.request_counts['paid_hedges'] >= self.daily_limits['paid_hedges']:
+            self.hedge_stats['skipped_budget'] += 1
+            return False
+        self.request_counts['paid_hedges'] += 1
+        self.hedge_stats['fired'] += 1
+        return True
     
-    async def generate_code(self, description: str, model: str = 'deepseek') -> str:
+    async def _hedged_completion(self, prompt: str, max_tokens: int, model: str, hedge_model: str) -> ProviderResult:
+        """Запрос к модели с хеджем: нет первого токена к дедлайну - параллельно спрашиваем hedge_model.
+        
+        Основной запрос идет с повторами, хедж - одной попыткой.
+        """
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        
+        racers = {}
+        primary_first = asyncio.Event()
+        primary = asyncio.ensure_future(
+            self.retry_policy.run(lambda: self._collect_stream(prompt, max_tokens, model, primary_first))
+        )
+        racers[primary] = primary_first
+        
+        try:
+            winner = await wait_first_token(racers, timeout=self.first_token.deadline(model_id))
+            
+            # Основная модель успела или упала, исчерпав повторы (ошибку обработает переключение)
+            if winner is not None or primary.done() or not self._try_hedge_budget():
+                return await primary
+            
+            hedge_first = asyncio.Event()
+            hedge = asyncio.ensure_future(self._collect_stream(prompt, max_tokens, hedge_model, hedge_first))
+            racers[hedge] = hedge_first
+            
+            winner = await wait_first_token(racers)
+            if winner is None:
+                # Обе модели упали без единого токена - отдаем ошибку основной
+                return primary.result()
+            
+            losers = [task for task in racers if task is not winner and not task.done()]
+            cancel_all(losers)
+            self.hedge_stats['cancelled'] += len(losers)
+            if winner is hedge:
+                self.hedge_stats['won'] += 1
+            return await winner
+        finally:
+            cancel_all(racers)
+    
+    async def stream_text_response(self, prompt: str, max_tokens: int = 1000, model: str = 'deepseek',
+                                   result: ProviderResult = None) -> AsyncIterator[str]:
+        """Потоковая генерация ответа (SSE, stream: true) - отдает текст по кусочкам.
+        
+        Итог (ошибка, статус, usage, задержка) записывается в переданный result.
+        При ошибке генератор ничего не отдает - проверьте result.ok.
+        """
+        if result is None:
+            result = ProviderResult()
+        result.provider = 'openrouter'
+        
+        # Выбираем модель
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        result.model = model_id
+        
+        # Проверяем ключ и лимиты
+        rejected = self._check_request(model_id)
+        if rejected:
+            result.error_kind = rejected.error_kind
+            result.error_message = rejected.error_message
+            return
+        
+        payload = {
+            "model": model_id,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "stream": True
+        }
+        
+        started = time.monotonic()
+        parts = []
+        
+        try:
+            session = await self.http_pool.session()
+            async with self.admission.slot(model_id) as admitted, session.post(
+                f"{self.base_url}/chat/completions",
+                headers=self._headers(),
+                json=payload
+            ) as response:
+                admitted.respond(response.status)
+                result.status = response.status
+                if response.status != 200:
+                    error = await self._error_result(response, model_id, started)
+                    result.error_kind = error.error_kind
+                    result.error_message = error.error_message
+                    result.retry_after = error.retry_after
+                    return
+                
+                # Запрос принят провайдером - учитываем его, если только мы сами его не отменили
+                # (проигравший участник хеджа: ни счетчики, ни подстройка лимита его не видят)
+                cancelled = False
+                try:
+                    # SSE: строки вида "data: {...}", комментарии ": ..." и финальный "data: [DONE]"
+                    async for raw_line in response.content:
+                        line = raw_line.decode('utf-8', errors='ignore').strip()
+                        if not line or line.startswith(':') or not line.startswith('data:'):
+                            continue
+                        
+                        data = line[5:].strip()
+                        if data == '[DONE]':
+                            break
+                        
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        
+                        if 'error' in chunk:
+                            result.error_kind = ErrorKind.SERVER
+                            result.error_message = f"OpenRouter API ошибка: {chunk['error'].get('message', '')}"
+                            break
+                        
+                        if chunk.get('usage'):
+                            result.usage = chunk['usage']
+                        
+                        choices = chunk.get('choices') or [{}]
+                        delta = choices[0].get('delta', {}).get('content')
+                        if delta:
+                            if not parts:
+                                self.first_token.record(model_id, time.monotonic() - started)
+                                admitted.first_token()
+                            parts.append(delta)
+                            yield delta
+                except asyncio.CancelledError:
+                    cancelled = True
+                    raise
+                finally:
+                    if not cancelled:
+                        self._increment_counter('free' if self._is_free_model(model_id) else 'paid')
+                        
+        except asyncio.TimeoutError:
+            result.error_kind = ErrorKind.TIMEOUT
+            result.error_message = "Превышено время ожидания ответа OpenRouter"
+        except aiohttp.ClientError as e:
+            result.error_kind = ErrorKind.NETWORK
+            result.error_message = f"Ошибка при обращении к OpenRouter: {str(e)}"
+        finally:
+            result.content = "".join(parts)
+            result.latency = time.monotonic() - started
+            if result.ok and not result.content:
+                result.error_kind = ErrorKind.EMPTY
+                result.error_message = "Модель вернула пустой ответ."
+    
+    async def generate_code(self, description: str, model: str = 'deepseek') -> ProviderResult:
         """Генерация кода через OpenRouter API"""
         prompt = f"""Напиши полноценный, рабочий код на Python для следующей задачи: {description}
 
@@ -169,7 +491,7 @@ class OpenRouterServices:
 
         return await self.generate_text_response(prompt, max_tokens=2000, model=model)
     
-    async def solve_problem(self, problem: str, model: str = 'deepseek') -> str:
+    async def solve_problem(self, problem: str, model: str = 'deepseek') -> ProviderResult:
         """Решение задач через OpenRouter API"""
         prompt = f"""Реши следующую задачу: {problem}
 
@@ -184,7 +506,7 @@ class OpenRouterServices:
 
         return await self.generate_text_response(prompt, max_tokens=1500, model=model)
     
-    async def search_information(self, query: str, model: str = 'deepseek') -> str:
+    async def search_information(self, query: str, model: str = 'deepseek') -> ProviderResult:
         """Поиск информации через OpenRouter API"""
         prompt = f"""Найди и проанализируй информацию по запросу: {query}
 
@@ -199,65 +521,54 @@ class OpenRouterServices:
 
         return await self.generate_text_response(prompt, max_tokens=1200, model=model)
     
-    async def chat_response(self, message: str, conversation_history: list = None, model: str = 'deepseek') -> str:
-        """Генерация ответа для чата с учетом истории"""
-        try:
-            # Формируем контекст с историей
-            messages = []
-            
-            if conversation_history and len(conversation_history) > 0:
-                # Берем последние 5 сообщений для контекста
-                recent_history = conversation_history[-5:]
-                for msg in recent_history:
-                    messages.append({"role": "user", "content": msg})
-            
-            messages.append({"role": "user", "content": message})
-            
-            if not self.api_key:
-                return "❌ OpenRouter API ключ не настроен."
-            
-            # Выбираем модель
-            model_id = self.available_models.get(model, self.available_models['deepseek'])
-            is_free = self._is_free_model(model_id)
-            
-            # Проверяем лимиты
-            if not self._check_daily_limit('free' if is_free else 'paid'):
-                return f"❌ Достигнут дневной лимит для {'бесплатных' if is_free else 'платных'} моделей."
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://github.com/your-repo",
-                "X-Title": "Telegram AI Bot"
-            }
-            
-            payload = {
-                "model": model_id,
-                "messages": messages,
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                
-                # Увеличиваем счетчик
-                self._increment_counter('free' if is_free else 'paid')
-                
-                return content
-            else:
-                return f"❌ Ошибка API: {response.status_code}"
-                
-        except Exception as e:
-            return f"❌ Ошибка в чате: {str(e)}"
+    async def chat_response(self, message: str, conversation_history: list = None, model: str = 'deepseek',
+                            summary: str = None, system_prompt: str = None) -> ProviderResult:
+        """Генерация ответа для чата с учетом истории и сводки более ранней части разговора"""
+        # Шаблон один раз в системном промпте, дальше - свежие реплики в бюджет токенов модели
+        messages = self.context_builder.build(
+            message, conversation_history, model=model,
+            system_prompt=system_prompt or CHAT_SYSTEM_PROMPT,
+            prefix=summary_messages(summary)
+        )
+        
+        # Выбираем модель
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        
+        # Проверяем ключ и лимиты
+        rejected = self._check_request(model_id)
+        if rejected:
+            return rejected
+        
+        payload = {
+            "model": model_id,
+            "messages": messages,
+            "max_tokens": 1000,
+            "temperature": 0.7
+        }
+        
+        result = await self.retry_policy.run(lambda: self._post_completion(payload))
+        self.context_builder.record_usage(result.usage)
+        return result
+    
+    async def summarize_text(self, prompt: str, max_tokens: int = 300, model: str = 'llama') -> ProviderResult:
+        """Фоновая сводка диалога: без кэша и хеджа, списывается с отдельного дневного лимита сводок,
+        а не с лимита запросов пользователей"""
+        model_id = self.available_models.get(model, self.available_models['deepseek'])
+        
+        rejected = self._check_request(model_id, counter='summary')
+        if rejected:
+            return rejected
+        
+        payload = {
+            "model": model_id,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7
+        }
+        
+        return await self.retry_policy.run(lambda: self._post_completion(payload, counter='summary'))
     
     def get_available_models(self) -> Dict[str, str]:
         """Получение списка доступных моделей"""
@@ -270,22 +581,54 @@ class OpenRouterServices:
             'paid_models_used': self.request_counts['paid_models'],
             'free_models_limit': self.daily_limits['free_models'],
             'paid_models_limit': self.daily_limits['paid_models'],
+            'summaries_used': self.request_counts['summaries'],
+            'summaries_limit': self.daily_limits['summaries'],
             'available_models': list(self.available_models.keys()),
+            'retries': self.retry_policy.retries,
+            'cache': self.completion_cache.get_stats(),
+            'coalescing': self.single_flight.get_stats(),
+            'admission': self.admission.get_stats(),
+            'context': self.context_builder.get_stats(),
+            'hedging': {
+                **self.hedge_stats,
+                'budget_used': self.request_counts['paid_hedges'],
+                'budget_limit': self.daily_limits['paid_hedges'],
+                'deadlines': self.first_token.get_stats()
+            },
             'reset_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_reset))
         }
     
-    def test_connection(self) -> bool:
+    async def list_models(self) -> list:
+        """Получение списка моделей OpenRouter (/models) через общий пул"""
+        if not self.api_key:
+            return []
+        
+        try:
+            session = await self.http_pool.session()
+            async with session.get(
+                f"{self.base_url}/models",
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status != 200:
+                    return []
+                data = await response.json()
+                return [model.get('id', '') for model in data.get('data', [])]
+        except Exception:
+            return []
+    
+    async def test_connection(self) -> bool:
         """Тест подключения к OpenRouter API"""
         if not self.api_key:
             return False
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.get(f"{self.base_url}/models", headers=headers, timeout=10)
-            return response.status_code == 200
+            session = await self.http_pool.session()
+            async with session.get(
+                f"{self.base_url}/models",
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                return response.status == 200
         except:
             return False
@@ -0,0 +1,167 @@
+import time
+from collections import deque
+from typing import Dict, Any, Iterable, List
+
+
+class ProviderHealth:
+    """Здоровье одного провайдера: скользящий процент ошибок, EWMA задержки и автомат (circuit breaker)"""
+
+    CLOSED = 'closed'        # Все хорошо, запросы идут
+    OPEN = 'open'            # Провайдер лежит, запросы не отправляем
+    HALF_OPEN = 'half_open'  # Пробный запрос после паузы
+
+    def __init__(self, name: str, window: int = 20, min_requests: int = 5,
+                 error_threshold: float = 0.5, open_timeout: float = 30.0,
+                 ewma_alpha: float = 0.3, error_penalty: float = 30.0):
+        self.name = name
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.open_timeout = open_timeout
+        self.ewma_alpha = ewma_alpha
+        # Во сколько секунд задержки обходится 100% ошибок при ранжировании
+        self.error_penalty = error_penalty
+
+        # Скользящее окно последних исходов (True - успех)
+        self.outcomes = deque(maxlen=window)
+        self.latency_ewma = None
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.trips = 0
+
+    @property
+    def error_rate(self) -> float:
+        """Доля ошибок в скользящем окне"""
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def score(self, default_latency: float = 0.0) -> float:
+        """Ожидаемая цена запроса в секундах (меньше - лучше): EWMA задержки + штраф за ошибки.
+
+        default_latency - задержка для провайдера, по которому замеров еще нет.
+        """
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return latency + self.error_penalty * self.error_rate
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос этому провайдеру"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            # После паузы пропускаем один пробный запрос
+            if time.monotonic() - self.opened_at < self.open_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+
+        # HALF_OPEN: только один пробный запрос одновременно
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float) -> None:
+        """Учет успешного ответа"""
+        self._update_latency(latency)
+        self.outcomes.append(True)
+
+        if self.state == self.HALF_OPEN:
+            # Пробный запрос прошел - провайдер снова в строю
+            self.state = self.CLOSED
+            self.probe_in_flight = False
+            self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def record_failure(self, latency: float = None) -> None:
+        """Учет ошибки"""
+        if latency is not None:
+            self._update_latency(latency)
+        self.outcomes.append(False)
+
+        if self.state == self.HALF_OPEN:
+            # Пробный запрос упал - снова размыкаем
+            self._trip()
+        elif (self.state == self.CLOSED
+              and len(self.outcomes) >= self.min_requests
+              and self.error_rate >= self.error_threshold):
+            self._trip()
+
+    def record_skipped(self) -> None:
+        """Запрос не дошел до провайдера (наш лимит, нет ключа) - статистику не трогаем"""
+        if self.state == self.HALF_OPEN:
+            self.probe_in_flight = False
+
+    def _trip(self) -> None:
+        """Размыкание автомата"""
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+        self.trips += 1
+
+    def _update_latency(self, latency: float) -> None:
+        """Обновление EWMA задержки"""
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency_ewma
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика провайдера"""
+        return {
+            'state': self.state,
+            'error_rate': self.error_rate,
+            'latency_ewma': self.latency_ewma,
+            'score': self.score(),
+            'requests_in_window': len(self.outcomes),
+            'trips': self.trips
+        }
+
+
+class ProviderHealthRegistry:
+    """Реестр здоровья провайдеров и счетчики переключений (failover)"""
+
+    def __init__(self, preferred_bonus: float = 2.0, **health_options):
+        # Выбранный пользователем провайдер остается первым, пока он не хуже других больше чем на столько секунд
+        self.preferred_bonus = preferred_bonus
+        self.health_options = health_options
+        self.providers: Dict[str, ProviderHealth] = {}
+        self.failover_counts: Dict[str, int] = {}
+
+    def get(self, name: str) -> ProviderHealth:
+        """Получение (или создание) состояния провайдера"""
+        if name not in self.providers:
+            self.providers[name] = ProviderHealth(name, **self.health_options)
+        return self.providers[name]
+
+    def record_failover(self, from_provider: str, to_provider: str) -> None:
+        """Учет переключения с одного провайдера на другой"""
+        key = f"{from_provider}->{to_provider}"
+        self.failover_counts[key] = self.failover_counts.get(key, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика по всем провайдерам"""
+        return {
+            'providers': {name: health.get_stats() for name, health in self.providers.items()},
+            'failovers': dict(self.failover_counts),
+            'total_failovers': sum(self.failover_counts.values())
+        }
+
+    def route(self, preferred: str, order: List[str], demoted: Iterable[str] = ()) -> List[str]:
+        """Порядок обхода провайдеров: замкнутые автоматы по score (выбранному пользователем - бонус),
+        затем разомкнутые; demoted (например, только что упавший в потоковом режиме) - в самый конец"""
+        candidates = [preferred] + [name for name in order if name != preferred]
+        demoted = set(demoted)
+
+        # Провайдер без замеров считаем средним по задержке - не лучше и не хуже остальных
+        known = [self.get(name).latency_ewma for name in candidates if self.get(name).latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else 0.0
+
+        def rank(name: str):
+            health = self.get(name)
+            score = health.score(default_latency) - (self.preferred_bonus if name == preferred else 0.0)
+            return name in demoted, health.state != ProviderHealth.CLOSED, score, candidates.index(name)
+
+        return sorted(candidates, key=rank)
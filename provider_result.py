@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any
+import time
+
+
+class ErrorKind:
+    """Типы ошибок провайдеров"""
+
+    CONFIG = 'config'              # Нет API ключа и т.п.
+    QUOTA = 'quota'                # Исчерпан наш дневной/месячный лимит
+    RATE_LIMIT = 'rate_limit'      # 429 от провайдера
+    TIMEOUT = 'timeout'            # Истек таймаут запроса
+    NETWORK = 'network'            # Ошибка соединения
+    SERVER = 'server'              # 5xx от провайдера
+    CLIENT = 'client'              # 4xx (кроме 429) - запрос неверный
+    BAD_RESPONSE = 'bad_response'  # Ответ не удалось разобрать
+    EMPTY = 'empty'                # Пустой ответ модели
+
+    # Ошибки, после которых имеет смысл повторить запрос или переключиться
+    RETRYABLE = frozenset({RATE_LIMIT, TIMEOUT, NETWORK, SERVER})
+
+    @staticmethod
+    def from_status(status: int) -> str:
+        """Тип ошибки по HTTP статусу"""
+        if status == 429:
+            return ErrorKind.RATE_LIMIT
+        if status in (408, 504):
+            return ErrorKind.TIMEOUT
+        if status >= 500:
+            return ErrorKind.SERVER
+        return ErrorKind.CLIENT
+
+
+@dataclass
+class ProviderResult:
+    """Результат запроса к ИИ провайдеру вместо строк с "❌" """
+
+    content: str = ""
+    error_kind: Optional[str] = None
+    error_message: str = ""
+    status: Optional[int] = None
+    retry_after: Optional[float] = None
+    latency: float = 0.0
+    usage: Dict[str, Any] = field(default_factory=dict)
+    model: Optional[str] = None
+    provider: Optional[str] = None
+    cache_hit: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """Успешный ли ответ"""
+        return self.error_kind is None
+
+    @property
+    def retryable(self) -> bool:
+        """Можно ли повторить запрос"""
+        return self.error_kind in ErrorKind.RETRYABLE
+
+    @property
+    def text(self) -> str:
+        """Текст для пользователя: ответ или сообщение об ошибке"""
+        if self.ok:
+            return self.content
+        return f"❌ {self.error_message}"
+
+    @classmethod
+    def success(cls, content: str, **kwargs) -> 'ProviderResult':
+        """Успешный результат"""
+        return cls(content=content, **kwargs)
+
+    @classmethod
+    def failure(cls, error_kind: str, error_message: str, **kwargs) -> 'ProviderResult':
+        """Результат с ошибкой"""
+        return cls(error_kind=error_kind, error_message=error_message, **kwargs)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбор заголовка Retry-After (секунды или HTTP дата) в секунды"""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import time
+from typing import Dict, Any, Optional
+
+import aiohttp
+from aiohttp import web
+
+from http_pool import HttpPool, shared_pool
+
+
+class ReplicateClient:
+    """Асинхронный клиент Replicate: ожидание результата без блокировки цикла событий.
+
+    Два режима ожидания:
+    - опрос с растущей паузой (по умолчанию);
+    - webhook: Replicate сам присылает итог на REPLICATE_WEBHOOK_URL, ожидание - это просто future.
+    """
+
+    def __init__(self, token: str = None, http_pool: HttpPool = None, base_url: str = None,
+                 webhook_url: str = None, webhook_secret: str = None, timeout: float = None):
+        self.token = token or os.getenv('REPLICATE_TOKEN')
+        self.http_pool = http_pool or shared_pool
+        self.base_url = base_url or os.getenv('REPLICATE_API_URL', 'https://api.replicate.com/v1')
+        self.webhook_url = webhook_url or os.getenv('REPLICATE_WEBHOOK_URL')
+        self.webhook_secret = webhook_secret or os.getenv('REPLICATE_WEBHOOK_SECRET')
+        self.timeout = timeout or float(os.getenv('REPLICATE_TIMEOUT', 120))
+
+        # Пауза между опросами: 0.5с, затем x1.5 до 5с
+        self.poll_initial = 0.5
+        self.poll_factor = 1.5
+        self.poll_max = 5.0
+
+        # Предсказания, ждущие webhook: id -> future с итоговым JSON
+        self.pending: Dict[str, asyncio.Future] = {}
+
+        self.polls = 0
+        self.webhooks_received = 0
+
+    def _headers(self) -> Dict[str, str]:
+        """Заголовки запросов к Replicate"""
+        return {
+            "Authorization": f"Token {self.token}",
+            "Content-Type": "application/json"
+        }
+
+    @property
+    def webhook_mode(self) -> bool:
+        """Ждем ли результаты через webhook"""
+        return bool(self.webhook_url)
+
+    def _webhook_target(self) -> str:
+        """Адрес webhook с секретом (если задан)"""
+        if not self.webhook_secret:
+            return self.webhook_url
+        separator = '&' if '?' in self.webhook_url else '?'
+        return f"{self.webhook_url}{separator}secret={self.webhook_secret}"
+
+    async def create_prediction(self, version: str, input_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Создание предсказания (None - Replicate отказал)"""
+        payload = {"version": version, "input": input_data}
+        if self.webhook_mode:
+            payload["webhook"] = self._webhook_target()
+            payload["webhook_events_filter"] = ["completed"]
+
+        session = await self.http_pool.session()
+        async with session.post(
+            f"{self.base_url}/predictions",
+            headers=self._headers(),
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            if response.status != 201:
+                print(f"Replicate ошибка: {response.status}")
+                return None
+            prediction = await response.json()
+
+        # Future создаем сразу: webhook может прийти раньше, чем мы начнем ждать
+        if self.webhook_mode:
+            self.pending[prediction['id']] = asyncio.get_running_loop().create_future()
+        return prediction
+
+    async def get_prediction(self, prediction_id: str) -> Optional[Dict[str, Any]]:
+        """Текущее состояние предсказания"""
+        self.polls += 1
+        session = await self.http_pool.session()
+        async with session.get(
+            f"{self.base_url}/predictions/{prediction_id}",
+            headers=self._headers(),
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            if response.status != 200:
+                return None
+            return await response.json()
+
+    async def _poll(self, prediction_id: str, deadline_at: float) -> Optional[Dict[str, Any]]:
+        """Опрос с растущей паузой до завершения или дедлайна"""
+        delay = self.poll_initial
+        while time.monotonic() < deadline_at:
+            prediction = await self.get_prediction(prediction_id)
+            if prediction and prediction.get('status') in ('succeeded', 'failed', 'canceled'):
+                return prediction
+
+            await asyncio.sleep(min(delay, max(0.0, deadline_at - time.monotonic())))
+            delay = min(self.poll_max, delay * self.poll_factor)
+        return None
+
+    async def wait(self, prediction_id: str, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """Ожидание завершения предсказания (None - не дождались)"""
+        deadline_at = time.monotonic() + (timeout or self.timeout)
+
+        future = self.pending.get(prediction_id)
+        if future is None:
+            return await self._poll(prediction_id, deadline_at)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=deadline_at - time.monotonic())
+        except asyncio.TimeoutError:
+            # Webhook мог потеряться - последний раз спрашиваем сами
+            prediction = await self.get_prediction(prediction_id)
+            if prediction and prediction.get('status') in ('succeeded', 'failed', 'canceled'):
+                return prediction
+            return None
+        finally:
+            self.pending.pop(prediction_id, None)
+
+    def resolve(self, prediction: Dict[str, Any]) -> bool:
+        """Итог из webhook: будим ожидающего (False - такого предсказания мы не ждем)"""
+        future = self.pending.get(prediction.get('id'))
+        if future is None or future.done():
+            return False
+        self.webhooks_received += 1
+        future.set_result(prediction)
+        return True
+
+    async def download(self, url: str) -> Optional[bytes]:
+        """Скачивание готового файла"""
+        session = await self.http_pool.session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            if response.status != 200:
+                return None
+            return await response.read()
+
+    async def run(self, version: str, input_data: Dict[str, Any], timeout: float = None) -> Optional[bytes]:
+        """Создание предсказания, ожидание и скачивание первого результата"""
+        prediction = await self.create_prediction(version, input_data)
+        if not prediction:
+            return None
+
+        prediction = await self.wait(prediction['id'], timeout)
+        if not prediction:
+            print("Replicate: не дождались результата")
+            return None
+        if prediction.get('status') != 'succeeded':
+            print("Replicate генерация изображения не удалась")
+            return None
+
+        output = prediction.get('output')
+        image_url = output[0] if isinstance(output, list) and output else output
+        if not image_url:
+            return None
+        return await self.download(image_url)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика клиента"""
+        return {
+            'mode': 'webhook' if self.webhook_mode else 'polling',
+            'pending': len(self.pending),
+            'polls': self.polls,
+            'webhooks_received': self.webhooks_received
+        }
+
+
+class ReplicateWebhookServer:
+    """Небольшой HTTP сервер бота, принимающий webhook от Replicate"""
+
+    def __init__(self, client: ReplicateClient, host: str = '0.0.0.0', port: int = None,
+                 path: str = '/replicate/webhook'):
+        self.client = client
+        self.host = host
+        self.port = port or int(os.getenv('REPLICATE_WEBHOOK_PORT', 8080))
+        self.path = path
+        self.runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Прием итогового состояния предсказания"""
+        if self.client.webhook_secret and request.query.get('secret') != self.client.webhook_secret:
+            return web.Response(status=403)
+
+        try:
+            prediction = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        self.client.resolve(prediction)
+        # Отвечаем 200 даже на незнакомые id - иначе Replicate будет повторять
+        return web.Response(text="ok")
+
+    async def start(self) -> None:
+        """Запуск сервера"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        """Остановка сервера"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
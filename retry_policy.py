@@ -0,0 +1,124 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from provider_result import ProviderResult, ErrorKind
+
+
+class RetryBudget:
+    """Бюджет повторов на весь процесс: повторы не могут превысить долю от обычных запросов"""
+
+    def __init__(self, ratio: float = None, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio if ratio is not None else float(os.getenv('RETRY_BUDGET_RATIO', 0.2))
+        self.min_per_second = min_per_second
+        self.window = window
+
+        self.requests = deque()
+        self.retries = deque()
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        """Убираем события старше окна"""
+        for events in (self.requests, self.retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        """Учет первичного запроса (пополняет бюджет)"""
+        now = time.monotonic()
+        self._trim(now)
+        self.requests.append(now)
+
+    def try_retry(self) -> bool:
+        """Можно ли сделать еще один повтор (списывает из бюджета)"""
+        now = time.monotonic()
+        self._trim(now)
+
+        allowed = self.min_per_second * self.window + self.ratio * len(self.requests)
+        if len(self.retries) >= allowed:
+            self.rejected += 1
+            return False
+
+        self.retries.append(now)
+        return True
+
+    def get_stats(self) -> dict:
+        """Статистика бюджета"""
+        self._trim(time.monotonic())
+        return {
+            'requests_in_window': len(self.requests),
+            'retries_in_window': len(self.retries),
+            'rejected_retries': self.rejected
+        }
+
+
+class RetryPolicy:
+    """Повторы с decorrelated jitter, учетом Retry-After, общим дедлайном и бюджетом повторов"""
+
+    # Статусы, при которых запрос не был выполнен и его безопасно повторить
+    RETRY_STATUSES = frozenset({408, 429, 502, 503, 504})
+
+    def __init__(self, max_attempts: int = None, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: float = None, budget: RetryBudget = None):
+        self.max_attempts = max_attempts or int(os.getenv('RETRY_MAX_ATTEMPTS', 3))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline or float(os.getenv('RETRY_DEADLINE', 90))
+        self.budget = budget or shared_retry_budget
+
+        self.retries = 0
+
+    def should_retry(self, result: ProviderResult) -> bool:
+        """Повторяем только ошибки, после которых запрос точно не был обработан.
+
+        Таймаут чтения без статуса не повторяем: POST к модели мог уже выполниться
+        (и списать токены), повтор сделал бы второй платный запрос.
+        """
+        if result.ok:
+            return False
+        if result.status is not None:
+            return result.status in self.RETRY_STATUSES
+        return result.error_kind == ErrorKind.NETWORK
+
+    def next_delay(self, previous_delay: float) -> float:
+        """Decorrelated jitter: случайная пауза между base и 3x предыдущей"""
+        return min(self.max_delay, random.uniform(self.base_delay, previous_delay * 3))
+
+    async def run(self, call: Callable[[], Awaitable[ProviderResult]], deadline: float = None) -> ProviderResult:
+        """Выполнение запроса с повторами в пределах дедлайна"""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        delay = self.base_delay
+        self.budget.record_request()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline_at - time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return ProviderResult.failure(ErrorKind.TIMEOUT, "Превышено общее время ожидания ответа")
+
+            if not self.should_retry(result) or attempt >= self.max_attempts:
+                return result
+
+            # Retry-After от провайдера важнее нашей паузы: ждем его целиком (раньше повторять
+            # бессмысленно), а если он дальше дедлайна - отдаем ответ без повтора
+            if result.retry_after is not None:
+                delay = result.retry_after
+            else:
+                delay = self.next_delay(delay)
+
+            # Не успеем до дедлайна или бюджет исчерпан - отдаем как есть
+            if time.monotonic() + delay >= deadline_at or not self.budget.try_retry():
+                return result
+
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+
+# Один бюджет повторов на процесс - повторы всех провайдеров не должны усиливать аварию
+shared_retry_budget = RetryBudget()
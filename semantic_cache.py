@@ -0,0 +1,235 @@
+import asyncio
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Optional, Dict, Any, Hashable, List, Tuple
+
+import numpy as np
+
+from provider_result import ProviderResult
+
+
+# Слова, которые переворачивают смысл запроса при почти том же тексте
+NEGATIONS = frozenset({'не', 'нет', 'ни', 'без', 'not', 'no', 'never', 'without'})
+
+
+def exact_terms(text: str) -> Tuple[str, ...]:
+    """Части запроса, которые должны совпасть буквально: числа и отрицания"""
+    return tuple(
+        token for token in re.findall(r'\d+(?:[.,]\d+)?|\w+', text.lower())
+        if token[0].isdigit() or token in NEGATIONS
+    )
+
+
+class HashedNgramVectorizer:
+    """Векторизатор без сети: хэшированные символьные n-граммы + TF-IDF.
+
+    IDF набирается по первым idf_warmup текстам и затем замораживается: после этого вектор
+    текста больше не зависит от содержимого кэша, и точный повтор всегда дает сходство 1.0.
+    До заморозки векторы строятся без IDF (тоже одинаково для сохраненных и искомых).
+    """
+
+    def __init__(self, n_features: int = 1024, ngram_range: tuple = (3, 5), idf_warmup: int = 500):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.idf_warmup = idf_warmup
+
+        self.doc_freq = np.zeros(n_features, dtype=np.float32)
+        self.n_docs = 0
+        self.idf: Optional[np.ndarray] = None
+
+    def observe(self, text: str) -> bool:
+        """Учет текста в IDF до заморозки; True - IDF только что заморожен"""
+        if self.idf is not None:
+            return False
+        self.doc_freq[list(self._features(text))] += 1
+        self.n_docs += 1
+        if self.n_docs < self.idf_warmup:
+            return False
+        self.idf = (np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1).astype(np.float32)
+        return True
+
+    def _features(self, text: str) -> Dict[int, int]:
+        """Счетчики хэшированных n-грамм текста"""
+        text = " " + re.sub(r'\s+', ' ', text.lower().strip()) + " "
+        counts: Dict[int, int] = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                index = zlib.crc32(text[i:i + n].encode('utf-8')) % self.n_features
+                counts[index] = counts.get(index, 0) + 1
+        return counts
+
+    def transform(self, text: str) -> np.ndarray:
+        """Нормированный TF-IDF вектор текста (до заморозки IDF - только TF)"""
+        counts = self._features(text)
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        if not counts:
+            return vector
+
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        vector[indices] = 1 + np.log(tf)
+        if self.idf is not None:
+            vector *= self.idf
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """Кэш похожих запросов: ближайший сохраненный запрос ищется одним умножением матрицы на вектор.
+
+    Символьные n-граммы не различают "факториал 10" и "факториал 12" или "люблю" и "не люблю",
+    поэтому порог высокий, числа и отрицания должны совпасть буквально, а кэш включен только
+    для типов запросов, где близкий ответ годится (по умолчанию chat и search, не code и solve).
+
+    Поиск и добавление выполняются в отдельном потоке: проход по матрице не блокирует
+    цикл событий, а единственный поток сериализует чтение и запись.
+    """
+
+    # Сколько лучших кандидатов проверять на буквальное совпадение чисел и отрицаний
+    TOP_CANDIDATES = 5
+
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl: float = None,
+                 n_features: int = None, intents: set = None, idf_warmup: int = None):
+        self.threshold = threshold or float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.95))
+        self.max_entries = max_entries or int(os.getenv('SEMANTIC_CACHE_SIZE', 5000))
+        self.ttl = ttl or float(os.getenv('SEMANTIC_CACHE_TTL', 3600))
+        n_features = n_features or int(os.getenv('SEMANTIC_CACHE_FEATURES', 1024))
+
+        idf_warmup = idf_warmup or int(os.getenv('SEMANTIC_CACHE_IDF_WARMUP', 500))
+        self.vectorizer = HashedNgramVectorizer(n_features, idf_warmup=idf_warmup)
+
+        # Типы запросов, для которых кэш похожих включен (через запятую)
+        if intents is None:
+            intents = {
+                intent.strip() for intent in os.getenv('SEMANTIC_CACHE_INTENTS', 'chat,search').split(',')
+                if intent.strip()
+            }
+        self.intents = intents
+
+        # Память выделяется один раз: max_entries x n_features float32
+        self.vectors = np.zeros((self.max_entries, n_features), dtype=np.float32)
+        self.groups = np.full(self.max_entries, -1, dtype=np.int32)
+        self.stored_at = np.zeros(self.max_entries, dtype=np.float64)
+        self.last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self.results: List[Optional[ProviderResult]] = [None] * self.max_entries
+        self.terms: List[Tuple[str, ...]] = [()] * self.max_entries
+        self.size = 0
+
+        # Ответы ищем только внутри своей группы (модель + тип запроса)
+        self.group_ids: Dict[Hashable, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='semantic-cache')
+
+    def is_enabled(self, intent: Optional[str]) -> bool:
+        """Ищутся ли похожие ответы для этого типа запроса"""
+        return intent in self.intents
+
+    def _group_id(self, group: Hashable) -> int:
+        """Числовой id группы"""
+        if group not in self.group_ids:
+            self.group_ids[group] = len(self.group_ids)
+        return self.group_ids[group]
+
+    async def lookup(self, group: Hashable, text: str) -> Optional[ProviderResult]:
+        """Поиск ответа на похожий запрос (None - похожих нет)"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._lookup, group, text)
+
+    async def add(self, group: Hashable, text: str, result: ProviderResult) -> None:
+        """Сохранение ответа на запрос"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._add, group, text, result)
+
+    def _lookup(self, group: Hashable, text: str) -> Optional[ProviderResult]:
+        """Поиск в потоке кэша"""
+        if self.size == 0 or group not in self.group_ids:
+            self.misses += 1
+            return None
+
+        query = self.vectorizer.transform(text)
+        similarity = self.vectors[:self.size] @ query
+
+        # Чужие группы и просроченные записи не участвуют
+        now = time.monotonic()
+        valid = (self.groups[:self.size] == self.group_ids[group]) & (now - self.stored_at[:self.size] <= self.ttl)
+        similarity = np.where(valid, similarity, -1.0)
+
+        # Из лучших кандидатов над порогом берем первый с теми же числами и отрицаниями
+        count = min(self.TOP_CANDIDATES, self.size)
+        top = np.argpartition(-similarity, count - 1)[:count]
+        terms = exact_terms(text)
+        best = next(
+            (int(index) for index in top[np.argsort(-similarity[top])]
+             if similarity[index] >= self.threshold and self.terms[index] == terms),
+            None
+        )
+        if best is None:
+            self.misses += 1
+            return None
+
+        self.last_used[best] = now
+        self.hits += 1
+        result = self.results[best]
+        return replace(result, cache_hit=True, latency=0.0)
+
+    def _add(self, group: Hashable, text: str, result: ProviderResult) -> None:
+        """Сохранение в потоке кэша; при переполнении вытесняется давно не использованная запись"""
+        if not result.ok:
+            return
+
+        if self.size < self.max_entries:
+            slot = self.size
+            self.size += 1
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.evictions += 1
+
+        if self.vectorizer.observe(text):
+            # IDF заморожен - один раз перевзвешиваем записи, сохраненные без него
+            stored = self.vectors[:self.size]
+            stored *= self.vectorizer.idf
+            norms = np.linalg.norm(stored, axis=1, keepdims=True)
+            np.divide(stored, norms, out=stored, where=norms > 0)
+
+        now = time.monotonic()
+        self.vectors[slot] = self.vectorizer.transform(text)
+        self.terms[slot] = exact_terms(text)
+        self.groups[slot] = self._group_id(group)
+        self.stored_at[slot] = now
+        self.last_used[slot] = now
+        self.results[slot] = result
+
+    def close(self) -> None:
+        """Остановка потока кэша"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def clear(self) -> None:
+        """Очистка кэша"""
+        self.size = 0
+        self.groups[:] = -1
+        self.results = [None] * self.max_entries
+        self.terms = [()] * self.max_entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': self.size,
+            'max_size': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+            'idf_frozen': self.vectorizer.idf is not None,
+            'memory_bytes': self.vectors.nbytes
+        }
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Any
+
+
+class _Flight:
+    """Один запрос в полете и число ждущих его вызовов"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Склейка одинаковых одновременных запросов: все вызовы с одним ключом ждут один общий запрос"""
+
+    def __init__(self):
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнение call() один раз на ключ; отмена одного ждущего не отменяет запрос для остальных"""
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # shield: отмена этого вызова не доходит до общей задачи
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Ушел последний ждущий - запрос больше никому не нужен
+                flight.task.cancel()
+                self.cancelled += 1
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        """Запрос завершился - следующий вызов с этим ключом пойдет к провайдеру заново"""
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        # Забираем исключение, чтобы asyncio не ругался, если ждущих уже нет
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Статистика склейки"""
+        return {
+            'in_flight': len(self.flights),
+            'started': self.started,
+            'coalesced': self.coalesced,
+            'cancelled': self.cancelled
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from context_builder import as_message
+from history_store import HistoryStore
+from provider_result import ProviderResult
+
+SUMMARY_PROMPT = """Сожми начало диалога пользователя с ассистентом в краткую сводку (до 120 слов).
+Сохрани факты о пользователе, его цели, принятые решения и открытые вопросы. Без вступлений, только сводка.
+
+{previous}Реплики:
+{turns}"""
+
+
+class ConversationSummarizer:
+    """Фоновое сжатие длинных диалогов.
+
+    Когда в истории пользователя набирается trigger_turns реплик, все, кроме последних keep_turns,
+    в фоне сжимаются дешевой моделью в сводку (вместе с прежней сводкой) и заменяются ею в истории.
+    Сводка хранится в HistoryStore вместе с репликами (и выгружается с ними на диск) и подставляется
+    в начало следующих контекстов. Запрос пользователя никогда ее не ждет: пока сжатие идет,
+    используется прежняя сводка. После неудачного сжатия следующая попытка для пользователя
+    откладывается на retry_after секунд, при повторных неудачах - вдвое дольше (до max_backoff).
+    """
+
+    def __init__(self, summarize: Callable[[str], Awaitable[ProviderResult]], history: HistoryStore,
+                 trigger_turns: int = None, keep_turns: int = None, max_users: int = None,
+                 retry_after: float = None, max_backoff: float = None):
+        self.summarize = summarize
+        self.history = history
+        self.trigger_turns = trigger_turns or int(os.getenv('SUMMARY_TRIGGER_TURNS', 8))
+        self.keep_turns = keep_turns or int(os.getenv('SUMMARY_KEEP_TURNS', 4))
+        self.max_users = max_users or int(os.getenv('SUMMARY_CACHE_SIZE', 10000))
+        self.retry_after = retry_after or float(os.getenv('SUMMARY_RETRY_AFTER', 60))
+        self.max_backoff = max_backoff or float(os.getenv('SUMMARY_MAX_BACKOFF', 3600))
+
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+
+        # user_id -> (число неудач подряд, время по monotonic, до которого не пробуем)
+        self.backoff: 'OrderedDict[Hashable, Tuple[int, float]]' = OrderedDict()
+
+        # /start во время сжатия: устаревший результат не сохраняем (не больше max_users записей)
+        self.epochs: 'OrderedDict[Hashable, int]' = OrderedDict()
+
+        self.stats = {'runs': 0, 'saved': 0, 'failures': 0, 'discarded': 0, 'skipped_backoff': 0,
+                      'turns_summarized': 0}
+
+    async def get(self, user_id: Hashable) -> Optional[str]:
+        """Текущая сводка пользователя"""
+        return await self.history.get_summary(user_id)
+
+    def schedule(self, user_id: Hashable, turns: List[Any]) -> None:
+        """Запуск сжатия в фоне, если история длинная и сжатие для пользователя еще не идет"""
+        if len(turns) < self.trigger_turns or user_id in self.tasks:
+            return
+        if user_id in self.backoff and time.monotonic() < self.backoff[user_id][1]:
+            self.stats['skipped_backoff'] += 1
+            return
+        old_turns = turns[:-self.keep_turns]
+        task = asyncio.create_task(self._summarize(user_id, old_turns))
+        self.tasks[user_id] = task
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+
+    def _forget(self, user_id: Hashable, task: asyncio.Task) -> None:
+        """Снятие завершенной задачи, если после /start для пользователя еще не запущена новая"""
+        if self.tasks.get(user_id) is task:
+            del self.tasks[user_id]
+
+    def invalidate(self, user_id: Hashable) -> None:
+        """Сброс сжатия (например, по /start; саму сводку удаляет HistoryStore.clear)"""
+        self.backoff.pop(user_id, None)
+        self.epochs[user_id] = self.epochs.pop(user_id, 0) + 1
+        while len(self.epochs) > self.max_users:
+            self.epochs.popitem(last=False)
+        task = self.tasks.pop(user_id, None)
+        if task:
+            task.cancel()
+
+    async def _summarize(self, user_id: Hashable, old_turns: List[Any]) -> None:
+        """Сжатие старых реплик вместе с прежней сводкой"""
+        epoch = self.epochs.get(user_id, 0)
+        previous = await self.history.get_summary(user_id)
+
+        lines = []
+        for turn in map(as_message, old_turns):
+            speaker = 'Ассистент' if turn['role'] == 'assistant' else 'Пользователь'
+            lines.append(f"{speaker}: {turn['content']}")
+        prompt = SUMMARY_PROMPT.format(
+            previous=f"Прежняя сводка:\n{previous}\n\n" if previous else "",
+            turns="\n".join(lines)
+        )
+
+        self.stats['runs'] += 1
+        try:
+            result = await self.summarize(prompt)
+        except Exception as e:
+            result = None
+            print(f"Ошибка сжатия истории: {e}")
+        if result is None or not result.ok or not result.content.strip():
+            self.stats['failures'] += 1
+            self._back_off(user_id)
+            return
+
+        if self.epochs.get(user_id, 0) != epoch:
+            self.stats['discarded'] += 1
+            return
+
+        # Сжатые реплики заменяются сводкой в истории - на диск они уходят только вместе
+        self.stats['turns_summarized'] += await self.history.trim_prefix(user_id, old_turns, result.content.strip())
+        self.stats['saved'] += 1
+        self.backoff.pop(user_id, None)
+
+    def _back_off(self, user_id: Hashable) -> None:
+        """Откладывание следующей попытки после неудачи"""
+        failures = self.backoff.pop(user_id, (0, 0.0))[0] + 1
+        delay = min(self.retry_after * 2 ** (failures - 1), self.max_backoff)
+        self.backoff[user_id] = (failures, time.monotonic() + delay)
+        while len(self.backoff) > self.max_users:
+            self.backoff.popitem(last=False)
+
+    async def close(self) -> None:
+        """Отмена незавершенных сжатий"""
+        for task in list(self.tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика сжатия"""
+        return {**self.stats, 'in_progress': len(self.tasks), 'backing_off': len(self.backoff)}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Проверки допуска запросов (запуск: python test_admission.py или pytest)"""
+import asyncio
+
+from admission import AdmissionGate, AimdLimit, format_admission
+
+
+async def check_aimd_uses_first_byte_latency():
+    """Долгая генерация после быстрого первого байта не считается скачком задержки"""
+    gate = AdmissionGate('model', max_in_flight=4, aimd=AimdLimit(cooldown=0))
+
+    for _ in range(3):
+        async with gate.slot() as ticket:
+            ticket.respond(200)
+            await asyncio.sleep(0.01)
+
+    # Ответ в 10 раз длиннее, но первый байт так же быстро - лимит не снижается
+    async with gate.slot() as ticket:
+        ticket.respond(200)
+        await asyncio.sleep(0.1)
+
+    assert gate.aimd.decreases == 0
+    assert gate.aimd.latency_ewma < 0.01
+
+
+async def check_cancelled_not_counted():
+    """Отмененный запрос не влияет на подстройку лимита"""
+    gate = AdmissionGate('model', max_in_flight=4, aimd=AimdLimit())
+
+    async def request():
+        async with gate.slot() as ticket:
+            ticket.respond(200)
+            await asyncio.sleep(1)
+
+    task = asyncio.create_task(request())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert gate.aimd.latency_ewma is None
+    assert gate.get_stats()['cancelled'] == 1
+
+
+def test_aimd_uses_first_byte_latency():
+    asyncio.run(check_aimd_uses_first_byte_latency())
+
+
+def test_cancelled_not_counted():
+    asyncio.run(check_cancelled_not_counted())
+
+
+def test_format_admission_empty():
+    assert format_admission({'models': {}}) == "• запросов еще не было"
+
+
+if __name__ == "__main__":
+    test_aimd_uses_first_byte_latency()
+    test_cancelled_not_counted()
+    test_format_admission_empty()
+    print("✅ Все проверки допуска запросов пройдены")
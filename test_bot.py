@@ -16,12 +16,13 @@ async def test_ai_services():
         
         # Тест генерации текста
         print("📝 Тест генерации текста...")
-        response = await ai.generate_text_response("Привет! Как дела?")
+        result = await ai.generate_text_response("Привет! Как дела?")
+        response = result.text
         print(f"✅ Ответ: {response[:100]}...")
         
         # Тест генерации кода
         print("💻 Тест генерации кода...")
-        code = await ai.generate_code("функция для сортировки списка")
+        code = (await ai.generate_code("функция для сортировки списка")).text
         print(f"✅ Код: {code[:100]}...")
         
         # Тест статистики
@@ -30,11 +31,12 @@ async def test_ai_services():
         print(f"✅ Статистика: {stats}")
         
         print("🎉 Все тесты ИИ сервисов прошли успешно!")
+        await ai.close()
         
     except Exception as e:
         print(f"❌ Ошибка в ИИ сервисах: {e}")
 
-def test_huggingface_client():
+async def test_huggingface_client():
     """Тестирование Hugging Face клиента"""
     print("🤗 Тестирование Hugging Face клиента...")
     
@@ -43,17 +45,18 @@ def test_huggingface_client():
         
         # Тест подключения
         print("🔗 Тест подключения...")
-        if client.test_connection():
+        if await client.test_connection():
             print("✅ Подключение к Hugging Face успешно!")
         else:
             print("⚠️ Проблемы с подключением к Hugging Face")
         
         # Тест доступных моделей
         print("📋 Тест доступных моделей...")
-        models = client.get_available_models()
+        models = await client.get_available_models()
         print(f"✅ Доступно моделей: {len(models)}")
         
         print("🎉 Все тесты Hugging Face клиента прошли успешно!")
+        await client.http_pool.close()
         
     except Exception as e:
         print(f"❌ Ошибка в Hugging Face клиенте: {e}")
@@ -89,7 +92,7 @@ def main():
     test_config()
     print()
     
-    test_huggingface_client()
+    asyncio.run(test_huggingface_client())
     print()
     
     asyncio.run(test_ai_services())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Проверки планировщика запросов (запуск: python test_fair_scheduler.py или pytest)"""
+import asyncio
+
+from fair_scheduler import FairScheduler
+
+
+async def check_code_not_starved_by_chat():
+    """Непрерывный поток чата не откладывает задачу кода навсегда"""
+    scheduler = FairScheduler(max_concurrent=2, per_user=1, chat_reserved_share=0.5)
+    stop = asyncio.Event()
+    chat_done = 0
+
+    async def chat_user(user_id: int):
+        nonlocal chat_done
+        while not stop.is_set():
+            async with scheduler.slot(user_id, lane='chat'):
+                await asyncio.sleep(0.01)
+            chat_done += 1
+
+    async def code_job():
+        async with scheduler.slot('coder', lane='code'):
+            await asyncio.sleep(0.01)
+
+    chat = [asyncio.create_task(chat_user(i)) for i in range(20)]
+    await asyncio.sleep(0.05)  # Очередь чата уже забита
+    try:
+        await asyncio.wait_for(code_job(), timeout=2)
+    finally:
+        stop.set()
+        await asyncio.gather(*chat)
+
+    assert chat_done > 0
+    assert scheduler.get_stats()['lanes']['code']['dispatched'] == 1
+
+
+async def check_weights_split_slots():
+    """При очередях во всех полосах места делятся по весам"""
+    scheduler = FairScheduler(max_concurrent=1, per_user=1, chat_reserved_share=0,
+                              lane_weights={'chat': 3, 'code': 1})
+    order = []
+
+    async def job(user_id: str, lane: str):
+        async with scheduler.slot(user_id, lane=lane):
+            order.append(lane)
+            await asyncio.sleep(0)
+
+    blocker = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot('holder', lane='chat'):
+            await blocker.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    jobs = [asyncio.create_task(job(f'chat{i}', 'chat')) for i in range(6)]
+    jobs += [asyncio.create_task(job(f'code{i}', 'code')) for i in range(2)]
+    await asyncio.sleep(0)
+    blocker.set()
+    await asyncio.gather(holder, *jobs)
+
+    # Вес 3:1 - в каждых четырех выдачах ровно одна задача кода
+    assert [order[i:i + 4].count('code') for i in (0, 4)] == [1, 1], order
+
+
+def test_code_not_starved_by_chat():
+    asyncio.run(check_code_not_starved_by_chat())
+
+
+def test_weights_split_slots():
+    asyncio.run(check_weights_split_slots())
+
+
+if __name__ == "__main__":
+    test_code_not_starved_by_chat()
+    test_weights_split_slots()
+    print("✅ Все проверки планировщика пройдены")
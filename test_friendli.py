@@ -24,11 +24,12 @@ async def test_friendli_services():
     # Тест генерации текста
     print("📝 Тест генерации текста (основной чат)...")
     try:
-        response = await friendli_services.generate_text_response(
+        result = await friendli_services.generate_text_response(
             "Привет! Расскажи кратко о том, что такое искусственный интеллект.",
             max_tokens=500,
             model='qwen3_highlights'
         )
+        response = result.text
         print(f"✅ Ответ получен! Длина: {len(response)} символов")
         print(f"📄 Первые 200 символов: {response[:200]}...")
     except Exception as e:
@@ -39,10 +40,11 @@ async def test_friendli_services():
     # Тест генерации кода
     print("💻 Тест генерации кода...")
     try:
-        response = await friendli_services.generate_code(
+        result = await friendli_services.generate_code(
             "создай функцию для сортировки списка чисел",
             model='qwen3_highlights'
         )
+        response = result.text
         print(f"✅ Код сгенерирован! Длина: {len(response)} символов")
         print(f"📄 Первые 300 символов: {response[:300]}...")
     except Exception as e:
@@ -53,10 +55,11 @@ async def test_friendli_services():
     # Тест решения задач
     print("🧮 Тест решения задач...")
     try:
-        response = await friendli_services.solve_problem(
+        result = await friendli_services.solve_problem(
             "вычисли факториал числа 5",
             model='qwen3_highlights'
         )
+        response = result.text
         print(f"✅ Задача решена! Длина: {len(response)} символов")
         print(f"📄 Первые 300 символов: {response[:300]}...")
     except Exception as e:
@@ -67,10 +70,11 @@ async def test_friendli_services():
     # Тест поиска информации
     print("🔍 Тест поиска информации...")
     try:
-        response = await friendli_services.search_information(
+        result = await friendli_services.search_information(
             "что такое машинное обучение",
             model='qwen3_highlights'
         )
+        response = result.text
         print(f"✅ Информация найдена! Длина: {len(response)} символов")
         print(f"📄 Первые 300 символов: {response[:300]}...")
     except Exception as e:
@@ -81,10 +85,11 @@ async def test_friendli_services():
     # Тест чата
     print("💬 Тест обычного общения...")
     try:
-        response = await friendli_services.chat_response(
+        result = await friendli_services.chat_response(
             "расскажи анекдот про программистов",
             model='qwen3_highlights'
         )
+        response = result.text
         print(f"✅ Чат работает! Длина: {len(response)} символов")
         print(f"📄 Первые 300 символов: {response[:300]}...")
     except Exception as e:
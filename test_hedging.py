@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Проверки хеджирования OpenRouter на локальном SSE сервере (запуск: python test_hedging.py или pytest)"""
+import asyncio
+import json
+
+from aiohttp import web
+
+from hedging import FirstTokenTracker
+from openrouter_services import OpenRouterServices
+
+
+async def start_server(delays: dict):
+    """Локальный /chat/completions: отдает один токен через delays[модель] секунд"""
+    calls = []
+
+    async def completions(request):
+        body = await request.json()
+        calls.append(body['model'])
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await asyncio.sleep(delays.get(body['model'], 0))
+        chunk = {'choices': [{'delta': {'content': f"ответ {body['model']}"}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+        return response
+
+    app = web.Application()
+    app.router.add_post('/chat/completions', completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}", calls
+
+
+async def run_race(delays: dict, hedge_budget: int = 50):
+    runner, url, calls = await start_server(delays)
+    services = OpenRouterServices()
+    services.api_key = 'test'
+    services.base_url = url
+    services.first_token = FirstTokenTracker(default_deadline=0.2)
+    services.daily_limits['paid_hedges'] = hedge_budget
+    await services.start()
+    try:
+        result = await services.generate_text_response("привет", model='deepseek')
+        await asyncio.sleep(0.05)  # Отмененный участник успевает закрыться
+        return result, services.get_usage_stats(), calls
+    finally:
+        await services.close()
+        await runner.cleanup()
+
+
+def free_and_paid(services_models: dict):
+    return services_models['deepseek'], services_models['deepseek_large']
+
+
+def test_deadline_is_p90():
+    """Дедлайн хеджа - p90 времени до первого токена, пока замеров мало - значение по умолчанию"""
+    tracker = FirstTokenTracker(min_samples=20, default_deadline=8)
+    for i in range(1, 20):
+        tracker.record('m', i / 10)
+    assert tracker.deadline('m') == 8
+    tracker.record('m', 2.0)
+    assert tracker.deadline('m') == 1.9
+
+
+def test_slow_primary_hedged_and_cancelled():
+    """Основная модель молчит дольше дедлайна - хедж отвечает первым, основная отменяется и не учитывается"""
+    free, paid = free_and_paid(OpenRouterServices().available_models)
+    result, stats, calls = asyncio.run(run_race({free: 2.0}))
+
+    assert result.ok and result.content == f"ответ {paid}"
+    assert calls == [free, paid]
+    assert stats['hedging']['fired'] == 1
+    assert stats['hedging']['won'] == 1
+    assert stats['hedging']['cancelled'] == 1
+    assert stats['free_models_used'] == 0
+    assert stats['paid_models_used'] == 1
+    assert stats['admission']['models'][free]['cancelled'] == 1
+
+
+def test_fast_primary_not_hedged():
+    """Основная модель ответила до дедлайна - хедж не запускается"""
+    free, _ = free_and_paid(OpenRouterServices().available_models)
+    result, stats, calls = asyncio.run(run_race({}))
+
+    assert result.ok and result.content == f"ответ {free}"
+    assert calls == [free]
+    assert stats['hedging']['fired'] == 0
+    assert stats['hedging']['cancelled'] == 0
+    assert stats['free_models_used'] == 1
+
+
+def test_no_hedge_without_budget():
+    """Бюджет хеджей исчерпан - ждем основную модель"""
+    free, _ = free_and_paid(OpenRouterServices().available_models)
+    result, stats, calls = asyncio.run(run_race({free: 0.4}, hedge_budget=0))
+
+    assert result.ok and result.content == f"ответ {free}"
+    assert calls == [free]
+    assert stats['hedging']['skipped_budget'] == 1
+    assert stats['hedging']['fired'] == 0
+
+
+if __name__ == "__main__":
+    test_deadline_is_p90()
+    test_slow_primary_hedged_and_cancelled()
+    test_fast_primary_not_hedged()
+    test_no_hedge_without_budget()
+    print("✅ Все проверки хеджирования пройдены")
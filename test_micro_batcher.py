@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Проверки склейки вызовов в пачки (запуск: python test_micro_batcher.py или pytest)"""
+import asyncio
+
+from micro_batcher import MicroBatcher
+
+
+def make_batcher(**kwargs):
+    requests = []
+
+    async def send_batch(key, items):
+        requests.append((key, list(items)))
+        await asyncio.sleep(0)
+        return [f"{key}:{item}" for item in items]
+
+    return MicroBatcher(send_batch, **kwargs), requests
+
+
+async def check_concurrent_submits_one_request():
+    """Одновременные вызовы одной модели уходят одним запросом, каждый получает свой результат"""
+    batcher, requests = make_batcher(max_batch=100, max_wait=0.01)
+    texts = [f"текст {i}" for i in range(10)]
+
+    results = await asyncio.gather(*(batcher.submit('sst2', text) for text in texts))
+
+    assert requests == [('sst2', texts)]
+    assert results == [f"sst2:{text}" for text in texts]
+    assert batcher.get_stats() == {'batches': 1, 'items': 10, 'avg_batch_size': 10.0}
+
+
+async def check_split_by_key_and_size():
+    """Разные модели не смешиваются, пачка не больше max_batch"""
+    batcher, requests = make_batcher(max_batch=4, max_wait=0.01)
+
+    await asyncio.gather(*(batcher.submit('sst2', i) for i in range(6)),
+                         batcher.submit('opus-mt', 'привет'))
+
+    assert sorted(requests) == [('opus-mt', ['привет']), ('sst2', [0, 1, 2, 3]), ('sst2', [4, 5])]
+
+
+async def check_batch_error_reaches_every_caller():
+    """Ошибка запроса пачки достается каждому вызову"""
+    async def send_batch(key, items):
+        raise RuntimeError("недоступно")
+
+    batcher = MicroBatcher(send_batch, max_batch=10, max_wait=0.01)
+    results = await asyncio.gather(batcher.submit('sst2', 1), batcher.submit('sst2', 2),
+                                   return_exceptions=True)
+
+    assert [str(result) for result in results] == ["недоступно", "недоступно"]
+    assert batcher.get_stats()['batches'] == 1
+
+
+def test_concurrent_submits_one_request():
+    asyncio.run(check_concurrent_submits_one_request())
+
+
+def test_split_by_key_and_size():
+    asyncio.run(check_split_by_key_and_size())
+
+
+def test_batch_error_reaches_every_caller():
+    asyncio.run(check_batch_error_reaches_every_caller())
+
+
+if __name__ == "__main__":
+    test_concurrent_submits_one_request()
+    test_split_by_key_and_size()
+    test_batch_error_reaches_every_caller()
+    print("✅ Все проверки склейки вызовов пройдены")
@@ -13,25 +13,28 @@ async def test_openrouter_services():
     print("-" * 50)
     
     ai_services = OpenRouterServices()
+    await ai_services.start()
     
     # Тест подключения
     print("🔌 Тест подключения к OpenRouter...")
-    if ai_services.test_connection():
+    if await ai_services.test_connection():
         print("✅ Подключение к OpenRouter успешно!")
     else:
         print("❌ Не удалось подключиться к OpenRouter")
         print("💡 Проверьте API ключ и интернет-соединение")
+        await ai_services.close()
         return
     
     # Тест генерации текста (основной функционал чата)
     print("\n📝 Тест генерации текста (основной чат)...")
     try:
-        response = await ai_services.generate_text_response(
+        result = await ai_services.generate_text_response(
             "Объясни принципы работы нейронных сетей простыми словами",
             max_tokens=500,
             model='deepseek'
         )
-        if response.startswith("❌"):
+        response = result.text
+        if not result.ok:
             print(f"❌ Ошибка: {response}")
         else:
             print("✅ Генерация текста успешна!")
@@ -59,12 +62,13 @@ async def test_openrouter_services():
 ## Объяснение:
 Детальное объяснение решения"""
         
-        response = await ai_services.generate_text_response(
+        result = await ai_services.generate_text_response(
             enhanced_prompt,
             max_tokens=1000,
             model='deepseek'
         )
-        if response.startswith("❌"):
+        response = result.text
+        if not result.ok:
             print(f"❌ Ошибка: {response}")
         else:
             print("✅ Генерация кода через чат успешна!")
@@ -86,12 +90,13 @@ async def test_openrouter_services():
 
 Дай подробный, понятный ответ с примерами."""
         
-        response = await ai_services.generate_text_response(
+        result = await ai_services.generate_text_response(
             enhanced_prompt,
             max_tokens=800,
             model='deepseek'
         )
-        if response.startswith("❌"):
+        response = result.text
+        if not result.ok:
             print(f"❌ Ошибка: {response}")
         else:
             print("✅ Решение задачи через чат успешно!")
@@ -113,12 +118,13 @@ async def test_openrouter_services():
 
 Предоставь глубокий, информативный ответ."""
         
-        response = await ai_services.generate_text_response(
+        result = await ai_services.generate_text_response(
             enhanced_prompt,
             max_tokens=600,
             model='deepseek'
         )
-        if response.startswith("❌"):
+        response = result.text
+        if not result.ok:
             print(f"❌ Ошибка: {response}")
         else:
             print("✅ Поиск информации через чат успешен!")
@@ -140,12 +146,13 @@ async def test_openrouter_services():
 
 Дай качественный, полезный ответ."""
         
-        response = await ai_services.generate_text_response(
+        result = await ai_services.generate_text_response(
             enhanced_prompt,
             max_tokens=400,
             model='deepseek'
         )
-        if response.startswith("❌"):
+        response = result.text
+        if not result.ok:
             print(f"❌ Ошибка: {response}")
         else:
             print("✅ Обычное общение работает!")
@@ -163,6 +170,8 @@ async def test_openrouter_services():
         print(f"🔄 Сброс: {stats['reset_time']}")
     except Exception as e:
         print(f"❌ Ошибка при получении статистики: {e}")
+    
+    await ai_services.close()
 
 def test_config():
     """Тестирование конфигурации"""
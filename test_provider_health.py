@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Проверки маршрутизации по здоровью провайдеров (запуск: python test_provider_health.py или pytest)"""
+from provider_health import ProviderHealth, ProviderHealthRegistry
+
+ORDER = ['friendli', 'openrouter', 'free']
+
+
+def record(registry: ProviderHealthRegistry, name: str, successes: int, failures: int, latency: float):
+    health = registry.get(name)
+    for _ in range(successes):
+        health.record_success(latency)
+    for _ in range(failures):
+        health.record_failure(latency)
+
+
+def test_preferred_first_when_healthy():
+    """Все здоровы - первым идет выбранный пользователем"""
+    registry = ProviderHealthRegistry()
+    record(registry, 'friendli', 10, 0, 3.0)
+    record(registry, 'openrouter', 10, 0, 2.0)
+    assert registry.route('friendli', ORDER)[0] == 'friendli'
+
+
+def test_degraded_closed_ranks_below_healthy():
+    """Деградировавший, но с замкнутым автоматом провайдер уступает здоровому"""
+    registry = ProviderHealthRegistry()
+    record(registry, 'friendli', 7, 3, 6.0)
+    record(registry, 'openrouter', 10, 0, 2.0)
+
+    assert registry.get('friendli').state == ProviderHealth.CLOSED
+    route = registry.route('friendli', ORDER)
+    assert route.index('openrouter') < route.index('friendli')
+
+
+def test_open_and_demoted_go_last():
+    """Разомкнутый автомат - после замкнутых, только что упавший - в самом конце"""
+    registry = ProviderHealthRegistry()
+    record(registry, 'friendli', 0, 10, 1.0)
+    assert registry.get('friendli').state == ProviderHealth.OPEN
+
+    assert registry.route('friendli', ORDER) == ['openrouter', 'free', 'friendli']
+    assert registry.route('openrouter', ORDER, demoted=['openrouter']) == ['free', 'friendli', 'openrouter']
+
+
+if __name__ == "__main__":
+    test_preferred_first_when_healthy()
+    test_degraded_closed_ranks_below_healthy()
+    test_open_and_demoted_go_last()
+    print("✅ Все проверки маршрутизации провайдеров пройдены")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Проверка асинхронного клиента Replicate на локальной заглушке API (сеть и токен не нужны)"""
+import asyncio
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+from http_pool import HttpPool
+from replicate_client import ReplicateClient, ReplicateWebhookServer
+
+API_PORT = 8765
+WEBHOOK_PORT = 8766
+GENERATION_TIME = 2.0  # Сколько "генерируется" одно изображение
+
+
+class FakeReplicate:
+    """Заглушка Replicate API: предсказание готово через GENERATION_TIME секунд"""
+
+    def __init__(self):
+        self.predictions = {}
+
+    def _base(self, request: web.Request) -> str:
+        return f"http://{request.host}"
+
+    async def create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        prediction_id = uuid.uuid4().hex
+        prediction = {'id': prediction_id, 'status': 'starting', 'output': None}
+        self.predictions[prediction_id] = prediction
+        asyncio.create_task(self._finish(prediction, self._base(request), body.get('webhook')))
+        return web.json_response(prediction, status=201)
+
+    async def _finish(self, prediction: dict, base: str, webhook: str):
+        await asyncio.sleep(GENERATION_TIME)
+        prediction['status'] = 'succeeded'
+        prediction['output'] = [f"{base}/files/{prediction['id']}.png"]
+        if webhook:
+            async with aiohttp.ClientSession() as session:
+                await session.post(webhook, json=prediction)
+
+    async def get(self, request: web.Request) -> web.Response:
+        prediction = self.predictions.get(request.match_info['prediction_id'])
+        if not prediction:
+            return web.Response(status=404)
+        return web.json_response(prediction)
+
+    async def file(self, request: web.Request) -> web.Response:
+        return web.Response(body=b"\x89PNG fake image")
+
+
+async def run_batch(client: ReplicateClient, count: int) -> float:
+    """Запуск count генераций одновременно, возвращает общее время"""
+    started = time.perf_counter()
+    results = await asyncio.gather(*[client.run("fake-version", {"prompt": f"кот {i}"}) for i in range(count)])
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for result in results if result)
+    print(f"   ✅ Готово {ok}/{count} за {elapsed:.1f} с, статистика: {client.get_stats()}")
+    return elapsed
+
+
+async def main(count: int = 50):
+    fake = FakeReplicate()
+    app = web.Application()
+    app.router.add_post('/v1/predictions', fake.create)
+    app.router.add_get('/v1/predictions/{prediction_id}', fake.get)
+    app.router.add_get('/files/{name}', fake.file)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', API_PORT).start()
+
+    pool = HttpPool()
+    base_url = f"http://127.0.0.1:{API_PORT}/v1"
+
+    print(f"🔁 Опрос с паузами: {count} изображений одновременно")
+    polling = ReplicateClient("test-token", http_pool=pool, base_url=base_url)
+    polling.webhook_url = None  # Опрос, даже если в окружении задан REPLICATE_WEBHOOK_URL
+    await run_batch(polling, count)
+
+    print(f"📬 Webhook: {count} изображений одновременно")
+    webhook = ReplicateClient("test-token", http_pool=pool, base_url=base_url,
+                              webhook_url=f"http://127.0.0.1:{WEBHOOK_PORT}/replicate/webhook",
+                              webhook_secret="local-secret")
+    server = ReplicateWebhookServer(webhook, host='127.0.0.1', port=WEBHOOK_PORT)
+    await server.start()
+
+    # Цикл событий должен оставаться свободным, пока изображения "генерируются"
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.1)
+            ticks += 1
+
+    beat = asyncio.create_task(heartbeat())
+    elapsed = await run_batch(webhook, count)
+    beat.cancel()
+    print(f"   💓 Цикл событий отзывался {ticks} раз за {elapsed:.1f} с (ожидалось ~{int(elapsed * 10)})")
+
+    await server.stop()
+    await pool.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Проверки политики повторов (запуск: python test_retry_policy.py или pytest)"""
+import asyncio
+import time
+
+from provider_result import ErrorKind, ProviderResult
+from retry_policy import RetryBudget, RetryPolicy
+
+
+def make_policy(deadline: float) -> RetryPolicy:
+    # Наша пауза не больше 10 мс - Retry-After заметно длиннее ее
+    return RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.01, deadline=deadline,
+                       budget=RetryBudget(ratio=1.0))
+
+
+def rate_limited(retry_after: float) -> ProviderResult:
+    return ProviderResult.failure(ErrorKind.RATE_LIMIT, "429", status=429, retry_after=retry_after)
+
+
+async def check_waits_full_retry_after():
+    """Повтор не раньше, чем разрешил Retry-After, даже если он больше нашей максимальной паузы"""
+    calls = []
+
+    async def call():
+        calls.append(time.monotonic())
+        return rate_limited(0.3) if len(calls) == 1 else ProviderResult.success("ок")
+
+    result = await make_policy(deadline=5).run(call)
+    assert result.ok
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+
+
+async def check_no_retry_past_deadline():
+    """Retry-After дальше дедлайна - отдаем ответ 429 сразу, без повтора"""
+    calls = []
+
+    async def call():
+        calls.append(time.monotonic())
+        return rate_limited(10)
+
+    started = time.monotonic()
+    result = await make_policy(deadline=1).run(call)
+    assert result.status == 429
+    assert len(calls) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_waits_full_retry_after():
+    asyncio.run(check_waits_full_retry_after())
+
+
+def test_no_retry_past_deadline():
+    asyncio.run(check_no_retry_past_deadline())
+
+
+if __name__ == "__main__":
+    test_waits_full_retry_after()
+    test_no_retry_past_deadline()
+    print("✅ Все проверки политики повторов пройдены")
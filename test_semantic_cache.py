@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Проверки кэша похожих вопросов (запуск: python test_semantic_cache.py или pytest)"""
+import asyncio
+
+from provider_result import ProviderResult
+from semantic_cache import SemanticCache
+
+GROUP = ('deepseek', 'chat')
+
+# Почти одинаковые запросы, которым нужны разные ответы
+DIFFERENT_ANSWERS = [
+    ("вычисли факториал числа 10", "вычисли факториал числа 12"),
+    ("напиши функцию сортировки на python", "напиши функцию сортировки на java"),
+    ("я люблю кошек", "я не люблю кошек"),
+]
+
+
+async def check_exact_repeat_after_unrelated_entries():
+    """Точный повтор находится и после сотен других записей с общими словами.
+
+    Раньше IDF менялся с каждой записью, и сохраненный вектор расходился с вектором повтора;
+    теперь он замораживается после прогрева (здесь - на 500-й записи).
+    """
+    cache = SemanticCache(max_entries=1000, threshold=0.95, ttl=3600)
+    prompt = "напиши функцию сортировки пузырьком на python"
+    await cache.add(GROUP, prompt, ProviderResult.success("def bubble_sort(items): ..."))
+
+    for i in range(500):
+        await cache.add(GROUP, f"напиши функцию на python номер {i}", ProviderResult.success(str(i)))
+
+    hit = await cache.lookup(GROUP, prompt)
+    cache.close()
+    assert cache.get_stats()['idf_frozen']
+    assert hit is not None, "точный повтор не найден"
+    assert hit.content == "def bubble_sort(items): ..."
+    assert hit.cache_hit
+
+
+async def check_other_group_misses():
+    """Ответы из чужой группы не возвращаются"""
+    cache = SemanticCache(max_entries=10, threshold=0.9, ttl=3600)
+    await cache.add(GROUP, "что такое рекурсия", ProviderResult.success("ответ"))
+    hit = await cache.lookup(('deepseek', 'solve'), "что такое рекурсия")
+    cache.close()
+    assert hit is None
+
+
+async def check_different_answers_miss(warmup: int, frozen: bool):
+    """Запросы, отличающиеся числом, языком или отрицанием, не получают чужой ответ"""
+    cache = SemanticCache(max_entries=1000, ttl=3600, idf_warmup=warmup)
+    for i in range(warmup if frozen else 10):
+        await cache.add(('deepseek', 'search'), f"что такое рекурсия и стек вызовов номер {i}", ProviderResult.success(str(i)))
+
+    for stored, asked in DIFFERENT_ANSWERS:
+        await cache.add(GROUP, stored, ProviderResult.success(f"ответ на: {stored}"))
+    misses = [asked for _, asked in DIFFERENT_ANSWERS if await cache.lookup(GROUP, asked) is None]
+    repeat = await cache.lookup(GROUP, "Я люблю  кошек")
+    cache.close()
+
+    assert cache.get_stats()['idf_frozen'] == frozen
+    assert misses == [asked for _, asked in DIFFERENT_ANSWERS], misses
+    assert repeat is not None and repeat.content == "ответ на: я люблю кошек"
+
+
+def test_default_intents():
+    """По умолчанию похожие ответы только для чата и поиска"""
+    cache = SemanticCache(max_entries=1)
+    cache.close()
+    assert cache.is_enabled('chat') and cache.is_enabled('search')
+    assert not cache.is_enabled('code') and not cache.is_enabled('solve')
+
+
+def test_different_answers_miss_before_idf_frozen():
+    asyncio.run(check_different_answers_miss(warmup=500, frozen=False))
+
+
+def test_different_answers_miss_with_frozen_idf():
+    asyncio.run(check_different_answers_miss(warmup=50, frozen=True))
+
+
+def test_exact_repeat_after_unrelated_entries():
+    asyncio.run(check_exact_repeat_after_unrelated_entries())
+
+
+def test_other_group_misses():
+    asyncio.run(check_other_group_misses())
+
+
+if __name__ == "__main__":
+    test_exact_repeat_after_unrelated_entries()
+    test_other_group_misses()
+    test_default_intents()
+    test_different_answers_miss_before_idf_frozen()
+    test_different_answers_miss_with_frozen_idf()
+    print("✅ Все проверки кэша похожих вопросов пройдены")
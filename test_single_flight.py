@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Проверки склейки одинаковых запросов (запуск: python test_single_flight.py или pytest)"""
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def make_provider(delay: float = 0.05):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return "ответ"
+
+    return call, calls
+
+
+async def check_leader_cancel_keeps_followers():
+    """Отмена первого вызова не отменяет запрос для остальных, провайдер вызывается один раз"""
+    flight = SingleFlight()
+    call, calls = make_provider()
+
+    leader = asyncio.create_task(flight.run('ключ', call))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(flight.run('ключ', call)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    results = await asyncio.gather(*followers)
+    await asyncio.gather(leader, return_exceptions=True)
+
+    assert leader.cancelled()
+    assert results == ["ответ"] * 3
+    assert len(calls) == 1
+    assert flight.get_stats() == {'in_flight': 0, 'started': 1, 'coalesced': 3, 'cancelled': 0}
+
+
+async def check_last_waiter_cancels_request():
+    """Ушли все ждущие - запрос отменяется, следующий вызов идет к провайдеру заново"""
+    flight = SingleFlight()
+    call, calls = make_provider()
+
+    waiters = [asyncio.create_task(flight.run('ключ', call)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert flight.get_stats()['cancelled'] == 1
+    assert flight.get_stats()['in_flight'] == 0
+    assert await flight.run('ключ', call) == "ответ"
+    assert len(calls) == 2
+
+
+def test_leader_cancel_keeps_followers():
+    asyncio.run(check_leader_cancel_keeps_followers())
+
+
+def test_last_waiter_cancels_request():
+    asyncio.run(check_last_waiter_cancels_request())
+
+
+if __name__ == "__main__":
+    test_leader_cancel_keeps_followers()
+    test_last_waiter_cancels_request()
+    print("✅ Все проверки склейки запросов пройдены")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Проверки фонового сжатия диалогов (запуск: python test_summarizer.py или pytest)"""
+import asyncio
+import os
+import tempfile
+
+from history_sqlite import SqliteColdTier
+from history_store import HistoryStore
+from provider_result import ErrorKind, ProviderResult
+from summarizer import ConversationSummarizer
+
+
+def make_store(path: str) -> HistoryStore:
+    return HistoryStore(max_turns=20, cold_tier=SqliteColdTier(path, flush_interval=0))
+
+
+async def fill(store: HistoryStore, user_id: int, count: int):
+    for i in range(count):
+        await store.append(user_id, {"role": "user", "content": f"реплика {i}"})
+
+
+async def check_summary_survives_restart():
+    """Сжатые реплики убираются из истории, а сводка переживает перезапуск вместе с остальными"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        store = make_store(path)
+        await store.start()
+
+        async def summarize(prompt):
+            return ProviderResult.success("пользователь пишет нумерованные реплики")
+
+        summarizer = ConversationSummarizer(summarize, store, trigger_turns=8, keep_turns=4)
+        await fill(store, 1, 8)
+        summarizer.schedule(1, await store.get(1))
+        await asyncio.gather(*summarizer.tasks.values())
+        assert len(await store.get(1)) == 4
+        await store.close()
+
+        store = make_store(path)
+        await store.start()
+        assert await ConversationSummarizer(summarize, store).get(1) == "пользователь пишет нумерованные реплики"
+        assert [turn['content'] for turn in await store.get(1)] == [f"реплика {i}" for i in range(4, 8)]
+        await store.close()
+
+
+async def check_backoff_after_failure():
+    """После неудачного сжатия следующая попытка откладывается, история не трогается"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(os.path.join(tmp, 'history.db'))
+        await store.start()
+        try:
+            await run_failing_summary(store)
+        finally:
+            await store.close()
+
+
+async def run_failing_summary(store: HistoryStore):
+    calls = []
+
+    async def summarize(prompt):
+        calls.append(prompt)
+        return ProviderResult.failure(ErrorKind.SERVER, "недоступно", status=503)
+
+    summarizer = ConversationSummarizer(summarize, store, trigger_turns=8, keep_turns=4, retry_after=60)
+    await fill(store, 1, 8)
+    summarizer.schedule(1, await store.get(1))
+    await asyncio.gather(*summarizer.tasks.values())
+
+    summarizer.schedule(1, await store.get(1))
+    assert not summarizer.tasks
+    assert len(calls) == 1
+    assert summarizer.get_stats()['skipped_backoff'] == 1
+    assert len(await store.get(1)) == 8
+
+
+async def check_restart_keeps_new_task():
+    """Отмененное по /start сжатие не снимает запущенное после него, эпохи не растут без предела"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(os.path.join(tmp, 'history.db'))
+        await store.start()
+        release = asyncio.Event()
+
+        async def summarize(prompt):
+            await release.wait()
+            return ProviderResult.success("сводка")
+
+        summarizer = ConversationSummarizer(summarize, store, trigger_turns=8, keep_turns=4, max_users=2)
+        await fill(store, 1, 8)
+        turns = await store.get(1)
+        summarizer.schedule(1, turns)
+        old = summarizer.tasks[1]
+        await asyncio.sleep(0)
+
+        summarizer.invalidate(1)
+        summarizer.schedule(1, turns)
+        new = summarizer.tasks[1]
+        await asyncio.gather(old, return_exceptions=True)
+        assert summarizer.tasks.get(1) is new
+
+        release.set()
+        await new
+        assert not summarizer.tasks
+        assert await summarizer.get(1) == "сводка"
+
+        for user_id in range(2, 6):
+            summarizer.invalidate(user_id)
+        assert list(summarizer.epochs) == [4, 5]
+        await store.close()
+
+
+def test_summary_survives_restart():
+    asyncio.run(check_summary_survives_restart())
+
+
+def test_backoff_after_failure():
+    asyncio.run(check_backoff_after_failure())
+
+
+def test_restart_keeps_new_task():
+    asyncio.run(check_restart_keeps_new_task())
+
+
+if __name__ == "__main__":
+    test_summary_survives_restart()
+    test_backoff_after_failure()
+    test_restart_keeps_new_task()
+    print("✅ Все проверки сжатия диалогов пройдены")